@@ -0,0 +1,192 @@
+"""Writes saves on a background thread so saving never stalls a frame."""
+import os
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence, Tuple
+from save_state import snapshot, write_snapshot, JOURNAL_SUFFIX
+
+@dataclass
+class Autosave:
+    """
+    Saves the game to a rotating set of slot files every interval seconds of play.
+    The game state is copied on the caller's thread, which is cheap, and a worker
+    thread does the slow part: packing the copy and writing it with an atomic rename.
+    At most pending saves wait at once; a save requested while the writer is that
+    far behind is dropped rather than letting copies pile up. Saves record bounds, the
+    size of the world, when it is set. Other writers, such as
+    a save_state.Journal, can queue their own jobs to run in order with the saves.
+    """
+    path: str
+    interval: float = 60
+    slots: int = 3
+    pending: int = 2
+    elapsed: float = 0
+    slot: int = 0
+    error: Optional[BaseException] = None
+    bounds: Optional[Tuple[int, int]] = None
+    jobs: "queue.Queue[Optional[Callable[[], None]]]" = field(init=False, repr=False)
+    worker: Optional[threading.Thread] = field(init=False, default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        self.jobs = queue.Queue(self.pending)
+
+
+    def slot_path(self, slot: int) -> str:
+        """
+        Purpose: Names the file for one autosave slot, next to path.
+
+        Examples:
+            Autosave("savegame.bin").slot_path(1) -> "savegame.auto1.bin"
+        """
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.auto{slot}{ext}"
+
+
+    def slot_paths(self) -> List[str]:
+        """
+        Purpose: Lists the slot files that exist, newest first.
+
+        Examples:
+            autosave.slot_paths() -> ["savegame.auto0.bin"] after one autosave
+        """
+        existing = [p for p in map(self.slot_path, range(self.slots)) if os.path.exists(p)]
+        return sorted(existing, key=os.path.getmtime, reverse=True)
+
+
+    def newest(self, *paths: str) -> Optional[str]:
+        """
+        Purpose: Returns whichever of paths and the slot files was written last, or
+        None if none exist. A journal appended to a save counts as writing it.
+
+        Examples:
+            autosave.newest("savegame.bin") -> "savegame.auto0.bin" if that autosave is newer
+            Autosave("missing.bin").newest("missing.bin") -> None
+        """
+        def written(path: str) -> float:
+            return max(os.path.getmtime(p) for p in (path, path + JOURNAL_SUFFIX) if os.path.exists(p))
+        existing = [p for p in list(paths) + self.slot_paths() if os.path.exists(p)]
+        return max(existing, key=written) if existing else None
+
+
+    def take_error(self) -> Optional[BaseException]:
+        """
+        Purpose: Returns the error from the last failed write, if any, and clears it,
+        so a failure is reported once.
+
+        Examples:
+            autosave.take_error() -> OSError(...) after a write to a missing directory
+            autosave.take_error() -> None
+        """
+        error, self.error = self.error, None
+        return error
+
+
+    def save(self, filepath: str, player, opponent, food_list, rivals: Sequence = ()) -> bool:
+        """
+        Purpose: Snapshots the game now and queues it to be written to filepath.
+        Returns False, without copying anything, if the writer is too far behind.
+
+        Examples:
+            autosave.save("savegame.bin", player, opponent, food_list) -> True
+        """
+        if self.busy():
+            return False
+        state = snapshot(player, opponent, food_list, self.bounds, rivals)
+        return self.queue(lambda: write_snapshot(filepath, state))
+
+
+    def busy(self) -> bool:
+        """
+        Purpose: Checks whether pending jobs are already waiting, so a new save would be dropped.
+
+        Examples:
+            Autosave("savegame.bin").busy() -> False
+        """
+        return self.jobs.full()
+
+
+    def queue(self, job: Callable[[], None], wait: bool = False) -> bool:
+        """
+        Purpose: Queues job to run on the worker after every job queued before it.
+        Returns False, dropping job, if the worker is busy, unless wait is set, in
+        which case it blocks until there is room.
+
+        Examples:
+            autosave.queue(lambda: write_snapshot("savegame.bin", state)) -> True
+        """
+        if not wait and self.busy():
+            return False
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.write_jobs, name="autosave", daemon=True)
+            self.worker.start()
+        self.jobs.put(job)
+        return True
+
+
+    def due(self, deltaT: float) -> bool:
+        """
+        Purpose: Counts deltaT seconds of play. Returns True, and starts counting
+        again, once interval have passed.
+
+        Examples:
+            autosave = Autosave("savegame.bin", interval=1)
+            autosave.due(0.5) -> False
+            autosave.due(0.5) -> True
+        """
+        self.elapsed += deltaT
+        if self.elapsed < self.interval:
+            return False
+        self.elapsed = 0
+        return True
+
+
+    def tick(self, deltaT: float, player, opponent, food_list, rivals: Sequence = ()) -> bool:
+        """
+        Purpose: Counts deltaT seconds of play and, once interval have passed, saves
+        to the next slot, overwriting the oldest once all slots are used. Returns
+        whether a save was queued.
+
+        Examples:
+            autosave = Autosave("savegame.bin", interval=1)
+            autosave.tick(0.5, player, opponent, food_list) -> False
+            autosave.tick(0.5, player, opponent, food_list) -> True (to savegame.auto0.bin)
+        """
+        if not self.due(deltaT):
+            return False
+        if not self.save(self.slot_path(self.slot), player, opponent, food_list, rivals):
+            return False
+        self.slot = (self.slot + 1) % self.slots
+        return True
+
+
+    def write_jobs(self) -> None:
+        """
+        Worker loop: run queued jobs until the None sentinel arrives. A job that fails
+        for any reason is reported like a failed save and the loop carries on, so
+        flush and close never wait on a dead worker.
+        """
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                job()
+            except Exception as e:
+                self.error = e
+            finally:
+                self.jobs.task_done()
+
+
+    def flush(self) -> None:
+        """Block until every queued job has run."""
+        if self.worker is not None:
+            self.jobs.join()
+
+
+    def close(self) -> None:
+        """Finish the queued saves and stop the worker."""
+        if self.worker is not None:
+            self.jobs.put(None)
+            self.worker.join()
+            self.worker = None
@@ -0,0 +1,78 @@
+"""Runs many headless matches in parallel, for tuning the opponent."""
+import itertools
+import os
+from dataclasses import dataclass
+import multiprocessing
+from typing import Iterable, List, Optional
+from simulation import new_simulation, chase_nearest_food
+
+@dataclass
+class MatchConfig:
+    """The settings of one headless match."""
+    seed: int
+    food: int = 100
+    opponent_speed: float = 150
+    max_steps: int = 100000
+
+
+@dataclass
+class MatchResult:
+    """How one headless match ended."""
+    config: MatchConfig
+    winner: Optional[str]
+    player_count: int
+    opponent_count: int
+    steps: int
+
+
+def play_match(config: MatchConfig) -> MatchResult:
+    """
+    Purpose: Plays one match against chase_nearest_food. The food is spawned and
+    drifted from config.seed alone, so the same config always gives the same result
+    no matter which process plays it.
+
+    Examples:
+        play_match(MatchConfig(seed=1, food=10)) == play_match(MatchConfig(seed=1, food=10)) -> True
+    """
+    sim = new_simulation(config.food, opponent_speed=config.opponent_speed, seed=config.seed)
+    winner = sim.run(chase_nearest_food, max_steps=config.max_steps)
+    return MatchResult(config, winner, sim.player.count, sim.opponent.count, sim.steps)
+
+
+def match_grid(seeds: Iterable[int], foods: Iterable[int] = (100,),
+               opponent_speeds: Iterable[float] = (150,)) -> List[MatchConfig]:
+    """
+    Purpose: Builds one MatchConfig for every combination of seed, food count and
+    opponent speed.
+
+    Examples:
+        match_grid([1, 2], [10], [100, 150]) -> 4 configs, seed 1 at speed 100 first
+    """
+    return [MatchConfig(seed, food, speed) for seed, food, speed in itertools.product(seeds, foods, opponent_speeds)]
+
+
+def run_batch(configs: List[MatchConfig], processes: Optional[int] = None) -> List[MatchResult]:
+    """
+    Purpose: Plays every match across a pool of processes (one per core by default)
+    and returns the results in the same order as configs.
+
+    Examples:
+        run_batch(match_grid([1, 2], [10])) -> [MatchResult(seed 1, ...), MatchResult(seed 2, ...)]
+    """
+    if not configs:
+        return []
+    processes = processes or os.cpu_count() or 1
+    # A few chunks per process keeps every core busy while matches differ in length.
+    chunksize = max(1, len(configs) // (4 * processes))
+    # Forked workers can deadlock on state copied from an initialised pygame display,
+    # so workers always start fresh and import only what play_match needs.
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        return pool.map(play_match, configs, chunksize)
+
+
+if __name__ == "__main__":
+    results = run_batch(match_grid(range(8), [50, 100], [100, 150, 200]))
+    print(f"{'Seed':<6} {'Food':<6} {'Speed':<7} {'Winner':<10} {'Player':<8} {'Opponent':<10} {'Steps':<8}")
+    for r in results:
+        c = r.config
+        print(f"{c.seed:<6} {c.food:<6} {c.opponent_speed:<7} {str(r.winner):<10} {r.player_count:<8} {r.opponent_count:<10} {r.steps:<8}")
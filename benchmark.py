@@ -0,0 +1,352 @@
+"""Timing benchmarks for the game's hot paths."""
+import copy
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import density
+from food import Food, FoodList, FoodStore
+from opponent import Opponent
+from rng import FoodRandom
+import strategy
+from profiler import FrameProfiler
+from simulation import new_simulation, chase_nearest_food
+from swarm import BatchMover, move_each
+
+FRAME_BUDGET = 1 / 60
+
+# The pairwise scan is O(n^2) in pure Python, so only time it on small arenas.
+PAIRWISE_LIMIT = 2000
+
+# Food counts the game loop suite runs at, and roughly how many food-steps each size
+# gets, so small arenas run many steps and the 1M arena only a few.
+GAME_SIZES = (100, 1000, 10000, 100000, 1000000)
+GAME_WORK = 3_000_000
+STEP_PHASES = ("opponent", "eat", "move")
+
+# Swarm sizes the mover benchmark compares the scalar and batched paths at.
+MOVER_SIZES = (10, 100, 1000, 10000)
+
+# run.main spreads 100 food over a 1280x720 screen.
+BASE_FOOD = 100
+BASE_BOUNDS = (1280, 720)
+
+def scaled_bounds(amount: int) -> Tuple[int, int]:
+    """
+    Purpose: Finds arena bounds with the same aspect ratio and food density as the
+    default game, so that larger food counts mean a larger world.
+
+    Examples:
+        scaled_bounds(100) -> (1280, 720)
+        scaled_bounds(400) -> (2560, 1440)
+    """
+    scale = math.sqrt(amount / BASE_FOOD)
+    return (round(BASE_BOUNDS[0] * scale), round(BASE_BOUNDS[1] * scale))
+
+
+def generate_food(amount: int, bounds: Tuple[int, int], seed: int = 0) -> FoodStore:
+    """Generate a FoodStore of size-10 food spread randomly over bounds, the same for the same seed."""
+    x, y = FoodRandom(seed).spawn(amount, bounds)
+    store = FoodStore()
+    store.extend_arrays(x, y, np.full(amount, 10, dtype=np.float64))
+    return store
+
+
+def pairwise_bonus(store: FoodStore) -> List[float]:
+    """The cluster bonus as the opponent used to compute it, one pair at a time."""
+    foods = list(store)
+    bonus = []
+    for f in foods:
+        cluster_bonus = 0
+        for other in foods:
+            if other != f:
+                d = ((f.x - other.x)**2 + (f.y - other.y)**2)**0.5
+                if d < 100:
+                    cluster_bonus += (100 - d) * 0.1
+        bonus.append(cluster_bonus)
+    return bonus
+
+
+def time_cluster_bonus(store: FoodStore) -> float:
+    """Time how long density.cluster_bonus takes. Returns seconds."""
+    start = time.perf_counter()
+    density.cluster_bonus(store.x, store.y, store.size)
+    end = time.perf_counter()
+    return end - start
+
+
+def time_find_best_food(store: FoodStore, bounds: Tuple[int, int]) -> float:
+    """Time one retarget by an Opponent in the middle of an indexed arena. Returns seconds."""
+    food_list = FoodList(store)
+    food_list.index()
+    opponent = Opponent(x=bounds[0] / 2, y=bounds[1] / 2, size=40, speed=150, color="green")
+    start = time.perf_counter()
+    opponent.find_best_food(food_list, (bounds[0] / 4, bounds[1] / 2))
+    end = time.perf_counter()
+    return end - start
+
+
+def time_cluster_sync(store: FoodStore, bounds: Tuple[int, int], tolerance: float,
+                      frames: int = 30) -> float:
+    """Time the average ClusterField sync after one frame of drift. Returns seconds."""
+    food_list = FoodList(store, rng=FoodRandom(0))
+    food_list.track_clusters(tolerance)
+    total = 0
+    for i in range(frames):
+        food_list.move(bounds)
+        start = time.perf_counter()
+        food_list.clusters.sync(store.x, store.y, store.size)
+        total += time.perf_counter() - start
+    return total / frames
+
+
+def time_drifting_retarget(store: FoodStore, bounds: Tuple[int, int], field: bool,
+                           frames: int = 30) -> float:
+    """Time the average retarget over frames of drift, with or without a ClusterField. Returns seconds."""
+    food_list = FoodList(store, rng=FoodRandom(0))
+    food_list.index()
+    if field:
+        food_list.track_clusters(density.CLUSTER_TOLERANCE)
+    opponent = Opponent(x=bounds[0] / 2, y=bounds[1] / 2, size=40, speed=150, color="green")
+    total = 0
+    for i in range(frames):
+        food_list.move(bounds)
+        start = time.perf_counter()
+        strategy.pick_cluster(opponent, food_list, (bounds[0] / 4, bounds[1] / 2))
+        total += time.perf_counter() - start
+    return total / frames
+
+
+def time_pairwise_bonus(store: FoodStore) -> float:
+    """Time how long the pairwise scan takes. Returns seconds."""
+    start = time.perf_counter()
+    pairwise_bonus(store)
+    end = time.perf_counter()
+    return end - start
+
+
+def run_cluster_benchmark(sizes: Sequence[int] = (1000, 10000, 50000)) -> None:
+    """Compare opponent retargeting, the full grid cluster bonus and the pairwise scan."""
+    print("Timing: Opponent Retarget vs Grid Cluster Bonus vs Pairwise Scan")
+    print("(arena scaled to keep the default food density)")
+    print(f"{'Size':<10} {'Arena':<14} {'Retarget (ms)':<15} {'Grid (ms)':<12} {'Pairwise (ms)':<15} {'In budget':<10}")
+
+    for size in sizes:
+        bounds = scaled_bounds(size)
+        store = generate_food(size, bounds)
+        retarget_time = time_find_best_food(store, bounds)
+        grid_time = time_cluster_bonus(store)
+        if size <= PAIRWISE_LIMIT:
+            pairwise = f"{time_pairwise_bonus(store) * 1000:.1f}"
+        else:
+            pairwise = "-"
+        arena = f"{bounds[0]}x{bounds[1]}"
+        in_budget = "yes" if retarget_time <= FRAME_BUDGET else "no"
+        print(f"{size:<10} {arena:<14} {retarget_time * 1000:<15.2f} {grid_time * 1000:<12.2f} {pairwise:<15} {in_budget:<10}")
+
+    print(f"Frame budget: {FRAME_BUDGET * 1000:.1f} ms. Grid: O(n * neighbours), Pairwise: O(n^2)")
+    print("Retarget only scores food that can still beat the best distance score.")
+
+
+def run_cluster_field_benchmark(sizes: Sequence[int] = (1000, 10000, 50000)) -> None:
+    """Compare rescoring every cluster bonus against syncing a ClusterField each frame."""
+    print("Timing: Full Cluster Bonus vs Per-Frame ClusterField Sync, and Drifting Retargets")
+    print(f"{'Size':<10} {'Full (ms)':<12} {'Sync exact (ms)':<17} {f'Sync tol={density.CLUSTER_TOLERANCE} (ms)':<18} "
+          f"{'Retarget grid (ms)':<20} {'Retarget field (ms)':<20}")
+
+    for size in sizes:
+        bounds = scaled_bounds(size)
+        store = generate_food(size, bounds)
+        full_time = time_cluster_bonus(store)
+        exact_time = time_cluster_sync(generate_food(size, bounds), bounds, 0)
+        tolerant_time = time_cluster_sync(generate_food(size, bounds), bounds, density.CLUSTER_TOLERANCE)
+        grid_time = time_drifting_retarget(generate_food(size, bounds), bounds, False)
+        field_time = time_drifting_retarget(generate_food(size, bounds), bounds, True)
+        print(f"{size:<10} {full_time * 1000:<12.2f} {exact_time * 1000:<17.2f} {tolerant_time * 1000:<18.2f} "
+              f"{grid_time * 1000:<20.2f} {field_time * 1000:<20.2f}")
+
+    print("Exact sync re-scores all drifted food; with a tolerance only food that drifted further.")
+    print("Drift moves most food past the tolerance within a few frames, so a single opponent")
+    print("retargets faster by scoring its few candidates on the grid than by syncing a field.")
+
+
+def game_steps(amount: int) -> int:
+    """
+    Purpose: Chooses how many steps to time at a food count: enough for stable
+    percentiles on small arenas without spending minutes on large ones.
+
+    Examples:
+        game_steps(100) -> 300
+        game_steps(1000000) -> 5
+    """
+    return max(5, min(300, GAME_WORK // amount))
+
+
+def measure_memory(amount: int, seed: int = 0) -> Tuple[float, float]:
+    """Build a scaled arena and step it once under tracemalloc. Returns (held, peak) in MB."""
+    tracemalloc.start()
+    sim = new_simulation(amount, scaled_bounds(amount), seed=seed)
+    sim.step(chase_nearest_food(sim))
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return held / 2**20, peak / 2**20
+
+
+def benchmark_game_loop(amount: int, steps: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Purpose: Steps a seeded headless match in an arena scaled to amount food, with
+    chase_nearest_food playing, and reports the step rate, memory use and the
+    time spent in each phase of a step.
+
+    Examples:
+        benchmark_game_loop(100, 10)["steps_per_second"] -> e.g. 2000.0
+        benchmark_game_loop(100, 10)["phases"]["eat"] -> {"mean": ..., "p50": ..., "p95": ..., "p99": ...} in ms
+    """
+    bounds = scaled_bounds(amount)
+    sim = new_simulation(amount, bounds, seed=seed)
+    sim.profiler = FrameProfiler(capacity=steps)
+    start = time.perf_counter()
+    for i in range(steps):
+        sim.profiler.begin_frame(len(sim.food_list.food))
+        sim.step(chase_nearest_food(sim))
+    elapsed = time.perf_counter() - start
+    held, peak = measure_memory(amount, seed)
+    times = sim.profiler.recent() / 1e6
+    phases = {}
+    for phase in STEP_PHASES:
+        column = times[:, sim.profiler.columns[phase]]
+        p50, p95, p99 = np.percentile(column, [50, 95, 99])
+        phases[phase] = {"mean": float(column.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+    return {
+        "food": amount,
+        "bounds": list(bounds),
+        "steps": steps,
+        "steps_per_second": steps / elapsed,
+        "step_ms": elapsed / steps * 1000,
+        "memory_mb": held,
+        "peak_memory_mb": peak,
+        "phases": phases,
+    }
+
+
+def run_game_loop_benchmark(sizes: Sequence[int] = GAME_SIZES, json_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Time the headless game loop at each size, print a table and optionally write the results as JSON."""
+    print("Timing: Headless Game Loop (arena scaled to keep the default food density)")
+    print(f"{'Size':<10} {'Steps/s':<10} {'Step (ms)':<11} {'Memory (MB)':<13} "
+          + " ".join(f"{phase + ' p95':<13}" for phase in STEP_PHASES))
+    results = []
+    for size in sizes:
+        result = benchmark_game_loop(size, game_steps(size))
+        results.append(result)
+        print(f"{size:<10} {result['steps_per_second']:<10.1f} {result['step_ms']:<11.2f} {result['memory_mb']:<13.1f} "
+              + " ".join(f"{result['phases'][phase]['p95']:<13.3f}" for phase in STEP_PHASES))
+    if json_path:
+        report = {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "results": results,
+        }
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Results written to {json_path}")
+    return results
+
+
+def compare_game_loop(old_path: str, new_path: str, threshold: float = 0.1) -> List[str]:
+    """
+    Purpose: Compares two JSON results of run_game_loop_benchmark and lists every
+    size and phase whose mean time grew by more than threshold (10% by default).
+
+    Examples:
+        compare_game_loop("before.json", "after.json") -> ["10000 opponent: 4.07 -> 5.12 ms (+26%)"]
+    """
+    with open(old_path) as f:
+        old = {r["food"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {r["food"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for size in sorted(old.keys() & new.keys()):
+        for phase in STEP_PHASES:
+            before = old[size]["phases"][phase]["mean"]
+            after = new[size]["phases"][phase]["mean"]
+            if before > 0 and after > before * (1 + threshold):
+                regressions.append(f"{size} {phase}: {before:.2f} -> {after:.2f} ms ({after / before - 1:+.0%})")
+    return regressions
+
+
+def benchmark_movers(count: int, ticks: int = 60, seed: int = 0) -> Dict[str, Any]:
+    """
+    Purpose: Moves count opponents towards fixed food for ticks steps, one at a time
+    and with a BatchMover (gathering and scattering every tick, as the game does),
+    and reports both times, the speedup and whether the positions matched exactly.
+
+    Examples:
+        benchmark_movers(100, 10) -> {"agents": 100, "scalar_ms": ..., "batched_ms": ..., "speedup": ..., "identical": True}
+    """
+    bounds = scaled_bounds(count)
+    store = generate_food(count, bounds, seed)
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(-1, count, count)
+    agents = [Opponent(x=float(x), y=float(y), size=int(size), speed=float(speed), color="green")
+              for x, y, size, speed in zip(rng.uniform(0, bounds[0], count), rng.uniform(0, bounds[1], count),
+                                           rng.integers(20, 60, count), rng.uniform(100, 300, count))]
+    batched = copy.deepcopy(agents)
+    targets = [store[row] if row >= 0 else None for row in rows.tolist()]
+
+    start = time.perf_counter()
+    for i in range(ticks):
+        move_each(agents, targets, 1 / 60, bounds)
+    scalar_time = time.perf_counter() - start
+
+    mover = BatchMover()
+    start = time.perf_counter()
+    for i in range(ticks):
+        mover.gather(batched)
+        mover.aim(store, rows)
+        mover.step(1 / 60, bounds)
+        mover.scatter(batched)
+    batched_time = time.perf_counter() - start
+
+    identical = all(a.x == b.x and a.y == b.y for a, b in zip(agents, batched))
+    return {
+        "agents": count,
+        "scalar_ms": scalar_time / ticks * 1000,
+        "batched_ms": batched_time / ticks * 1000,
+        "speedup": scalar_time / batched_time,
+        "identical": identical,
+    }
+
+
+def run_mover_benchmark(sizes: Sequence[int] = MOVER_SIZES) -> List[Dict[str, Any]]:
+    """Compare moving a swarm one opponent at a time against one BatchMover step per tick."""
+    print("Timing: Scalar Opponent Movement vs BatchMover, per tick")
+    print(f"{'Agents':<10} {'Scalar (ms)':<13} {'Batched (ms)':<14} {'Speedup':<9} {'Identical':<10}")
+    results = []
+    for size in sizes:
+        result = benchmark_movers(size)
+        results.append(result)
+        print(f"{size:<10} {result['scalar_ms']:<13.3f} {result['batched_ms']:<14.3f} "
+              f"{result['speedup']:<9.1f} {'yes' if result['identical'] else 'NO':<10}")
+    return results
+
+
+if __name__ == "__main__":
+    if "--compare" in sys.argv:
+        # python benchmark.py --compare before.json after.json
+        old_path, new_path = sys.argv[sys.argv.index("--compare") + 1:][:2]
+        print("\n".join(compare_game_loop(old_path, new_path)) or "No phase got more than 10% slower.")
+    elif "--movers" in sys.argv:
+        run_mover_benchmark()
+    elif "--game" in sys.argv:
+        # python benchmark.py --game [results.json]
+        args = sys.argv[sys.argv.index("--game") + 1:]
+        run_game_loop_benchmark(json_path=args[0] if args else None)
+    else:
+        run_cluster_benchmark([1000, 10000, 50000])
+        print()
+        run_cluster_field_benchmark([1000, 10000, 50000])
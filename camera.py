@@ -0,0 +1,83 @@
+"""A scrolling view onto a world larger than the screen."""
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+import numpy as np
+from sprite import Sprite
+from spatial_grid import SpatialGrid
+
+Point = Tuple[float, float]
+
+@dataclass
+class Camera:
+    """
+    The part of the world shown on screen: a view-sized rectangle whose top-left
+    corner is (x, y) in world coordinates, kept inside the world.
+    """
+    view: Tuple[int, int]
+    world: Tuple[int, int]
+    x: float = 0
+    y: float = 0
+
+    def scrolls(self) -> bool:
+        """
+        Purpose: Checks whether the world is bigger than the view along either axis.
+
+        Examples:
+            Camera((1280, 720), (1280, 720)).scrolls() -> False
+            Camera((1280, 720), (5000, 720)).scrolls() -> True
+        """
+        return self.world[0] > self.view[0] or self.world[1] > self.view[1]
+
+
+    def follow(self, target: Sprite) -> None:
+        """
+        Purpose: Centres the view on target, stopping at the edges of the world.
+
+        Examples:
+            camera = Camera((100, 100), (1000, 1000))
+            camera.follow(Player(x=500, y=30, ...)) -> camera.x, camera.y == 450, 0
+        """
+        self.x = min(max(target.x - self.view[0] / 2, 0), max(self.world[0] - self.view[0], 0))
+        self.y = min(max(target.y - self.view[1] / 2, 0), max(self.world[1] - self.view[1], 0))
+
+
+    def to_world(self, point: Point) -> Point:
+        """
+        Purpose: Converts a point on screen, such as the mouse, to world coordinates.
+
+        Examples:
+            Camera((100, 100), (1000, 1000), x=450, y=0).to_world((10, 20)) -> (460, 20)
+        """
+        return (point[0] + self.x, point[1] + self.y)
+
+
+    def visible(self, grid: Optional[SpatialGrid], count: int) -> np.ndarray:
+        """
+        Purpose: Returns the rows of the count indexed items that may be on screen,
+        using grid to skip the rest of the world. Without a grid every row is returned.
+
+        Examples:
+            camera = Camera((100, 100), (1000, 1000))
+            camera.visible(grid over food at x=50 and x=900, 2) -> array([0])
+        """
+        if grid is None:
+            return np.arange(count)
+        return grid.query_rect(self.x, self.y, self.x + self.view[0], self.y + self.view[1])
+
+
+def steer(sprite: Sprite, target: Point, speed: float, deltaT: float) -> Point:
+    """
+    Purpose: Moves from sprite towards target by at most speed * deltaT, for worlds
+    where the mouse points a direction rather than a place to jump to.
+
+    Examples:
+        steer(Player(x=0, y=0, ...), (100, 0), 60, 1/60) -> (1.0, 0.0)
+        steer(Player(x=0, y=0, ...), (0.5, 0), 60, 1/60) -> (0.5, 0)
+    """
+    dx, dy = target[0] - sprite.x, target[1] - sprite.y
+    distance = math.sqrt(dx * dx + dy * dy)
+    step = speed * deltaT
+    if distance <= step:
+        return target
+    return (sprite.x + dx / distance * step, sprite.y + dy / distance * step)
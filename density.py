@@ -0,0 +1,214 @@
+"""Neighbour-density scores for food, used by the opponent to find clusters."""
+import math
+from dataclasses import dataclass, field
+from typing import Optional
+import numpy as np
+from spatial_grid import SpatialGrid
+
+CLUSTER_RADIUS = 100
+CLUSTER_WEIGHT = 0.1
+
+# Patching costs about twice a rescore per changed row, so past this share rebuild instead.
+REBUILD_FRACTION = 0.4
+
+# How far food may drift, in pixels, before run.main's opponent re-scores it.
+CLUSTER_TOLERANCE = 2
+
+# Upper bound on candidate pairs held in memory at once.
+PAIR_CHUNK = 1 << 22
+
+def cluster_bonus(x: np.ndarray, y: np.ndarray, size: np.ndarray,
+                  grid: Optional[SpatialGrid] = None, items: Optional[np.ndarray] = None,
+                  radius: float = CLUSTER_RADIUS, weight: float = CLUSTER_WEIGHT) -> np.ndarray:
+    """
+    Purpose: For each food in items (default: all), adds up (radius - d) * weight over
+    every other food at distance d < radius. Food with the same position and size as
+    the one being scored does not count, matching the Food equality the old pairwise
+    scan used. Radius queries on a grid make this O(n * neighbours) rather than
+    O(n^2). grid must already index x and y; one is built if it is not given.
+
+    Examples:
+        cluster_bonus(np.array([0.0, 50.0, 900.0]), np.array([0.0, 0.0, 0.0]), np.full(3, 10.0))
+            -> array([5., 5., 0.])
+        cluster_bonus(..., items=np.array([2, 0])) -> array([0., 5.])
+    """
+    n = len(x)
+    if grid is None:
+        grid = SpatialGrid(radius)
+        grid.build(x, y, size)
+    # Scoring everything lets each pair be measured once and credited to both sides.
+    # A subset is scored into an array of its own, so its cost does not grow with n.
+    half = items is None
+    if half:
+        unique = np.arange(n)
+    else:
+        unique, inverse = np.unique(items, return_inverse=True)
+    bonus = np.zeros(len(unique))
+    if len(unique) == 0:
+        return bonus
+
+    reach = math.ceil(radius / grid.cell_size)
+    stencil_size = (2 * reach + 1) ** 2
+    chunk = max(1, PAIR_CHUNK // max(1, grid.max_occupancy() * stencil_size))
+    for start in range(0, len(unique), chunk):
+        i, j = grid.neighbour_pairs(unique[start:start + chunk], radius, half)
+        dx = x[i] - x[j]
+        dy = y[i] - y[j]
+        d = np.sqrt(dx * dx + dy * dy)
+        counted = (d < radius) & ((d > 0) | (size[i] != size[j]))
+        share = (radius - d[counted]) * weight
+        if half:
+            bonus += np.bincount(i[counted], weights=share, minlength=n)
+            bonus += np.bincount(j[counted], weights=share, minlength=n)
+        else:
+            bonus += np.bincount(np.searchsorted(unique, i[counted]), weights=share, minlength=len(unique))
+    return bonus if half else bonus[inverse]
+
+
+def cluster_bonus_bound(grid: SpatialGrid, radius: float = CLUSTER_RADIUS,
+                        weight: float = CLUSTER_WEIGHT) -> float:
+    """
+    Purpose: An upper bound on any food's cluster bonus. No food has more neighbours
+    than the fullest cell times the number of cells within reach, and each neighbour
+    adds less than radius * weight.
+
+    Examples:
+        grid = SpatialGrid(cell_size=100)
+        grid.build(np.array([0.0, 50.0, 900.0]), np.array([0.0, 0.0, 0.0]), np.full(3, 10.0))
+        cluster_bonus_bound(grid) -> 170.0
+    """
+    reach = math.ceil(radius / grid.cell_size)
+    neighbours = max(0, grid.max_occupancy() * (2 * reach + 1) ** 2 - 1)
+    return neighbours * radius * weight
+
+
+@dataclass
+class ClusterField:
+    """
+    The cluster bonus of every food, kept across frames. Each bonus is exact for the
+    anchor positions, which follow the food but are only refreshed for food that has
+    drifted more than tolerance from its anchor. sync patches just the bonuses near
+    changed food, so its cost follows how much changed rather than how much exists.
+    Rows line up with a FoodStore; FoodList calls remove whenever it compacts one.
+    """
+    tolerance: float = 0
+    radius: float = CLUSTER_RADIUS
+    weight: float = CLUSTER_WEIGHT
+    grid: Optional[SpatialGrid] = None
+    x: np.ndarray = field(default_factory=lambda: np.empty(0))
+    y: np.ndarray = field(default_factory=lambda: np.empty(0))
+    size: np.ndarray = field(default_factory=lambda: np.empty(0))
+    bonus: np.ndarray = field(default_factory=lambda: np.empty(0))
+
+    def __post_init__(self) -> None:
+        if self.grid is None:
+            self.grid = SpatialGrid(self.radius)
+
+
+    def rebuild(self, x: np.ndarray, y: np.ndarray, size: np.ndarray) -> None:
+        """
+        Purpose: Anchors every food at its current position and scores it from scratch.
+
+        Examples:
+            field = ClusterField()
+            field.rebuild(np.array([0.0, 50.0]), np.array([0.0, 0.0]), np.full(2, 10.0))
+            field.bonus -> array([5., 5.])
+        """
+        self.x, self.y, self.size = x.copy(), y.copy(), size.copy()
+        self.grid.build(self.x, self.y, self.size)
+        self.bonus = cluster_bonus(self.x, self.y, self.size, self.grid, None, self.radius, self.weight)
+
+
+    def patch(self, rows: np.ndarray, sign: float) -> None:
+        """
+        Purpose: Adds (sign=1) or takes away (sign=-1) every pair term between the given
+        rows and their neighbours at the anchor positions. Terms between two of the
+        given rows are applied once to each side.
+
+        Examples:
+            field.patch(np.array([0]), -1) -> field.bonus no longer counts row 0 anywhere
+        """
+        if len(rows) == 0:
+            return
+        n = len(self.x)
+        i, j = self.grid.neighbour_pairs(rows, self.radius)
+        dx = self.x[i] - self.x[j]
+        dy = self.y[i] - self.y[j]
+        d = np.sqrt(dx * dx + dy * dy)
+        counted = (d < self.radius) & ((d > 0) | (self.size[i] != self.size[j]))
+        i, j = i[counted], j[counted]
+        share = sign * (self.radius - d[counted]) * self.weight
+        in_rows = np.zeros(n, dtype=bool)
+        in_rows[rows] = True
+        outside = ~in_rows[j]
+        self.bonus += np.bincount(i, weights=share, minlength=n)
+        self.bonus += np.bincount(j[outside], weights=share[outside], minlength=n)
+
+
+    def sync(self, x: np.ndarray, y: np.ndarray, size: np.ndarray) -> int:
+        """
+        Purpose: Brings the field up to date with the food's current rows. Rows appended
+        since the last sync are scored, and rows that drifted more than tolerance are
+        re-anchored. Returns how many rows were re-scored.
+
+        Examples:
+            field = ClusterField()
+            field.rebuild(np.array([0.0, 50.0]), np.array([0.0, 0.0]), np.full(2, 10.0))
+            field.sync(np.array([0.0, 60.0]), np.array([0.0, 0.0]), np.full(2, 10.0)) -> 1
+            field.bonus -> array([4., 4.])
+        """
+        old = len(self.x)
+        if len(x) < old:
+            self.rebuild(x, y, size)
+            return len(x)
+
+        drift = np.maximum(np.abs(x[:old] - self.x), np.abs(y[:old] - self.y))
+        moved = np.flatnonzero((drift > self.tolerance) | (size[:old] != self.size))
+        added = np.arange(old, len(x))
+        if len(moved) == 0 and len(added) == 0:
+            return 0
+        if len(moved) + len(added) > REBUILD_FRACTION * len(x):
+            self.rebuild(x, y, size)
+            return len(x)
+
+        self.patch(moved, -1)
+        self.x = np.concatenate((self.x, x[old:]))
+        self.y = np.concatenate((self.y, y[old:]))
+        self.size = np.concatenate((self.size, size[old:]))
+        self.bonus = np.concatenate((self.bonus, np.zeros(len(added))))
+        self.x[moved], self.y[moved], self.size[moved] = x[moved], y[moved], size[moved]
+        if len(added):
+            self.grid.build(self.x, self.y, self.size)
+        else:
+            self.grid.update(self.x, self.y)
+        self.patch(np.concatenate((moved, added)), 1)
+        return len(moved) + len(added)
+
+
+    def remove(self, keep: np.ndarray) -> None:
+        """
+        Purpose: Takes eaten food out of its neighbours' bonuses and drops its rows,
+        mirroring a compaction of the FoodStore to the rows where keep is True. Rows
+        the field has not synced yet sit at the end and are simply ignored.
+
+        Examples:
+            field.rebuild(np.array([0.0, 50.0]), np.array([0.0, 0.0]), np.full(2, 10.0))
+            field.remove(np.array([False, True]))
+            field.bonus -> array([0.])
+        """
+        keep = keep[:len(self.x)]
+        self.patch(np.flatnonzero(~keep), -1)
+        self.x, self.y, self.size = self.x[keep], self.y[keep], self.size[keep]
+        self.bonus = self.bonus[keep]
+        self.grid.remove(keep)
+
+
+    def bound(self) -> float:
+        """
+        Purpose: An upper bound on every bonus in the field (see cluster_bonus_bound).
+
+        Examples:
+            field.rebuild(np.array([0.0, 50.0]), np.array([0.0, 0.0]), np.full(2, 10.0))
+            field.bound() -> 170.0
+        """
+        return cluster_bonus_bound(self.grid, self.radius, self.weight)
@@ -1,11 +1,18 @@
 """Manages Food state."""
 import math
-import random
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
+import numpy as np
 from typing_extensions import Self
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from sprite import Sprite
 from character import Character
+from spatial_grid import SpatialGrid
+from density import ClusterField
+from rng import FoodRandom
+from lod import DriftLOD
+
+# The fastest food drifts along each axis, in pixels per second.
+DRIFT_SPEED = 60
 
 @dataclass
 class Food(Sprite):
@@ -58,13 +65,236 @@ class Food(Sprite):
             return True
         return False
 
+class FoodStore:
+    """
+    Food held as a structure of arrays: x, y and size are contiguous float arrays
+    so drift, clamping and hit tests run as one vectorized operation each.
+    Indexing or iterating hands out Food objects, which are copies of one row.
+    Every row also has an id, handed out in increasing order and never reused, so
+    ids stay sorted as rows are appended and removed. rows_by_id maps each id ever
+    handed out to its current row, or -1 once it is gone, so looking food up by id
+    is O(1). It is built on the first lookup and then kept up to date wherever rows
+    are added or removed.
+    """
+
+    def __init__(self, food: Iterable[Food] = ()) -> None:
+        rows = [(f.x, f.y, f.size) for f in food]
+        table = np.array(rows, dtype=np.float64).reshape(len(rows), 3)
+        self.x = table[:, 0].copy()
+        self.y = table[:, 1].copy()
+        self.size = table[:, 2].copy()
+        self.ids = np.arange(len(rows), dtype=np.int64)
+        self.next_id = len(rows)
+        self.rows_by_id: Optional[np.ndarray] = None
+
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+
+    def __getitem__(self, i: int) -> Food:
+        """
+        Purpose: Builds a Food view of row i.
+
+        Examples:
+            FoodStore([Food(x=1, y=2, size=10)])[0] -> Food(1.0, 2.0, 10.0)
+        """
+        return Food(x=float(self.x[i]), y=float(self.y[i]), size=float(self.size[i]))
+
+
+    def __iter__(self) -> Iterator[Food]:
+        for x, y, size in zip(self.x.tolist(), self.y.tolist(), self.size.tolist()):
+            yield Food(x=x, y=y, size=size)
+
+
+    def __contains__(self, f: object) -> bool:
+        """
+        Purpose: Checks whether some row has the same position and size as f.
+
+        Examples:
+            Food(x=1, y=2, size=10) in FoodStore([Food(x=1, y=2, size=10)]) -> True
+            Food(x=1, y=3, size=10) in FoodStore([Food(x=1, y=2, size=10)]) -> False
+        """
+        if not isinstance(f, Food):
+            return False
+        return bool(np.any((self.x == f.x) & (self.y == f.y) & (self.size == f.size)))
+
+
+    def index_ids(self) -> None:
+        """
+        Purpose: Builds rows_by_id from ids.
+
+        Examples:
+            store.ids, store.next_id = np.array([2, 5]), 6; store.index_ids() -> store.rows_by_id == array([-1, -1, 0, -1, -1, 1])
+        """
+        self.rows_by_id = np.full(self.next_id, -1, dtype=np.int64)
+        self.rows_by_id[self.ids] = np.arange(len(self.ids))
+
+
+    def row_of(self, food_id: int) -> int:
+        """
+        Purpose: Returns the row of the food with the given id, or -1 if it has been
+        eaten or never existed.
+
+        Examples:
+            store = FoodStore([Food(x=1, y=1, size=10), Food(x=2, y=2, size=10)])
+            store.row_of(1) -> 1
+            store.keep(np.array([True, False])); store.row_of(1) -> -1
+        """
+        if self.rows_by_id is None:
+            self.index_ids()
+        if 0 <= food_id < len(self.rows_by_id):
+            return int(self.rows_by_id[food_id])
+        return -1
+
+
+    def rows_of(self, food_ids: np.ndarray) -> np.ndarray:
+        """
+        Purpose: row_of for many ids at once.
+
+        Examples:
+            FoodStore([Food(x=1, y=1, size=10)]).rows_of(np.array([0, -1, 7])) -> array([0, -1, -1])
+        """
+        if self.rows_by_id is None:
+            self.index_ids()
+        rows = np.full(len(food_ids), -1, dtype=np.int64)
+        known = (food_ids >= 0) & (food_ids < len(self.rows_by_id))
+        rows[known] = self.rows_by_id[food_ids[known]]
+        return rows
+
+
+    def append(self, f: Food) -> None:
+        self.extend_arrays(np.array([f.x], dtype=np.float64), np.array([f.y], dtype=np.float64),
+                           np.array([f.size], dtype=np.float64))
+
+
+    def extend_arrays(self, x: np.ndarray, y: np.ndarray, size: np.ndarray,
+                      ids: Optional[np.ndarray] = None) -> None:
+        """
+        Purpose: Appends many rows at once, giving them the next unused ids unless
+        ids (e.g. from a save) are given.
+
+        Examples:
+            store = FoodStore()
+            store.extend_arrays(np.array([1.0]), np.array([2.0]), np.array([10.0])) -> len(store) == 1, ids [0]
+        """
+        if ids is None:
+            ids = np.arange(self.next_id, self.next_id + len(x), dtype=np.int64)
+        first = len(self.x)
+        self.x = np.concatenate((self.x, x))
+        self.y = np.concatenate((self.y, y))
+        self.size = np.concatenate((self.size, size))
+        self.ids = np.concatenate((self.ids, ids))
+        if len(ids):
+            self.next_id = max(self.next_id, int(ids[-1]) + 1)
+        if self.rows_by_id is None:
+            return
+        if self.next_id > len(self.rows_by_id):
+            # Grown geometrically, so appending one food at a time stays cheap.
+            grown = np.full(max(self.next_id, 2 * len(self.rows_by_id)), -1, dtype=np.int64)
+            grown[:len(self.rows_by_id)] = self.rows_by_id
+            self.rows_by_id = grown
+        self.rows_by_id[ids] = np.arange(first, len(self.x))
+
+
+    def take(self, rows: np.ndarray) -> "FoodStore":
+        """
+        Purpose: Copies the given rows into a new store.
+
+        Examples:
+            store = FoodStore([Food(x=1, y=1, size=10), Food(x=2, y=2, size=10)])
+            list(store.take(np.array([1]))) -> [Food(2, 2, 10)]
+        """
+        taken = FoodStore()
+        taken.x, taken.y, taken.size = self.x[rows], self.y[rows], self.size[rows]
+        taken.ids, taken.next_id = self.ids[rows], self.next_id
+        return taken
+
+
+    def keep(self, mask: np.ndarray) -> None:
+        """
+        Purpose: Compacts the store down to the rows where mask is True.
+
+        Examples:
+            store = FoodStore([Food(x=1, y=1, size=10), Food(x=2, y=2, size=10)])
+            store.keep(np.array([False, True])) -> store[0] == Food(2, 2, 10)
+        """
+        self.x = self.x[mask]
+        self.y = self.y[mask]
+        self.size = self.size[mask]
+        if self.rows_by_id is not None:
+            self.rows_by_id[self.ids[~mask]] = -1
+            self.rows_by_id[self.ids[mask]] = np.arange(np.count_nonzero(mask))
+        self.ids = self.ids[mask]
+
+
+    def hits(self, spr: Sprite, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Purpose: Returns the index of every row touching the sprite, the vectorized
+        form of Food.hit. Only the given candidate rows are tested, if any.
+
+        Examples:
+            store = FoodStore([Food(x=0, y=0, size=1), Food(x=0, y=11, size=1)])
+            store.hits(Player(x=0, y=10, size=10, speed=10, color="red")) -> array([0])
+        """
+        if candidates is None:
+            candidates = np.arange(len(self))
+        dx = self.x[candidates] - spr.x
+        dy = self.y[candidates] - spr.y
+        touching = np.sqrt(dx * dx + dy * dy) < self.size[candidates] + spr.size
+        return candidates[touching]
+
+
 @dataclass
 class FoodList:
-    """A containing class for Food."""
-    food: List[Food]
+    """
+    A containing class for Food, optionally indexed by a SpatialGrid and carrying a
+    ClusterField of cluster bonuses that persists across frames. All spawn positions
+    and drift come from rng, so a seeded FoodRandom makes a run reproducible. With a
+    DriftLOD and a grid, food far from the characters drifts in batches (see move).
+    """
+    food: FoodStore
+    grid: Optional[SpatialGrid] = None
+    clusters: Optional[ClusterField] = None
+    rng: FoodRandom = field(default_factory=FoodRandom)
+    lod: Optional[DriftLOD] = None
 
+    def __post_init__(self) -> None:
+        if not isinstance(self.food, FoodStore):
+            self.food = FoodStore(self.food)
 
-    def populate(self, amount: int, bounds: Tuple[int, int]) -> List[Food]:
+
+    def index(self, cell_size: float = 80) -> SpatialGrid:
+        """
+        Purpose: Builds a spatial grid over the current food so that eat only checks
+        the cells a character overlaps. Cells default to about one character across.
+        The grid is then kept up to date by populate, eat and move.
+
+        Examples:
+            food_list = FoodList([Food(x=10, y=10, size=10)])
+            index(food_list) -> SpatialGrid with food 0 in cell (0, 0)
+        """
+        self.grid = SpatialGrid(cell_size)
+        self.grid.build(self.food.x, self.food.y, self.food.size)
+        return self.grid
+
+
+    def track_clusters(self, tolerance: float = 0) -> ClusterField:
+        """
+        Purpose: Scores the cluster bonus of all current food and keeps those scores
+        across frames. eat removes eaten food from the scores straight away; drifted
+        and newly populated food is re-scored when the field is next synced.
+
+        Examples:
+            food_list = FoodList([Food(x=0, y=0, size=10), Food(x=50, y=0, size=10)])
+            track_clusters(food_list).bonus -> array([5., 5.])
+        """
+        self.clusters = ClusterField(tolerance)
+        self.clusters.rebuild(self.food.x, self.food.y, self.food.size)
+        return self.clusters
+
+
+    def populate(self, amount: int, bounds: Tuple[int, int]) -> FoodStore:
         """
         Purpose: Populates the game world with a specified amount of food, placing them
         randomly within the given bounds (width and height). This initializes a list of
@@ -74,46 +304,128 @@ class FoodList:
             food_list = FoodList([])
             populate(food_list, 5, (500, 500)) -> List of 5 food objects within the 500x500 bounds
         """
-        for i in range(amount):
-            self.food.append(
-                Food(
-                    x=random.randint(0, bounds[0]),
-                    y=random.randint(0, bounds[1]),
-                    size=10
-                )
-            )
+        x, y = self.rng.spawn(amount, bounds)
+        self.food.extend_arrays(x, y, np.full(amount, 10, dtype=np.float64))
+        if self.grid:
+            self.grid.build(self.food.x, self.food.y, self.food.size)
         return self.food
 
 
-    def eat(self, chr: Character) -> List[Food]:
+    def eat(self, chr: Character) -> FoodStore:
         """
         Purpose: Checks if the player is hitting any food in the list. If so, the food is removed,
         and the player's food consumption count increases. The player is then resized accordingly.
+        Returns the food that was eaten, in store order (see eat_all).
 
         Examples:
             food_list = FoodList([Food(x=0, y=0, size=10)])
             p = Player(x=0, y=0, size=10, speed=10, color="red")
-            eat(food_list, p) -> Removes the food and increases player count.
+            eat(food_list, p) -> FoodStore([Food(0, 0, 10)]), the list is empty and p.count == 1
+        """
+        return self.eat_all([chr])[0]
+
+
+    def eat_all(self, chrs: List[Character]) -> List[FoodStore]:
         """
-        for f in self.food:
-            if f.hit(chr):
+        Purpose: Lets every character eat the food it is hitting, as calling eat for each
+        in turn would: food touching several characters goes to the first of them. All
+        hits are found against the characters' sizes before anyone grows, in one vectorized
+        test over every (character, candidate) pair the grid turns up, and the store, grid
+        and cluster scores are then compacted once for the whole step rather than once per
+        character. Returns the food each character ate, in store order.
+
+        Examples:
+            food_list = FoodList([Food(x=0, y=0, size=10), Food(x=100, y=0, size=10)])
+            eat_all(food_list, [Player(x=0, ...), Opponent(x=0, ...)]) -> [FoodStore([Food(0, 0, 10)]), FoodStore([])]
+        """
+        store = self.food
+        x = np.array([chr.x for chr in chrs], dtype=np.float64)
+        y = np.array([chr.y for chr in chrs], dtype=np.float64)
+        size = np.array([chr.size for chr in chrs], dtype=np.float64)
+        if self.grid:
+            owners, rows = self.grid.query_many(x, y, size)
+        else:
+            owners = np.repeat(np.arange(len(chrs)), len(store))
+            rows = np.tile(np.arange(len(store)), len(chrs))
+        dx = store.x[rows] - x[owners]
+        dy = store.y[rows] - y[owners]
+        touching = np.sqrt(dx * dx + dy * dy) < store.size[rows] + size[owners]
+        owners, rows = owners[touching], rows[touching]
+        # Pairs come in character order, so each food's first pair is its first eater.
+        rows, first = np.unique(rows, return_index=True)
+        owners = owners[first]
+        by_owner = np.argsort(owners, kind="stable")
+        split = np.cumsum(np.bincount(owners, minlength=len(chrs)))[:-1]
+        keep = np.ones(len(store), dtype=bool)
+        keep[rows] = False
+        eaten = []
+        for chr, hits in zip(chrs, np.split(rows[by_owner], split)):
+            eaten.append(store.take(hits))
+            for i in range(len(hits)):
                 chr.eat()
                 chr.resize()
-                self.food.remove(f)
-        return self.food
+        if keep.all():
+            return eaten
+        store.keep(keep)
+        if self.grid:
+            self.grid.remove(keep)
+        if self.clusters:
+            self.clusters.remove(keep)
+        return eaten
 
 
-    def move(self, bounds: Tuple[int, int] = (1280, 720)) -> Self:
+    def move(self, bounds: Tuple[int, int] = (1280, 720), deltaT: float = 1/60,
+             focus: Iterable[Sprite] = ()) -> Self:
         """
         Purpose: Randomly moves all the food items in the list by a small amount. This simulates
-        the movement of food drifting around the game world.
+        the movement of food drifting around the game world. Food drifts up to DRIFT_SPEED
+        pixels per second on each axis, i.e. up to 1px per 1/60s step. With a lod, a grid
+        and characters to focus on, only food near them drifts every step; each step also
+        moves one of lod.every batches of the rest by lod.every steps' worth of drift.
 
         Examples:
             food_list = FoodList([Food(x=100, y=100, size=10)])
             move(food_list) -> Moves all food items slightly by random amounts.
+            move(food_list, deltaT=1/120) -> Moves them by up to half a pixel.
+            move(food_list with lod=DriftLOD(), focus=(player, opponent)) -> Moves the food near them and one batch of the rest.
+        """
+        if self.lod and self.grid and focus:
+            return self.move_lod(bounds, deltaT, focus)
+        store = self.food
+        n = len(store)
+        scale = deltaT * DRIFT_SPEED
+        dx, dy = self.rng.drift(n)
+        store.x += dx * scale
+        store.y += dy * scale
+        np.maximum(np.minimum(store.x, bounds[0] - store.size), store.size, out=store.x)
+        np.maximum(np.minimum(store.y, bounds[1] - store.size), store.size, out=store.y)
+        if self.grid:
+            self.grid.update(store.x, store.y)
+        return self
+
+
+    def move_lod(self, bounds: Tuple[int, int], deltaT: float, focus: Iterable[Sprite]) -> Self:
+        """
+        Purpose: The level-of-detail form of move. Batched food is clamped to bounds
+        once after its whole multi-step offset rather than after each step, and only
+        the rows that moved are re-bucketed in the grid.
+
+        Examples:
+            food_list.lod = DriftLOD(radius=100, every=2)
+            move_lod(food_list, (1280, 720), 1/60, [player]) -> food near player and half the rest moved
         """
-        for f in self.food:
-            f.move(random.randint(-1, 1), random.randint(-1, 1))
-            f.x = max(f.size, min(bounds[0] - f.size, f.x))
-            f.y = max(f.size, min(bounds[1] - f.size, f.y))
+        store = self.food
+        near, far = self.lod.schedule(self.grid, len(store), focus)
+        scale = deltaT * DRIFT_SPEED
+        dx, dy = self.rng.drift(len(near))
+        far_dx, far_dy = self.rng.drift_sum(len(far), self.lod.every)
+        rows = np.concatenate((near, far))
+        size = store.size[rows]
+        x = store.x[rows] + np.concatenate((dx, far_dx)) * scale
+        y = store.y[rows] + np.concatenate((dy, far_dy)) * scale
+        np.maximum(np.minimum(x, bounds[0] - size), size, out=x)
+        np.maximum(np.minimum(y, bounds[1] - size), size, out=y)
+        store.x[rows] = x
+        store.y[rows] = y
+        self.grid.update_rows(rows, x, y)
         return self
@@ -1,3 +1,4 @@
 from cs110 import install
 
-install("typing_extensions")
\ No newline at end of file
+install("typing_extensions")
+install("numpy")
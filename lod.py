@@ -0,0 +1,63 @@
+"""Level-of-detail scheduling for food drift: full rate near characters, batched far away."""
+import math
+from dataclasses import dataclass
+from typing import Iterable, Tuple
+import numpy as np
+from sprite import Sprite
+from spatial_grid import SpatialGrid
+
+# Worlds with more than this many screens' worth of area drift with a DriftLOD.
+LOD_SCREENS = 4
+
+# The window run.main opens.
+SCREEN = (1280, 720)
+
+# The camera stops at the world's edges, so with the player in a corner the far corner
+# of the view is a whole screen diagonal away; food that far still drifts every tick.
+NEAR_RADIUS = math.ceil(math.hypot(*SCREEN))
+
+@dataclass
+class DriftLOD:
+    """
+    Decides which food drifts on each tick. Food within radius of a character (which
+    covers the screen around the player, wherever the camera stops) drifts every tick. The rest is split into
+    every blocks of rows; one block drifts per tick, by offsets worth every ticks of
+    drift, so each far food still drifts as far on average but is touched 1/every
+    as often.
+    """
+    radius: float = NEAR_RADIUS
+    every: int = 8
+    tick: int = 0
+
+    def schedule(self, grid: SpatialGrid, count: int, focus: Iterable[Sprite]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Purpose: Returns this tick's (near, far) rows of the count food indexed by grid
+        and advances to the next tick. Near rows move one tick, far rows every ticks.
+
+        Examples:
+            lod = DriftLOD(radius=100, every=2)
+            lod.schedule(grid over food at x=0, 500, 1000, 3, [Player(x=0, ...)]) -> (array([0]), array([1]))
+            lod.schedule(...) -> (array([0]), array([2]))
+        """
+        near = [grid.query(chr.x, chr.y, self.radius) for chr in focus]
+        near = np.unique(np.concatenate(near)) if near else np.empty(0, dtype=np.int64)
+        block = -(-count // self.every)
+        start = (self.tick % self.every) * block
+        end = min(start + block, count)
+        self.tick += 1
+        if start >= end:
+            return near, np.empty(0, dtype=np.int64)
+        far = np.ones(end - start, dtype=bool)
+        far[near[(near >= start) & (near < end)] - start] = False
+        return near, np.flatnonzero(far) + start
+
+
+def needs_lod(bounds: Tuple[int, int], screen: Tuple[int, int] = SCREEN) -> bool:
+    """
+    Purpose: Checks whether a world is big enough for level-of-detail drift.
+
+    Examples:
+        needs_lod((1280, 720)) -> False
+        needs_lod((20000, 20000)) -> True
+    """
+    return bounds[0] * bounds[1] > LOD_SCREENS * screen[0] * screen[1]
@@ -1,44 +1,42 @@
 """A class for an Opponent."""
 from dataclasses import dataclass
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union
 from typing_extensions import Self
+import strategy
 from character import Character
 from food import Food, FoodList
 
 @dataclass
 class Opponent(Character):
-    """A competing player with look-ahead AI."""
+    """
+    A competing player with look-ahead AI. A planner swaps in any registered strategy,
+    or an AnytimeSearch spreads the search over several frames.
+    """
     current_target: Optional[Food] = None
+    target_id: int = -1
+    planner: Optional[Union[strategy.Planner, strategy.AnytimeSearch]] = None
 
     def find_best_food(self, food_list: FoodList, player_pos: Optional[Tuple[float, float]] = None) -> Optional[Food]:
-        """Pick the best food to chase based on distance and clustering."""
+        """Pick the best food to chase: by distance and clustering, or by the planner's strategy."""
         if not food_list.food:
             self.current_target = None
+            self.target_id = -1
             return None
 
-        if self.current_target and self.current_target in food_list.food:
-            if self.current_target.distance(self) < 50:
+        # The target is followed by id, so it is still recognised after drifting.
+        row = food_list.food.row_of(self.target_id)
+        if row >= 0:
+            target = food_list.food[row]
+            if target.distance(self) < 50:
+                self.current_target = target
                 return self.current_target
 
-        def score_food(f: Food) -> float:
-            dist_to_self = f.distance(self)
-
-            cluster_bonus = 0
-            for other in food_list.food:
-                if other != f:
-                    d = ((f.x - other.x)**2 + (f.y - other.y)**2)**0.5
-                    if d < 100:
-                        cluster_bonus += (100 - d) * 0.1
-
-            player_penalty = 0
-            if player_pos:
-                dist_to_player = ((f.x - player_pos[0])**2 + (f.y - player_pos[1])**2)**0.5
-                if dist_to_player < dist_to_self:
-                    player_penalty = (dist_to_self - dist_to_player) * 2
-
-            return -dist_to_self + cluster_bonus - player_penalty
-
-        self.current_target = max(food_list.food, key=score_food)
+        if self.planner:
+            row = self.planner.pick(self, food_list, player_pos)
+        else:
+            row = strategy.pick_cluster(self, food_list, player_pos)
+        self.current_target = None if row is None else food_list.food[row]
+        self.target_id = -1 if row is None else int(food_list.food.ids[row])
         return self.current_target
 
     def move(self, food_list: FoodList, player_pos: Optional[Tuple[float, float]] = None, deltaT: float = 1/60) -> Self:
@@ -0,0 +1,126 @@
+"""Per-phase frame timing kept in ring buffers, for finding slow frames."""
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence
+import numpy as np
+
+# The parts of a frame that are timed, in the order they run.
+PHASES = ("events", "opponent", "eat", "move", "draw")
+
+@dataclass
+class FrameProfiler:
+    """
+    Times each phase of the last capacity frames in nanoseconds. A frame is opened
+    with begin_frame; each lap then charges the time since the previous lap (or
+    skip) to a phase, so a phase that runs several times a frame, like a simulation
+    step, adds up. Callers hold None instead of a profiler when profiling is off,
+    so the only cost then is one truth test per lap site.
+    """
+    capacity: int = 240
+    times: np.ndarray = field(init=False, repr=False)
+    food: np.ndarray = field(init=False, repr=False)
+    columns: Dict[str, int] = field(init=False, repr=False)
+    frames: int = 0
+    last: int = 0
+
+    def __post_init__(self) -> None:
+        self.times = np.zeros((self.capacity, len(PHASES)), dtype=np.int64)
+        self.food = np.zeros(self.capacity, dtype=np.int64)
+        self.columns = {phase: i for i, phase in enumerate(PHASES)}
+
+
+    def begin_frame(self, food: int) -> None:
+        """
+        Purpose: Starts timing a new frame, overwriting the oldest once capacity
+        frames are held, and notes how much food there is.
+
+        Examples:
+            profiler.begin_frame(100) -> profiler.frames == 1, its phase times all 0
+        """
+        row = self.frames % self.capacity
+        self.times[row] = 0
+        self.food[row] = food
+        self.frames += 1
+        self.last = time.perf_counter_ns()
+
+
+    def lap(self, phase: str) -> None:
+        """
+        Purpose: Charges the time since the last lap, skip or begin_frame to phase.
+
+        Examples:
+            profiler.begin_frame(100); opponent.move(...); profiler.lap("opponent")
+        """
+        now = time.perf_counter_ns()
+        self.times[(self.frames - 1) % self.capacity, self.columns[phase]] += now - self.last
+        self.last = now
+
+
+    def skip(self) -> None:
+        """
+        Purpose: Leaves the time since the last lap uncharged, e.g. time spent
+        waiting for the next frame.
+
+        Examples:
+            game.tick(); profiler.skip()
+        """
+        self.last = time.perf_counter_ns()
+
+
+    def recent(self) -> np.ndarray:
+        """
+        Purpose: Returns the held frames' phase times, oldest first, one row per frame.
+
+        Examples:
+            FrameProfiler(capacity=2).recent().shape -> (0, 5)
+        """
+        held = min(self.frames, self.capacity)
+        start = self.frames - held
+        rows = np.arange(start, self.frames) % self.capacity
+        return self.times[rows]
+
+
+    def percentiles(self, q: Sequence[float] = (50, 95, 99)) -> Dict[str, np.ndarray]:
+        """
+        Purpose: Summarises each phase over the held frames as the given percentiles,
+        in milliseconds.
+
+        Examples:
+            profiler.percentiles()["draw"] -> array([p50, p95, p99]) in ms
+        """
+        recent = self.recent()
+        if len(recent) == 0:
+            return {phase: np.zeros(len(q)) for phase in PHASES}
+        table = np.percentile(recent, q, axis=0) / 1e6
+        return {phase: table[:, i] for i, phase in enumerate(PHASES)}
+
+
+    def summary(self) -> List[str]:
+        """
+        Purpose: Formats the percentiles as lines of text for an overlay.
+
+        Examples:
+            profiler.summary() -> ["Food: 100  Frames: 240", "events    p50 0.02  p95 0.05  p99 0.09 ms", ...]
+        """
+        held = min(self.frames, self.capacity)
+        food = self.food[(self.frames - 1) % self.capacity] if self.frames else 0
+        lines = [f"Food: {food}  Frames: {held}"]
+        for phase, (p50, p95, p99) in self.percentiles().items():
+            lines.append(f"{phase:<9} p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f} ms")
+        return lines
+
+
+    def write_csv(self, filepath: str) -> None:
+        """
+        Purpose: Writes one row per held frame: its number, the food count and each
+        phase's time in milliseconds.
+
+        Examples:
+            profiler.write_csv("profile.csv") -> frame,food,events_ms,opponent_ms,... rows
+        """
+        held = min(self.frames, self.capacity)
+        frames = np.arange(self.frames - held, self.frames)
+        food = self.food[frames % self.capacity]
+        table = np.column_stack((frames, food, self.recent() / 1e6))
+        header = ",".join(["frame", "food"] + [f"{phase}_ms" for phase in PHASES])
+        np.savetxt(filepath, table, delimiter=",", header=header, comments="", fmt=["%d", "%d"] + ["%.4f"] * len(PHASES))
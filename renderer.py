@@ -0,0 +1,117 @@
+"""Renders frames by repainting only the screen regions that changed, and food in batches."""
+from dataclasses import dataclass, field
+from typing import Dict, List
+import numpy as np
+import pygame
+
+# Fills food sprites outside their circle; never drawn, as it is the colour key.
+SPRITE_KEY = (255, 0, 255)
+
+# Past this share of the screen, one full fill and flip is cheaper than many small ones.
+FULL_REDRAW_SHARE = 0.5
+
+@dataclass
+class DirtyRectRenderer:
+    """
+    Remembers the bounds of everything drawn last frame. Each frame it erases only
+    those bounds, lets the caller draw, then pushes the old and new bounds to the
+    display with pygame.display.update instead of flipping the whole screen.
+    """
+    background: str
+    previous: List[pygame.Rect] = field(default_factory=list)
+    previous_area: int = 0
+    full: bool = True
+
+    def begin(self, screen: pygame.Surface) -> None:
+        """
+        Purpose: Erases last frame's drawing, either rect by rect or, on the first
+        frame and when most of the screen was covered, with one full fill.
+
+        Examples:
+            renderer = DirtyRectRenderer("purple")
+            renderer.begin(screen) -> screen filled purple (first frame)
+        """
+        screen_area = screen.get_width() * screen.get_height()
+        if self.full or self.previous_area > FULL_REDRAW_SHARE * screen_area:
+            self.full = True
+            screen.fill(self.background)
+            return
+        for rect in self.previous:
+            screen.fill(self.background, rect)
+
+
+    def end(self, screen: pygame.Surface, drawn: List[pygame.Rect]) -> List[pygame.Rect]:
+        """
+        Purpose: Pushes the changed regions to the display and remembers what was
+        drawn this frame. Returns the regions that were updated.
+
+        Examples:
+            renderer.end(screen, [Rect(0, 0, 10, 10)]) -> [screen.get_rect()] (first frame)
+            renderer.end(screen, [Rect(1, 0, 10, 10)]) -> [Rect(0, 0, 10, 10), Rect(1, 0, 10, 10)]
+        """
+        if self.full:
+            dirty = [screen.get_rect()]
+            pygame.display.flip()
+        else:
+            dirty = self.previous + drawn
+            pygame.display.update(dirty)
+        self.previous = drawn
+        self.previous_area = sum(rect.w * rect.h for rect in drawn)
+        self.full = False
+        return dirty
+
+
+@dataclass
+class FoodSprites:
+    """
+    Food circles rasterized once per size and stamped with one Surface.blits call
+    per size, instead of one pygame.draw.circle call per food. Each sprite matches
+    pygame.draw.circle pixel for pixel, which truncates centres and radii.
+    """
+    color: str = "blue"
+    sprites: Dict[int, pygame.Surface] = field(default_factory=dict)
+
+    def sprite(self, radius: int) -> pygame.Surface:
+        """
+        Purpose: Returns the sprite for a circle of the given radius, drawing it on first use.
+
+        Examples:
+            sprites = FoodSprites()
+            sprites.sprite(10).get_size() -> (20, 20)
+            sprites.sprite(10) is sprites.sprite(10) -> True
+        """
+        if radius not in self.sprites:
+            surface = pygame.Surface((2 * radius, 2 * radius))
+            surface.fill(SPRITE_KEY)
+            pygame.draw.circle(surface, self.color, (radius, radius), radius)
+            surface.set_colorkey(SPRITE_KEY, pygame.RLEACCEL)
+            if pygame.display.get_surface():
+                surface = surface.convert()
+            self.sprites[radius] = surface
+        return self.sprites[radius]
+
+
+    def draw(self, screen: pygame.Surface, x: np.ndarray, y: np.ndarray, size: np.ndarray,
+             rects: bool = False) -> List[pygame.Rect]:
+        """
+        Purpose: Draws a circle for every (x, y, size) row, batched by radius. Returns
+        the drawn rects if rects is True (for the dirty-rect renderer), else [].
+
+        Examples:
+            FoodSprites().draw(screen, np.array([50.0]), np.array([50.0]), np.array([10.0]), True)
+                -> [Rect(40, 40, 20, 20)], same pixels as pygame.draw.circle(screen, "blue", (50, 50), 10)
+        """
+        drawn = []
+        radii = size.astype(np.int64)
+        left = x.astype(np.int64) - radii
+        top = y.astype(np.int64) - radii
+        unique = np.unique(radii).tolist()
+        for radius in unique:
+            # Food is usually all one size, which needs no mask.
+            rows = radii == radius if len(unique) > 1 else slice(None)
+            sprite = self.sprite(radius)
+            positions = zip(left[rows].tolist(), top[rows].tolist())
+            blitted = screen.blits([(sprite, position) for position in positions], rects)
+            if rects:
+                drawn.extend(blitted)
+        return drawn
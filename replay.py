@@ -0,0 +1,149 @@
+"""Records a match's inputs and re-simulates it headlessly, frame for frame."""
+import copy
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from simulation import Simulation, Mouse, new_simulation
+
+# Steps between the snapshots Replay keeps for seeking: 10 seconds of play at 60 Hz.
+KEYFRAME_EVERY = 600
+
+@dataclass
+class Recording:
+    """
+    Everything needed to play a match again exactly: the settings and seed it
+    started from, the mouse position fed to every simulation step, and the keys
+    pressed, each tagged with the step it was pressed before.
+    """
+    seed: int
+    food: int = 100
+    bounds: Tuple[int, int] = (1280, 720)
+    opponent_speed: float = 150
+    deltaT: float = 1 / 60
+    rivals: int = 0
+    mouse: List[Mouse] = field(default_factory=list)
+    keys: List[Tuple[int, int]] = field(default_factory=list)
+
+    def start(self) -> Simulation:
+        """
+        Purpose: Builds the simulation the recorded match started from.
+
+        Examples:
+            Recording(seed=1, food=5).start().food_list.food -> the same 5 food every time
+        """
+        return new_simulation(self.food, self.bounds, self.opponent_speed, self.seed, self.rivals)
+
+
+    def step(self, sim: Simulation, mouse: Mouse) -> Optional[str]:
+        """
+        Purpose: Records mouse and steps sim with it. Use in place of sim.step while recording.
+
+        Examples:
+            recording.step(sim, (10, 20)) -> sim.step((10, 20), recording.deltaT); recording.mouse[-1] == (10, 20)
+        """
+        self.mouse.append((float(mouse[0]), float(mouse[1])))
+        return sim.step(mouse, self.deltaT)
+
+
+    def key(self, key: int) -> None:
+        """
+        Purpose: Records a key press before the next step.
+
+        Examples:
+            recording.key(pygame.K_p) -> recording.keys[-1] == (len(recording.mouse), pygame.K_p)
+        """
+        self.keys.append((len(self.mouse), key))
+
+
+    def save(self, filepath: str) -> None:
+        """
+        Purpose: Writes the recording as a compressed .npz file. A player holding the
+        mouse still repeats the same position, which compresses to almost nothing.
+
+        Examples:
+            recording.save("session.npz") -> load_recording("session.npz") == recording
+        """
+        meta = {"seed": self.seed, "food": self.food, "bounds": list(self.bounds),
+                "opponent_speed": self.opponent_speed, "deltaT": self.deltaT, "rivals": self.rivals}
+        np.savez_compressed(
+            filepath,
+            meta=np.array(json.dumps(meta)),
+            mouse=np.array(self.mouse, dtype=np.float64).reshape(len(self.mouse), 2),
+            keys=np.array(self.keys, dtype=np.int64).reshape(len(self.keys), 2)
+        )
+
+
+def load_recording(filepath: str) -> Recording:
+    """
+    Purpose: Reads a recording written by Recording.save.
+
+    Examples:
+        load_recording("session.npz") -> Recording(seed=..., mouse=[...], keys=[...])
+    """
+    with np.load(filepath) as data:
+        meta = json.loads(str(data["meta"]))
+        meta["bounds"] = tuple(meta["bounds"])
+        mouse = [tuple(m) for m in data["mouse"].tolist()]
+        keys = [tuple(k) for k in data["keys"].tolist()]
+    return Recording(mouse=mouse, keys=keys, **meta)
+
+
+@dataclass
+class Replay:
+    """
+    Re-simulates a Recording as fast as the simulation runs. Every keyframe_every
+    steps a full copy of the simulation is kept, so seek can jump to any step by
+    resuming from the nearest earlier keyframe instead of from the start.
+    """
+    recording: Recording
+    keyframe_every: int = KEYFRAME_EVERY
+    sim: Simulation = field(init=False)
+    keyframes: Dict[int, Simulation] = field(init=False, default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self.sim = self.recording.start()
+        self.keyframes[0] = copy.deepcopy(self.sim)
+
+
+    def run(self, to_step: Optional[int] = None) -> Simulation:
+        """
+        Purpose: Steps forward to to_step (default: the end of the recording),
+        keeping keyframes along the way. Returns the simulation at that step.
+
+        Examples:
+            Replay(recording).run().winner -> the winner of the recorded match
+        """
+        end = len(self.recording.mouse) if to_step is None else min(to_step, len(self.recording.mouse))
+        sim = self.sim
+        while sim.steps < end:
+            sim.step(self.recording.mouse[sim.steps], self.recording.deltaT)
+            if sim.steps % self.keyframe_every == 0 and sim.steps not in self.keyframes:
+                self.keyframes[sim.steps] = copy.deepcopy(sim)
+        return sim
+
+
+    def seek(self, step: int) -> Simulation:
+        """
+        Purpose: Puts the replay at the given step, from the nearest keyframe at or
+        before it, and returns the simulation there.
+
+        Examples:
+            replay.seek(1000) -> resumes from the keyframe at step 600 and runs 400 steps
+            replay.seek(1000).steps -> 1000
+        """
+        start = max(k for k in self.keyframes if k <= step)
+        if not start <= self.sim.steps <= step:
+            self.sim = copy.deepcopy(self.keyframes[start])
+        return self.run(step)
+
+
+if __name__ == "__main__":
+    replay = Replay(load_recording(sys.argv[1]))
+    start = time.perf_counter()
+    sim = replay.run(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {sim.steps} steps in {elapsed:.2f}s ({sim.steps / max(elapsed, 1e-9):.0f} steps/s)")
+    print(f"Winner: {sim.winner}  Player: {sim.player.count}  Opponent: {sim.opponent.count}  Food left: {len(sim.food_list.food)}")
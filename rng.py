@@ -0,0 +1,96 @@
+"""Seeded random streams for food spawning and drift."""
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+# How many drift offsets are drawn at a time; several frames' worth for 100 food.
+DRIFT_BLOCK = 1 << 16
+
+# Most steps of drift one lookup table covers; it has 3 ** TABLE_STEPS entries.
+TABLE_STEPS = 8
+
+@dataclass
+class FoodRandom:
+    """
+    The random numbers one FoodList consumes, drawn from its own numpy Generator
+    rather than the global random state. Two FoodRandoms with the same seed produce
+    the same spawns and drift given the same sequence of calls, whatever else runs
+    in the process. Drift offsets are drawn a block at a time and handed out as slices.
+    """
+    seed: Optional[int] = None
+    block: int = DRIFT_BLOCK
+    generator: np.random.Generator = field(init=False, repr=False)
+    offsets: np.ndarray = field(init=False, repr=False)
+    used: int = field(init=False, default=0, repr=False)
+    tables: Dict[int, np.ndarray] = field(init=False, default_factory=dict, repr=False)
+
+    def __post_init__(self) -> None:
+        self.generator = np.random.default_rng(self.seed)
+        self.offsets = np.empty(0, dtype=np.int8)
+
+
+    def spawn(self, amount: int, bounds: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Purpose: Draws amount whole-pixel positions spread evenly over bounds, edges included.
+
+        Examples:
+            FoodRandom(1).spawn(2, (500, 500)) -> (array([237., 256.]), array([378., 476.]))
+            FoodRandom(1).spawn(2, (500, 500)) == FoodRandom(1).spawn(2, (500, 500)) -> True
+        """
+        x = self.generator.integers(0, bounds[0] + 1, amount).astype(np.float64)
+        y = self.generator.integers(0, bounds[1] + 1, amount).astype(np.float64)
+        return x, y
+
+
+    def drift(self, amount: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Purpose: Returns amount x offsets and amount y offsets, each -1, 0 or 1, taken
+        from the pre-drawn block. A new block is drawn when too few are left.
+
+        Examples:
+            dx, dy = FoodRandom(1).drift(3) -> two int8 arrays of 3 values in {-1, 0, 1}
+        """
+        needed = 2 * amount
+        if self.used + needed > len(self.offsets):
+            self.offsets = self.generator.integers(-1, 2, max(self.block, needed), dtype=np.int8)
+            self.used = 0
+        start = self.used
+        self.used += needed
+        return self.offsets[start:start + amount], self.offsets[start + amount:self.used]
+
+
+    def drift_table(self, steps: int) -> np.ndarray:
+        """
+        Purpose: Lists the total of every possible sequence of steps drift offsets,
+        so that one uniform pick from the table is distributed exactly like the sum
+        of steps separate offsets.
+
+        Examples:
+            FoodRandom().drift_table(1) -> array([-1, 0, 1])
+            FoodRandom().drift_table(2) -> array([-2, -1, 0, -1, 0, 1, 0, 1, 2])
+        """
+        if steps not in self.tables:
+            table = np.zeros(1, dtype=np.int8)
+            for i in range(steps):
+                table = (table[:, None] + np.array([-1, 0, 1], dtype=np.int8)).ravel()
+            self.tables[steps] = table
+        return self.tables[steps]
+
+
+    def drift_sum(self, amount: int, steps: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Purpose: Returns amount x and y offsets, each distributed as the total of
+        steps drift offsets, for food that is moved steps ticks at once. Costs one
+        table pick per TABLE_STEPS steps instead of one draw per step.
+
+        Examples:
+            dx, dy = FoodRandom(1).drift_sum(3, 8) -> two arrays of 3 values in -8..8
+        """
+        dx = np.zeros(amount, dtype=np.int64)
+        dy = np.zeros(amount, dtype=np.int64)
+        while steps > 0:
+            table = self.drift_table(min(steps, TABLE_STEPS))
+            dx += table[self.generator.integers(0, len(table), amount)]
+            dy += table[self.generator.integers(0, len(table), amount)]
+            steps -= TABLE_STEPS
+        return dx, dy
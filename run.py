@@ -1,15 +1,84 @@
 """Example game showing a circle moving on screen."""
 import os
+import sys
 import pygame
-from typing import Optional
+from typing import List, Optional, Sequence, Tuple
 
 from game import Game
 from player import Player
 from opponent import Opponent
-from food import Food, FoodList
-from save_state import save_game, load_game
-
-SAVE_FILE = "savegame.json"
+from food import FoodList
+from save_state import load_game, Journal
+from renderer import DirtyRectRenderer, FoodSprites
+from text_cache import TextCache
+from timestep import FixedTimestep
+from autosave import Autosave
+from camera import Camera, steer
+from replay import Recording
+from simulation import new_simulation
+from profiler import FrameProfiler
+from strategy import AnytimeSearch, Planner, STRATEGIES
+
+SAVE_FILE = "savegame.bin"
+
+# Saves from before the binary format; L still loads one when there is no SAVE_FILE.
+LEGACY_SAVE_FILE = "savegame.json"
+
+# Set DIRTY_RECTS=1 to repaint only the regions that changed each frame (for slow displays).
+DIRTY_RECTS = os.environ.get("DIRTY_RECTS") == "1"
+
+# Set WORLD=20000x20000 to play in a world larger than the window, with a camera
+# following the player. FOOD defaults to the window's density of 100 food.
+WORLD = os.environ.get("WORLD")
+FOOD = os.environ.get("FOOD")
+
+# Set RIVALS=50 to add that many extra AI opponents, all sharing one targeting pass.
+RIVALS = int(os.environ.get("RIVALS", 0))
+
+# Set STRATEGY=intercept (or nearest, cluster) to change how the opponent picks food,
+# falling back to cheaper strategies when one takes over STRATEGY_BUDGET_US a step.
+# STRATEGY=anytime instead spreads the cluster search over frames, STRATEGY_BUDGET_US each.
+# With RIVALS set, the swarm's shared targeting picks for every opponent instead, so
+# STRATEGY has no effect.
+STRATEGY = os.environ.get("STRATEGY")
+STRATEGY_NAMES = sorted(STRATEGIES) + ["anytime"]
+STRATEGY_BUDGET_US = float(os.environ.get("STRATEGY_BUDGET_US", 1000))
+
+# Simulation steps per second, independent of the 60 FPS frame rate.
+SIM_HZ = float(os.environ.get("SIM_HZ", 60))
+
+# Seconds of play between autosaves, and how many autosave files to rotate through.
+AUTOSAVE_SECONDS = float(os.environ.get("AUTOSAVE_SECONDS", 60))
+AUTOSAVE_SLOTS = int(os.environ.get("AUTOSAVE_SLOTS", 3))
+
+# Set SAVE_JOURNAL=1 to have S and each autosave append what changed to a journal
+# instead of rewriting the save.
+SAVE_JOURNAL = os.environ.get("SAVE_JOURNAL") == "1"
+
+# Set RECORD=session.npz to record each game's inputs there for python replay.py.
+RECORD_FILE = os.environ.get("RECORD")
+
+# F3 toggles the frame profiler overlay; F4 writes its frames here.
+PROFILE_CSV = "profile.csv"
+
+# Frames between overlay text refreshes, so the numbers stay readable.
+PROFILE_REFRESH = 30
+
+# Writes manual saves and autosaves off the frame loop.
+AUTOSAVE = Autosave(SAVE_FILE, AUTOSAVE_SECONDS, AUTOSAVE_SLOTS)
+
+# Fonts and rendered labels shared by the menu and the HUD.
+TEXT = TextCache()
+
+# Food circles, rasterized once per size.
+FOOD_SPRITES = FoodSprites("blue")
+
+def save_to_load() -> Optional[str]:
+    """Returns the save L loads: the newest of SAVE_FILE and the autosaves, else an older JSON save, else None."""
+    newest = AUTOSAVE.newest(SAVE_FILE)
+    if newest:
+        return newest
+    return LEGACY_SAVE_FILE if os.path.exists(LEGACY_SAVE_FILE) else None
 
 def welcome_screen(screen: pygame.Surface) -> str:
     """Display welcome screen. Returns 'start', 'load', or 'exit'."""
@@ -18,28 +87,24 @@ def welcome_screen(screen: pygame.Surface) -> str:
     while True:
         screen.fill("purple")
 
-        title_font = pygame.font.Font(None, 72)
-        title = title_font.render("Chase & Collect", True, "yellow")
+        title = TEXT.render("Chase & Collect", 72, "yellow")
         title_rect = title.get_rect(center=(screen.get_width() / 2, 150))
         screen.blit(title, title_rect)
 
-        menu_font = pygame.font.Font(None, 48)
-
-        start_text = menu_font.render("Press ENTER to Start", True, "white")
+        start_text = TEXT.render("Press ENTER to Start", 48, "white")
         start_rect = start_text.get_rect(center=(screen.get_width() / 2, 300))
         screen.blit(start_text, start_rect)
 
-        load_color = "white" if os.path.exists(SAVE_FILE) else "gray"
-        load_text = menu_font.render("Press L to Load Game", True, load_color)
+        load_color = "white" if save_to_load() else "gray"
+        load_text = TEXT.render("Press L to Load Game", 48, load_color)
         load_rect = load_text.get_rect(center=(screen.get_width() / 2, 380))
         screen.blit(load_text, load_rect)
 
-        exit_text = menu_font.render("Press ESC to Exit", True, "white")
+        exit_text = TEXT.render("Press ESC to Exit", 48, "white")
         exit_rect = exit_text.get_rect(center=(screen.get_width() / 2, 460))
         screen.blit(exit_text, exit_rect)
 
-        hint_font = pygame.font.Font(None, 24)
-        hint = hint_font.render("Use mouse to control player | Collect food before the opponent!", True, "gray")
+        hint = TEXT.render("Use mouse to control player | Collect food before the opponent!", 24, "gray")
         hint_rect = hint.get_rect(center=(screen.get_width() / 2, 550))
         screen.blit(hint, hint_rect)
 
@@ -51,48 +116,79 @@ def welcome_screen(screen: pygame.Surface) -> str:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_RETURN:
                     return "start"
-                if event.key == pygame.K_l and os.path.exists(SAVE_FILE):
+                if event.key == pygame.K_l and save_to_load():
                     return "load"
                 if event.key == pygame.K_ESCAPE:
                     return "exit"
 
         clock.tick(60)
 
-def draw(game: Game, player: Player, opponent: Opponent, food_list: FoodList, winner: Optional[str] = None, message: Optional[str] = None):
-    game.screen.fill(game.background)
-
-    for s in [player, opponent]:
-        pygame.draw.circle(game.screen, s.color, pygame.Vector2(s.x, s.y), s.size)
-    for f in food_list.food:
-        pygame.draw.circle(game.screen, "blue", pygame.Vector2(f.x, f.y), f.size)
-
-    font = pygame.font.Font(None, 36)
-
-    player_score = font.render(f"Player: {player.count}", True, "white")
-    opponent_score = font.render(f"Opponent: {opponent.count}", True, "white")
-    game.screen.blit(player_score, (10, 10))
-    game.screen.blit(opponent_score, (10, 50))
-
-    controls = pygame.font.Font(None, 24).render("Controls: Mouse | S=Save | L=Load | P=Pause | ESC/Q=Quit", True, "gray")
-    game.screen.blit(controls, (10, game.screen.get_height() - 30))
+def world_setup(screen_size: Tuple[int, int]) -> Tuple[Tuple[int, int], int]:
+    """Returns the world size and food count from WORLD and FOOD, defaulting to the window."""
+    if not WORLD:
+        return screen_size, int(FOOD or 100)
+    world = tuple(int(n) for n in WORLD.lower().split("x"))
+    density = 100 / (screen_size[0] * screen_size[1])
+    return world, int(FOOD or round(density * world[0] * world[1]))
+
+def draw(game: Game, player: Player, opponent: Opponent, food_list: FoodList, winner: Optional[str] = None, message: Optional[str] = None,
+         renderer: Optional[DirtyRectRenderer] = None, overlay: Optional[List[str]] = None, camera: Optional[Camera] = None,
+         rivals: Sequence[Opponent] = ()):
+    if renderer:
+        renderer.begin(game.screen)
+    else:
+        game.screen.fill(game.background)
+    drawn = []
+    left, top = (camera.x, camera.y) if camera else (0, 0)
+
+    for s in [player, opponent, *rivals]:
+        drawn.append(pygame.draw.circle(game.screen, s.color, pygame.Vector2(s.x - left, s.y - top), s.size))
+    # Only food the grid places near the view is drawn; the rest of the world is skipped.
+    store = food_list.food
+    rows = camera.visible(food_list.grid, len(store)) if camera else slice(None)
+    drawn.extend(FOOD_SPRITES.draw(game.screen, store.x[rows] - left, store.y[rows] - top, store.size[rows],
+                                   renderer is not None))
+
+    # Cached by string, so a score is only re-rendered when its count changes.
+    player_score = TEXT.render(f"Player: {player.count}", 36, "white")
+    opponent_score = TEXT.render(f"Opponent: {opponent.count}", 36, "white")
+    drawn.append(game.screen.blit(player_score, (10, 10)))
+    drawn.append(game.screen.blit(opponent_score, (10, 50)))
+    if rivals:
+        rivals_score = TEXT.render(f"Best rival: {max(r.count for r in rivals)}", 36, "white")
+        drawn.append(game.screen.blit(rivals_score, (10, 90)))
+
+    controls = TEXT.render("Controls: Mouse | S=Save | L=Load | P=Pause | F3=Profile | ESC/Q=Quit", 24, "gray")
+    drawn.append(game.screen.blit(controls, (10, game.screen.get_height() - 30)))
 
     if message:
-        msg_font = pygame.font.Font(None, 36)
-        msg_text = msg_font.render(message, True, "lime")
+        msg_text = TEXT.render(message, 36, "lime")
         msg_rect = msg_text.get_rect(center=(game.screen.get_width() / 2, 100))
-        game.screen.blit(msg_text, msg_rect)
+        drawn.append(game.screen.blit(msg_text, msg_rect))
+
+    if overlay:
+        for i, line in enumerate(overlay):
+            drawn.append(game.screen.blit(TEXT.render(line, 20, "white"), (game.screen.get_width() - 330, 10 + 18 * i)))
 
     if winner:
-        big_font = pygame.font.Font(None, 72)
-        text = big_font.render(f"{winner} Wins!", True, "yellow")
+        text = TEXT.render(f"{winner} Wins!", 72, "yellow")
         rect = text.get_rect(center=(game.screen.get_width() / 2, game.screen.get_height() / 2))
-        game.screen.blit(text, rect)
+        drawn.append(game.screen.blit(text, rect))
 
-        restart = font.render("R=Restart | Q=Quit | M=Menu", True, "white")
+        restart = TEXT.render("R=Restart | Q=Quit | M=Menu", 36, "white")
         restart_rect = restart.get_rect(center=(game.screen.get_width() / 2, game.screen.get_height() / 2 + 50))
-        game.screen.blit(restart, restart_rect)
+        drawn.append(game.screen.blit(restart, restart_rect))
 
-    pygame.display.flip()
+    if renderer:
+        renderer.end(game.screen, drawn)
+    else:
+        pygame.display.flip()
+
+def end_session(recording: Optional[Recording]) -> None:
+    """Finish pending saves and write the game's recording, if RECORD is set."""
+    AUTOSAVE.close()
+    if recording and RECORD_FILE:
+        recording.save(RECORD_FILE)
 
 def main():
     pygame.init()
@@ -113,112 +209,157 @@ def main():
         deltaT     = 0,
     )
 
-    player = Player(
-        x     = 200,
-        y     = game.screen.get_height() / 2,
-        size  = 40,
-        speed = 300,
-        color = "red"
-    )
-
-    opponent = Opponent(
-        x     = game.screen.get_width() - 200,
-        y     = game.screen.get_height() / 2,
-        size  = 40,
-        speed = 150,
-        color = "green"
-    )
-
-    food_list = FoodList([])
-    food_list.populate(100, (game.screen.get_width(), game.screen.get_height()))
+    screen_size = (game.screen.get_width(), game.screen.get_height())
+    world, food = world_setup(screen_size)
+    seed = int.from_bytes(os.urandom(4), "little")
+    # Every step's mouse position is kept while recording, so only record when it will be written.
+    recording = None
+    if RECORD_FILE:
+        recording = Recording(
+            seed           = seed,
+            food           = food,
+            bounds         = world,
+            deltaT         = 1 / SIM_HZ,
+            rivals         = RIVALS,
+        )
+        sim = recording.start()
+    else:
+        sim = new_simulation(food, world, seed=seed, rivals=RIVALS)
+    player, opponent, food_list = sim.player, sim.opponent, sim.food_list
+    if STRATEGY == "anytime":
+        opponent.planner = AnytimeSearch(slice_us=STRATEGY_BUDGET_US)
+    elif STRATEGY:
+        opponent.planner = Planner(STRATEGY, STRATEGY_BUDGET_US)
+    if STRATEGY:
+        recording = None  # Fallbacks depend on timing, so the match would not replay exactly.
+
+    if choice == "load" and save_to_load():
+        sim.restore(load_game(save_to_load()))
+        recording = None  # A loaded game did not start from a seed, so it cannot be replayed.
+    # A save brings back the size of the world it was made in, whatever WORLD says now.
+    AUTOSAVE.bounds = sim.bounds
 
-    if choice == "load" and os.path.exists(SAVE_FILE):
-        state = load_game(SAVE_FILE)
-        player.x, player.y = state["player"]["x"], state["player"]["y"]
-        player.size, player.count = state["player"]["size"], state["player"]["count"]
-        opponent.x, opponent.y = state["opponent"]["x"], state["opponent"]["y"]
-        opponent.size, opponent.count = state["opponent"]["size"], state["opponent"]["count"]
-        food_list.food = [Food(x=f["x"], y=f["y"], size=f["size"]) for f in state["food"]]
-
-    winner = None
     message = None
     message_timer = 0
     paused = False
-
-    screen_w, screen_h = game.screen.get_width(), game.screen.get_height()
+    renderer = DirtyRectRenderer(game.background) if DIRTY_RECTS else None
+    timestep = FixedTimestep(step=1 / SIM_HZ)
+    journal = Journal(SAVE_FILE, writer=AUTOSAVE, bounds=sim.bounds) if SAVE_JOURNAL else None
+    camera = Camera(screen_size, sim.bounds)
+    camera.follow(player)
+    profiler = None
+    overlay = None
 
     while game.running:
+        if profiler:
+            profiler.begin_frame(len(food_list.food))
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 game.running = False
+                end_session(recording)
                 pygame.quit()
                 return
             if event.type == pygame.KEYDOWN:
-                if winner:
+                if recording:
+                    recording.key(event.key)
+                if sim.winner:
                     if event.key == pygame.K_r:
+                        end_session(recording)
                         main()
                         return
                     if event.key == pygame.K_q:
                         game.running = False
+                        end_session(recording)
                         pygame.quit()
                         return
                     if event.key == pygame.K_m:
+                        end_session(recording)
                         main()
                         return
                 if event.key == pygame.K_ESCAPE or event.key == pygame.K_q:
                     game.running = False
+                    end_session(recording)
                     pygame.quit()
                     return
                 if event.key == pygame.K_p:
                     paused = not paused
+                if event.key == pygame.K_F3:
+                    profiler = None if profiler else FrameProfiler()
+                    overlay = None
+                    sim.profiler = profiler
+                if event.key == pygame.K_F4 and profiler:
+                    profiler.write_csv(PROFILE_CSV)
+                    message = f"Profile written to {PROFILE_CSV}"
+                    message_timer = 120
                 if event.key == pygame.K_s:
-                    save_game(SAVE_FILE, player, opponent, food_list)
-                    message = "Game Saved!"
+                    if journal:
+                        saved = journal.ready()
+                        if saved:
+                            journal.checkpoint(player, opponent, food_list, sim.rivals)
+                    else:
+                        saved = AUTOSAVE.save(SAVE_FILE, player, opponent, food_list, sim.rivals)
+                    message = "Game Saved!" if saved else "Still saving..."
                     message_timer = 120
-                if event.key == pygame.K_l and os.path.exists(SAVE_FILE):
-                    state = load_game(SAVE_FILE)
-                    player.x, player.y = state["player"]["x"], state["player"]["y"]
-                    player.size, player.count = state["player"]["size"], state["player"]["count"]
-                    opponent.x, opponent.y = state["opponent"]["x"], state["opponent"]["y"]
-                    opponent.size, opponent.count = state["opponent"]["size"], state["opponent"]["count"]
-                    food_list.food = [Food(x=f["x"], y=f["y"], size=f["size"]) for f in state["food"]]
-                    winner = None
+                if event.key == pygame.K_l and save_to_load():
+                    AUTOSAVE.flush()
+                    sim.restore(load_game(save_to_load()))
+                    recording = None
+                    AUTOSAVE.bounds = sim.bounds
+                    if journal:
+                        journal.bounds = sim.bounds
+                    camera = Camera(screen_size, sim.bounds)
+                    camera.follow(player)
                     message = "Game Loaded!"
                     message_timer = 120
 
+        # Saves are written on the worker, so a failure shows up a frame or more after "Game Saved!".
+        error = AUTOSAVE.take_error()
+        if error:
+            message = f"Save failed: {error}"
+            message_timer = 180
+
+        if profiler:
+            profiler.lap("events")
+
         if message_timer > 0:
             message_timer -= 1
         else:
             message = None
 
         game.tick()
-
-        if not winner and not paused:
-            player.move_to(pygame.mouse.get_pos())
-            player.x = max(player.size, min(screen_w - player.size, player.x))
-            player.y = max(player.size, min(screen_h - player.size, player.y))
-
-            opponent.move(food_list, (player.x, player.y), game.deltaT)
-            opponent.x = max(opponent.size, min(screen_w - opponent.size, opponent.x))
-            opponent.y = max(opponent.size, min(screen_h - opponent.size, opponent.y))
-
-            food_list.eat(player)
-            food_list.eat(opponent)
-
-            food_list.move((screen_w, screen_h))
-
-            if not food_list.food:
-                if player.count > opponent.count:
-                    winner = "Player"
-                elif opponent.count > player.count:
-                    winner = "Opponent"
-                else:
-                    winner = "Tie"
+        if profiler:
+            profiler.skip()
+
+        if not sim.winner and not paused:
+            pointer = camera.to_world(pygame.mouse.get_pos())
+            for i in range(timestep.advance(game.deltaT)):
+                # In a scrolling world the player heads towards the mouse instead of jumping to it.
+                mouse = steer(player, pointer, player.speed, timestep.step) if camera.scrolls() else pointer
+                if (recording.step(sim, mouse) if recording else sim.step(mouse, timestep.step)):
+                    break
+            camera.follow(player)
+            if not journal:
+                AUTOSAVE.tick(game.deltaT, player, opponent, food_list, sim.rivals)
+            elif AUTOSAVE.due(game.deltaT) and journal.ready():
+                # Autosaves append what changed to the journal, like S does.
+                journal.checkpoint(player, opponent, food_list, sim.rivals)
+        else:
+            timestep.reset()
 
         if paused:
             message = "PAUSED - Press P to resume"
 
-        draw(game, player, opponent, food_list, winner, message)
+        if profiler and profiler.frames % PROFILE_REFRESH == 0:
+            overlay = profiler.summary()
+
+        if timestep.should_render():
+            if profiler:
+                profiler.skip()
+            draw(game, player, opponent, food_list, sim.winner, message, renderer, overlay, camera, sim.rivals)
+            if profiler:
+                profiler.lap("draw")
 
 if __name__ == "__main__":
+    if STRATEGY and STRATEGY not in STRATEGY_NAMES:
+        sys.exit(f"Unknown STRATEGY={STRATEGY}; choose one of: {', '.join(STRATEGY_NAMES)}")
     main()
@@ -1,16 +1,224 @@
 """Save and load game state to file."""
 import json
-from typing import Dict, Any
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Any, Optional, Sequence, Tuple
+import numpy as np
+from food import FoodStore
 
-def save_game(filepath: str, player, opponent, food_list) -> None:
+# Binary saves start with this header: magic, format version, length of the JSON
+# that follows (the characters, rivals, next food id and journal generation) and the
+# number of food. The food comes last: int64 ids, then packed float32 x, y and
+# size arrays, all little-endian. Version 1 saves have no ids.
+MAGIC = b"LB7S"
+VERSION = 2
+HEADER = struct.Struct("<4sHxxIQ")
+ID_DTYPE = np.dtype("<i8")
+FOOD_DTYPE = np.dtype("<f4")
+
+# Journal lines are appended to a file next to the snapshot they follow.
+JOURNAL_SUFFIX = ".journal"
+
+def character_state(chr) -> Dict[str, Any]:
+    return {"x": chr.x, "y": chr.y, "size": chr.size, "speed": chr.speed, "color": chr.color, "count": chr.count}
+
+def opponent_state(opponent) -> Dict[str, Any]:
+    return dict(character_state(opponent), target_id=opponent.target_id)
+
+def snapshot(player, opponent, food_list, bounds: Optional[Tuple[int, int]] = None,
+             rivals: Sequence = ()) -> Dict[str, Any]:
+    """Copy everything a save needs, so it can be written later while the game moves on."""
+    store = food_list.food
     state = {
-        "player": {"x": player.x, "y": player.y, "size": player.size, "speed": player.speed, "color": player.color, "count": player.count},
-        "opponent": {"x": opponent.x, "y": opponent.y, "size": opponent.size, "speed": opponent.speed, "color": opponent.color, "count": opponent.count},
-        "food": [{"x": f.x, "y": f.y, "size": f.size} for f in food_list.food]
+        "player": character_state(player),
+        "opponent": opponent_state(opponent),
+        "rivals": [opponent_state(rival) for rival in rivals],
+        "next_id": store.next_id,
+        "food": (store.ids.copy(), store.x.copy(), store.y.copy(), store.size.copy())
     }
+    if bounds:
+        state["bounds"] = list(bounds)
+    return state
+
+def write_snapshot(filepath: str, state: Dict[str, Any]) -> None:
+    """Write a binary save of a snapshot, atomically: readers see the old file or the whole new one."""
+    ids, x, y, size = state["food"]
+    meta = json.dumps({k: v for k, v in state.items() if k != "food"}).encode()
+    meta += b" " * (-(HEADER.size + len(meta)) % ID_DTYPE.itemsize)
+    partial = filepath + ".tmp"
+    with open(partial, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(meta), len(x)))
+        f.write(meta)
+        f.write(ids.astype(ID_DTYPE).tobytes())
+        for column in (x, y, size):
+            f.write(column.astype(FOOD_DTYPE).tobytes())
+    os.replace(partial, filepath)
+
+def save_game(filepath: str, player, opponent, food_list, bounds: Optional[Tuple[int, int]] = None,
+              rivals: Sequence = ()) -> None:
+    """Write a binary snapshot: the header, the characters and world bounds as JSON, then the food arrays."""
+    write_snapshot(filepath, snapshot(player, opponent, food_list, bounds, rivals))
+
+def save_game_json(filepath: str, player, opponent, food_list, bounds: Optional[Tuple[int, int]] = None,
+                   rivals: Sequence = ()) -> None:
+    """Write the older JSON format, one dict per food. load_game reads both."""
+    store = food_list.food
+    state = {
+        "player": character_state(player),
+        "opponent": opponent_state(opponent),
+        "rivals": [opponent_state(rival) for rival in rivals],
+        "next_id": store.next_id,
+        "food": [{"id": int(food_id), "x": f.x, "y": f.y, "size": f.size} for food_id, f in zip(store.ids, store)]
+    }
+    if bounds:
+        state["bounds"] = list(bounds)
     with open(filepath, 'w') as f:
         json.dump(state, f)
 
+def load_snapshot(filepath: str) -> Dict[str, Any]:
+    """Read a binary save through mmap, straight into a FoodStore."""
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        magic, version, meta_len, count = HEADER.unpack_from(data)
+        if version > VERSION:
+            raise ValueError(f"{filepath} is save format {version}, newer than {VERSION}")
+        state = json.loads(data[HEADER.size:HEADER.size + meta_len])
+        offset = HEADER.size + meta_len
+        store = FoodStore()
+        if version >= 2:
+            view = np.frombuffer(data, ID_DTYPE, count, offset)
+            store.ids = view.astype(np.int64)
+            del view  # The mmap cannot close while a view into it is alive.
+            offset += count * ID_DTYPE.itemsize
+        else:
+            store.ids = np.arange(count, dtype=np.int64)
+        store.next_id = state.pop("next_id", count)
+        columns = []
+        for i in range(3):
+            view = np.frombuffer(data, FOOD_DTYPE, count, offset + i * count * FOOD_DTYPE.itemsize)
+            columns.append(view.astype(np.float64))
+            del view
+        store.x, store.y, store.size = columns
+    state["food"] = store
+    return state
+
+def replay_journal(filepath: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply the journal entries written since the snapshot in state, if any."""
+    path = filepath + JOURNAL_SUFFIX
+    if not os.path.exists(path):
+        return state
+    generation = state.get("generation", 0)
+    eaten = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # A torn last line from a crash mid-append.
+            if entry["generation"] != generation:
+                continue
+            state["player"], state["opponent"] = entry["player"], entry["opponent"]
+            state["rivals"] = entry.get("rivals", state.get("rivals", []))
+            eaten.extend(entry["eaten"])
+    store = state["food"]
+    if eaten:
+        store.keep(~np.isin(store.ids, eaten))
+    return state
+
 def load_game(filepath: str) -> Dict[str, Any]:
-    with open(filepath, 'r') as f:
-        return json.load(f)
+    """Read a save of either format, plus its journal. Binary saves give their food as a FoodStore."""
+    with open(filepath, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            f.seek(0)
+            return json.load(f)
+    return replay_journal(filepath, load_snapshot(filepath))
+
+@dataclass
+class Journal:
+    """
+    Checkpoints a game cheaply: each checkpoint appends one line holding the ids of
+    the food eaten since the last one and all the characters, instead of rewriting the
+    whole snapshot. Every compact_every checkpoints, or when food was added or the
+    store replaced (e.g. by loading), a full snapshot is written instead and the
+    journal starts over. Food drift is not
+    journaled, so surviving food loads where the last snapshot put it. With a writer
+    (an autosave.Autosave), only the copying happens on the caller's thread: the
+    writes run on the writer's worker in order, so a line appended after a snapshot
+    is never lost to that snapshot truncating the journal. Snapshots record bounds,
+    the size of the world, when it is set.
+    """
+    path: str
+    compact_every: int = 100
+    generation: int = 0
+    entries: int = 0
+    saved_next_id: int = -1
+    saved_ids: Optional[np.ndarray] = field(default=None, repr=False)
+    saved_store: Optional[FoodStore] = field(default=None, repr=False)
+    writer: Optional[Any] = field(default=None, repr=False)
+    bounds: Optional[Tuple[int, int]] = None
+
+    def run(self, job: Callable[[], None]) -> None:
+        """Run a write now, or queue it on the writer, waiting for room if it is behind."""
+        if self.writer is None:
+            job()
+        else:
+            self.writer.queue(job, wait=True)
+
+
+    def ready(self) -> bool:
+        """
+        Purpose: Checks whether a checkpoint can be queued without waiting for the writer.
+
+        Examples:
+            Journal("savegame.bin").ready() -> True
+        """
+        return self.writer is None or not self.writer.busy()
+
+
+    def checkpoint(self, player, opponent, food_list, rivals: Sequence = ()) -> bool:
+        """
+        Purpose: Records the game at path. Returns True if a full snapshot was written,
+        False if only a journal line was appended.
+
+        Examples:
+            journal = Journal("savegame.bin")
+            journal.checkpoint(player, opponent, food_list) -> True (the first snapshot)
+            journal.checkpoint(player, opponent, food_list) -> False
+        """
+        store = food_list.food
+        replaced = store is not self.saved_store or store.next_id != self.saved_next_id
+        if replaced or self.entries >= self.compact_every:
+            self.compact(player, opponent, food_list, rivals)
+            return True
+        # No food was added, so every saved id missing from the store was eaten.
+        eaten = self.saved_ids[~np.isin(self.saved_ids, store.ids, assume_unique=True)]
+        entry = {"generation": self.generation, "eaten": eaten.tolist(),
+                 "player": character_state(player), "opponent": opponent_state(opponent),
+                 "rivals": [opponent_state(rival) for rival in rivals]}
+        line = json.dumps(entry) + "\n"
+        def append() -> None:
+            with open(self.path + JOURNAL_SUFFIX, 'a') as f:
+                f.write(line)
+        self.run(append)
+        self.saved_ids = store.ids.copy()
+        self.entries += 1
+        return False
+
+
+    def compact(self, player, opponent, food_list, rivals: Sequence = ()) -> None:
+        """Write a full snapshot under a new generation, then empty the journal."""
+        # Time-based, so lines from an earlier game can never match a newer snapshot.
+        self.generation = time.time_ns()
+        state = snapshot(player, opponent, food_list, self.bounds, rivals)
+        state["generation"] = self.generation
+        def write() -> None:
+            write_snapshot(self.path, state)
+            # Lines left behind by a crash here carry the old generation and are skipped.
+            open(self.path + JOURNAL_SUFFIX, 'w').close()
+        self.run(write)
+        self.saved_ids = food_list.food.ids.copy()
+        self.saved_next_id = food_list.food.next_id
+        self.saved_store = food_list.food
+        self.entries = 0
@@ -0,0 +1,202 @@
+"""Headless game simulation: the rules of a match with no pygame dependency."""
+import math
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from player import Player
+from opponent import Opponent
+from food import Food, FoodList, FoodStore
+from density import CLUSTER_TOLERANCE
+from rng import FoodRandom
+from profiler import FrameProfiler
+from lod import DriftLOD, needs_lod
+from swarm import TargetingService
+
+Mouse = Tuple[float, float]
+
+@dataclass
+class Simulation:
+    """
+    One match between a Player and an Opponent over a FoodList, stepped by inputs.
+    Any rivals join the opponent's side; with them, all the opponents share one
+    TargetingService. Each step's phases are timed into profiler when one is set.
+    """
+    player: Player
+    opponent: Opponent
+    food_list: FoodList
+    bounds: Tuple[int, int] = (1280, 720)
+    winner: Optional[str] = None
+    steps: int = 0
+    profiler: Optional[FrameProfiler] = None
+    rivals: List[Opponent] = field(default_factory=list)
+    targeting: TargetingService = field(default_factory=TargetingService)
+
+    def step(self, mouse: Mouse, deltaT: float = 1/60) -> Optional[str]:
+        """
+        Purpose: Advances the match by one fixed step of deltaT seconds, with the
+        player following the mouse. Returns the winner once all the food is gone,
+        otherwise None.
+
+        Examples:
+            sim = new_simulation(0)
+            sim.step((0, 0)) -> "Tie"
+        """
+        player, opponent, food_list, profiler = self.player, self.opponent, self.food_list, self.profiler
+        screen_w, screen_h = self.bounds
+        player.move_to(mouse)
+        player.x = max(player.size, min(screen_w - player.size, player.x))
+        player.y = max(player.size, min(screen_h - player.size, player.y))
+
+        opponents = [opponent] + self.rivals
+        if self.rivals:
+            self.targeting.move(opponents, food_list, (player.x, player.y), deltaT, self.bounds)
+        else:
+            opponent.move(food_list, (player.x, player.y), deltaT)
+            opponent.x = max(opponent.size, min(screen_w - opponent.size, opponent.x))
+            opponent.y = max(opponent.size, min(screen_h - opponent.size, opponent.y))
+        if profiler:
+            profiler.lap("opponent")
+
+        food_list.eat_all([player] + opponents)
+        if profiler:
+            profiler.lap("eat")
+
+        food_list.move(self.bounds, deltaT, [player] + opponents)
+        if profiler:
+            profiler.lap("move")
+        self.steps += 1
+
+        if not food_list.food:
+            best = max(chr.count for chr in opponents)
+            if player.count > best:
+                self.winner = "Player"
+            elif best > player.count:
+                self.winner = "Opponent"
+            else:
+                self.winner = "Tie"
+        return self.winner
+
+
+    def run(self, inputs: Callable[["Simulation"], Mouse], deltaT: float = 1/60,
+            max_steps: int = 100000) -> Optional[str]:
+        """
+        Purpose: Steps the match until someone wins or max_steps have run, asking
+        inputs for the mouse position before each step. Returns the winner, or None
+        if the match timed out.
+
+        Examples:
+            new_simulation(100).run(chase_nearest_food) -> "Player", "Opponent" or "Tie"
+        """
+        while self.winner is None and self.steps < max_steps:
+            self.step(inputs(self), deltaT)
+        return self.winner
+
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """
+        Purpose: Replaces the characters' positions, sizes and counts and all the food
+        with those in a saved state (see save_state.load_game). The food may be a list
+        of dicts, as in JSON saves, or a FoodStore, as binary saves load it. A save that
+        records its world's bounds brings them back too, so its food stays where it was,
+        and one that records rivals replaces them. The swarm's claims from before the
+        load are dropped: the restored opponents' saved targets are its claims now.
+
+        Examples:
+            sim.restore(load_game("savegame.json")) -> sim matches the saved game
+        """
+        for chr, saved in [(self.player, state["player"]), (self.opponent, state["opponent"])]:
+            chr.x, chr.y = saved["x"], saved["y"]
+            chr.size, chr.count = saved["size"], saved["count"]
+        # Targets are food ids, which saves keep, so the opponent carries on chasing the same food.
+        self.opponent.target_id = state["opponent"].get("target_id", -1)
+        if "rivals" in state:
+            self.rivals = [Opponent(x=saved["x"], y=saved["y"], size=saved["size"], speed=saved["speed"],
+                                    color=saved["color"], count=saved["count"], target_id=saved.get("target_id", -1))
+                           for saved in state["rivals"]]
+        self.targeting = TargetingService()
+        if self.rivals:
+            self.targeting.targets = np.array([chr.target_id for chr in [self.opponent] + self.rivals], dtype=np.int64)
+        food = state["food"]
+        if not isinstance(food, FoodStore):
+            saved = food
+            food = FoodStore([Food(x=f["x"], y=f["y"], size=f["size"]) for f in saved])
+            if saved and "id" in saved[0]:
+                food.ids = np.array([f["id"] for f in saved], dtype=np.int64)
+                food.next_id = state.get("next_id", int(food.ids[-1]) + 1)
+        if "bounds" in state:
+            self.bounds = (int(state["bounds"][0]), int(state["bounds"][1]))
+            self.food_list.lod = DriftLOD() if needs_lod(self.bounds) else None
+        self.food_list.food = food
+        self.food_list.index()
+        if self.food_list.clusters:
+            self.food_list.track_clusters(CLUSTER_TOLERANCE)
+        self.winner = None
+
+
+def new_simulation(food: int = 100, bounds: Tuple[int, int] = (1280, 720),
+                   opponent_speed: float = 150, seed: Optional[int] = None, rivals: int = 0) -> Simulation:
+    """
+    Purpose: Sets up a fresh match the way run.main does: the player on the left, the
+    opponent on the right and food spread randomly over the bounds. Matches with the
+    same seed spawn and drift their food identically; no seed gives a fresh game.
+    Worlds several screens large drift distant food in batches (see lod.needs_lod).
+    Rivals start on a grid over the right half of the bounds, and share a ClusterField.
+
+    Examples:
+        new_simulation(5).food_list.food -> 5 food within 1280x720
+        new_simulation(5).opponent.x -> 1080
+        len(new_simulation(5, rivals=9).rivals) -> 9
+        list(new_simulation(5, seed=1).food_list.food) == list(new_simulation(5, seed=1).food_list.food) -> True
+    """
+    player = Player(
+        x     = 200,
+        y     = bounds[1] / 2,
+        size  = 40,
+        speed = 300,
+        color = "red"
+    )
+
+    opponent = Opponent(
+        x     = bounds[0] - 200,
+        y     = bounds[1] / 2,
+        size  = 40,
+        speed = opponent_speed,
+        color = "green"
+    )
+
+    food_list = FoodList([], rng=FoodRandom(seed), lod=DriftLOD() if needs_lod(bounds) else None)
+    food_list.index()
+    if rivals:
+        # Drift re-scores most of the field every few steps, which only pays for itself
+        # when a swarm reads it; a lone opponent scores its few candidates on the grid.
+        food_list.track_clusters(CLUSTER_TOLERANCE)
+    food_list.populate(food, bounds)
+    columns = math.ceil(math.sqrt(rivals))
+    rows = math.ceil(rivals / columns) if rivals else 0
+    rival_list = [Opponent(
+        x     = bounds[0] / 2 + (i % columns + 0.5) * bounds[0] / 2 / columns,
+        y     = (i // columns + 0.5) * bounds[1] / rows,
+        size  = 20,
+        speed = opponent_speed,
+        color = "darkgreen"
+    ) for i in range(rivals)]
+    return Simulation(player, opponent, food_list, bounds, rivals=rival_list)
+
+
+def chase_nearest_food(sim: Simulation, deltaT: float = 1/60) -> Mouse:
+    """
+    Purpose: A stand-in for a human: moves the mouse from the player towards the
+    nearest food at the player's speed, so headless matches have a fair opponent.
+
+    Examples:
+        sim = Simulation(Player(0, 0, 10, 60, "red"), opponent, FoodList([Food(100, 0, 10)]))
+        chase_nearest_food(sim) -> (1.0, 0.0)
+    """
+    player = sim.player
+    store = sim.food_list.food
+    if not store:
+        return (player.x, player.y)
+    nearest = store[int(((store.x - player.x)**2 + (store.y - player.y)**2).argmin())]
+    direction = player.direction(nearest)
+    step = player.speed * deltaT
+    return (player.x + direction[0] * step, player.y + direction[1] * step)
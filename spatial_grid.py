@@ -0,0 +1,314 @@
+"""A uniform grid that buckets food by position for fast local lookups."""
+import math
+from dataclasses import dataclass, field
+from typing import List, Tuple
+import numpy as np
+
+Cell = Tuple[int, int]
+
+# Cell (cx, cy) is packed into one int64 key so that a row of cells sorts contiguously.
+ROW = 1 << 32
+OFFSET = 1 << 31
+
+def stencil(reach: int, half: bool = False) -> List[Cell]:
+    """
+    Purpose: Lists the cell offsets within reach cells of (0, 0). With half=True only
+    (0, 0) and the offsets "after" it are listed, so that visiting the stencil from
+    every cell covers each pair of cells once.
+
+    Examples:
+        len(stencil(1)) -> 9
+        stencil(1, half=True) -> [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]
+    """
+    if not half:
+        return [(dx, dy) for dx in range(-reach, reach + 1) for dy in range(-reach, reach + 1)]
+    return ([(0, dy) for dy in range(0, reach + 1)] +
+            [(dx, dy) for dx in range(1, reach + 1) for dy in range(-reach, reach + 1)])
+
+def empty_indices() -> np.ndarray:
+    return np.empty(0, dtype=np.int64)
+
+@dataclass
+class SpatialGrid:
+    """
+    Buckets items into square cells so collision checks only look nearby.
+    Items are indices into parallel x/y arrays (see FoodStore), kept sorted by
+    cell so that each row of cells is one contiguous slice of `order`. The table
+    of occupied cells is built with the grid; once items move, neighbour lookups
+    search the sorted keys instead. occupancy bounds the items in any one cell: it is
+    exact after a build and only ever raised as items move in, so reading it is free.
+    """
+    cell_size: float
+    keys: np.ndarray = field(default_factory=empty_indices)
+    order: np.ndarray = field(default_factory=empty_indices)
+    sorted_keys: np.ndarray = field(default_factory=empty_indices)
+    cells: np.ndarray = field(default_factory=empty_indices)
+    starts: np.ndarray = field(default_factory=lambda: np.zeros(1, dtype=np.int64))
+    max_size: float = 0
+    indexed: bool = True
+    occupancy: int = 0
+
+    def cell(self, x: float, y: float) -> Cell:
+        """
+        Purpose: Finds the cell that contains the point (x, y).
+
+        Examples:
+            grid = SpatialGrid(cell_size=80)
+            grid.cell(10, 10) -> (0, 0)
+            grid.cell(170, -5) -> (2, -1)
+        """
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+
+    def index_cells(self) -> None:
+        """
+        Purpose: Lists the occupied cells in key order, and where each one's run of
+        items starts in `order`, so neighbour lookups need one search per cell.
+
+        Examples:
+            grid = SpatialGrid(cell_size=100)
+            grid.build(np.array([0.0, 50.0, 900.0]), np.array([0.0, 0.0, 0.0]), np.full(3, 10.0))
+            grid.starts -> array([0, 2, 3])
+        """
+        self.indexed = True
+        if len(self.sorted_keys) == 0:
+            self.cells = empty_indices()
+            self.starts = np.zeros(1, dtype=np.int64)
+            return
+        edges = np.flatnonzero(np.diff(self.sorted_keys)) + 1
+        self.cells = self.sorted_keys[np.concatenate(([0], edges))]
+        self.starts = np.concatenate(([0], edges, [len(self.sorted_keys)]))
+
+
+    def cell_keys(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Purpose: Packs the cell of every point into one sortable int64 key.
+
+        Examples:
+            grid = SpatialGrid(cell_size=80)
+            grid.cell_keys(np.array([10.0]), np.array([10.0])) -> array([OFFSET])
+        """
+        cx = np.floor(x / self.cell_size).astype(np.int64)
+        cy = np.floor(y / self.cell_size).astype(np.int64)
+        return cx * ROW + (cy + OFFSET)
+
+
+    def build(self, x: np.ndarray, y: np.ndarray, size: np.ndarray) -> None:
+        """
+        Purpose: Buckets every item from scratch.
+
+        Examples:
+            grid = SpatialGrid(cell_size=80)
+            grid.build(np.array([10.0, 500.0]), np.array([10.0, 500.0]), np.array([10.0, 10.0]))
+            grid.query(0, 0, 40) -> array([0])
+        """
+        self.keys = self.cell_keys(x, y)
+        self.order = np.argsort(self.keys, kind="stable")
+        self.sorted_keys = self.keys[self.order]
+        self.index_cells()
+        self.occupancy = int(np.diff(self.starts).max()) if len(self.cells) else 0
+        self.max_size = float(size.max()) if len(size) else 0
+
+
+    def update(self, x: np.ndarray, y: np.ndarray) -> None:
+        """
+        Purpose: Rebuckets items after they have moved. Food drifts so little that
+        few items change cell, so the re-sort runs over almost-sorted keys.
+
+        Examples:
+            grid.build(np.array([79.0]), np.array([10.0]), np.array([10.0]))
+            grid.update(np.array([81.0]), np.array([10.0])) -> item 0 is now in cell (1, 0)
+        """
+        keys = self.cell_keys(x, y)
+        changed = keys != self.keys
+        if not changed.any():
+            return
+        self.keys = keys
+        self.order = self.order[np.argsort(keys[self.order], kind="stable")]
+        self.sorted_keys = keys[self.order]
+        self.indexed = False
+        self.fill(keys[changed])
+
+
+    def update_rows(self, rows: np.ndarray, x: np.ndarray, y: np.ndarray) -> None:
+        """
+        Purpose: Rebuckets only the given items, which have moved to (x, y). Items
+        that changed cell are taken out of `order` and merged back in at their new
+        cells, so nothing is re-sorted and the other items' keys are not recomputed.
+
+        Examples:
+            grid.build(np.array([10.0, 79.0]), np.array([10.0, 10.0]), np.full(2, 10.0))
+            grid.update_rows(np.array([1]), np.array([81.0]), np.array([10.0])) -> item 1 is now in cell (1, 0)
+        """
+        keys = self.cell_keys(x, y)
+        changed = keys != self.keys[rows]
+        if not changed.any():
+            return
+        moved, moved_keys = rows[changed], keys[changed]
+        self.keys[moved] = moved_keys
+        stay = np.ones(len(self.keys), dtype=bool)
+        stay[moved] = False
+        stay = stay[self.order]
+        by_key = np.argsort(moved_keys, kind="stable")
+        moved, moved_keys = moved[by_key], moved_keys[by_key]
+        sorted_keys = self.sorted_keys[stay]
+        at = np.searchsorted(sorted_keys, moved_keys, "right")
+        self.order = np.insert(self.order[stay], at, moved)
+        self.sorted_keys = np.insert(sorted_keys, at, moved_keys)
+        self.indexed = False
+        self.fill(moved_keys)
+
+
+    def fill(self, keys: np.ndarray) -> None:
+        """
+        Purpose: Raises occupancy to the fullest of the given cells, which items have
+        just moved into. Cells items left can only have emptied, so are not looked at.
+
+        Examples:
+            grid.build(np.array([10.0, 90.0]), np.array([10.0, 10.0]), np.full(2, 10.0))
+            grid.update_rows(np.array([1]), np.array([20.0]), np.array([10.0])) -> fills cell (0, 0); grid.occupancy == 2
+        """
+        keys = np.unique(keys)
+        counts = np.searchsorted(self.sorted_keys, keys, "right") - np.searchsorted(self.sorted_keys, keys, "left")
+        self.occupancy = max(self.occupancy, int(counts.max()))
+
+
+    def remove(self, keep: np.ndarray) -> None:
+        """
+        Purpose: Drops the items where keep is False and renumbers the rest, mirroring
+        a compaction of the underlying arrays.
+
+        Examples:
+            grid.build(np.array([10.0, 500.0]), np.array([10.0, 500.0]), np.array([10.0, 10.0]))
+            grid.remove(np.array([False, True]))
+            grid.query(500, 500, 40) -> array([0])
+        """
+        renumber = np.cumsum(keep) - 1
+        stay = keep[self.order]
+        self.order = renumber[self.order[stay]]
+        self.keys = self.keys[keep]
+        self.sorted_keys = self.sorted_keys[stay]
+        self.indexed = False
+
+
+    def query(self, x: float, y: float, radius: float) -> np.ndarray:
+        """
+        Purpose: Returns the index of every item that could touch a circle of the
+        given radius centred at (x, y). The result may include items that are just
+        out of reach; callers still run their exact hit test.
+
+        Examples:
+            grid = SpatialGrid(cell_size=80)
+            grid.build(np.array([10.0, 500.0]), np.array([10.0, 500.0]), np.array([10.0, 10.0]))
+            grid.query(0, 0, 40) -> array([0])
+        """
+        return self.query_rect(x - radius, y - radius, x + radius, y + radius)
+
+
+    def query_rect(self, left: float, top: float, right: float, bottom: float) -> np.ndarray:
+        """
+        Purpose: Returns the index of every item that could overlap the rectangle
+        from (left, top) to (right, bottom), e.g. to find what is on screen. Like
+        query, the result may include items just outside it.
+
+        Examples:
+            grid = SpatialGrid(cell_size=80)
+            grid.build(np.array([10.0, 500.0]), np.array([10.0, 500.0]), np.array([10.0, 10.0]))
+            grid.query_rect(400, 400, 1280, 720) -> array([1])
+        """
+        x0, y0 = self.cell(left - self.max_size, top - self.max_size)
+        x1, y1 = self.cell(right + self.max_size, bottom + self.max_size)
+        rows = np.arange(x0, x1 + 1, dtype=np.int64) * ROW + OFFSET
+        lo = np.searchsorted(self.sorted_keys, rows + y0, "left")
+        hi = np.searchsorted(self.sorted_keys, rows + y1, "right")
+        if len(rows) == 1:
+            return self.order[lo[0]:hi[0]]
+        return np.concatenate([self.order[a:b] for a, b in zip(lo, hi)])
+
+
+    def query_many(self, x: np.ndarray, y: np.ndarray, radius: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Purpose: Batched form of query for many circles at once. Returns (owners, items)
+        pairs: every item query would return for circle i is listed with owner i, with
+        owners in increasing order. Each circle's runs of cells are found in one search
+        and expanded into pairs without a Python loop over the circles.
+
+        Examples:
+            grid = SpatialGrid(cell_size=80)
+            grid.build(np.array([10.0, 500.0]), np.array([10.0, 500.0]), np.array([10.0, 10.0]))
+            grid.query_many(np.array([0.0, 500.0]), np.array([0.0, 500.0]), np.full(2, 40.0)) -> (array([0, 1]), array([0, 1]))
+        """
+        reach = radius + self.max_size
+        x0 = np.floor((x - reach) / self.cell_size).astype(np.int64)
+        x1 = np.floor((x + reach) / self.cell_size).astype(np.int64)
+        y0 = np.floor((y - reach) / self.cell_size).astype(np.int64)
+        y1 = np.floor((y + reach) / self.cell_size).astype(np.int64)
+        # One run of keys per column of cells each circle covers.
+        columns = x1 - x0 + 1
+        column_owner = np.repeat(np.arange(len(x)), columns)
+        first_column = np.cumsum(columns) - columns
+        column = x0[column_owner] + np.arange(len(column_owner)) - first_column[column_owner]
+        rows = column * ROW + OFFSET
+        lo = np.searchsorted(self.sorted_keys, rows + y0[column_owner], "left")
+        hi = np.searchsorted(self.sorted_keys, rows + y1[column_owner], "right")
+        lengths = hi - lo
+        start = np.cumsum(lengths) - lengths
+        at = np.arange(lengths.sum()) + np.repeat(lo - start, lengths)
+        return np.repeat(column_owner, lengths), self.order[at]
+
+
+    def max_occupancy(self) -> int:
+        """
+        Purpose: Bounds the items in the fullest cell, without looking at the cells:
+        exact after a build, and never below the true count as items move.
+
+        Examples:
+            grid = SpatialGrid(cell_size=100)
+            grid.build(np.array([0.0, 50.0, 900.0]), np.array([0.0, 0.0, 0.0]), np.full(3, 10.0))
+            grid.max_occupancy() -> 2
+        """
+        return self.occupancy
+
+
+    def neighbour_pairs(self, items: np.ndarray, radius: float,
+                        half: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Purpose: Batched form of query for many items at once. Lists every (item, other)
+        pair where other sits in a cell close enough to hold something within radius
+        of item. Every other within radius is included; pairs further apart may be too,
+        and each item is paired with itself. With half=True each unordered pair of
+        distinct items is listed only once, which halves the work for symmetric
+        measures such as distance.
+
+        Examples:
+            grid = SpatialGrid(cell_size=100)
+            grid.build(np.array([0.0, 50.0, 900.0]), np.array([0.0, 0.0, 0.0]), np.full(3, 10.0))
+            grid.neighbour_pairs(np.array([0]), 100) -> (array([0, 0]), array([0, 1]))
+            grid.neighbour_pairs(np.array([0, 1, 2]), 100, half=True) -> (array([0]), array([1]))
+        """
+        # Searching with sorted needles is several times faster than with random ones.
+        items = items[np.argsort(self.keys[items], kind="stable")]
+        item_keys = self.keys[items]
+        offsets = stencil(math.ceil(radius / self.cell_size), half)
+        shifts = np.array([dx * ROW + dy for dx, dy in offsets], dtype=np.int64)
+        target = (shifts[:, None] + item_keys[None, :]).ravel()
+        if self.indexed and len(self.cells):
+            at = np.minimum(np.searchsorted(self.cells, target), len(self.cells) - 1)
+            found = self.cells[at] == target
+            firsts = self.starts[at]
+            counts = np.where(found, self.starts[at + 1] - firsts, 0)
+        else:
+            # Items have moved since the cell table was built; rebuilding it would cost
+            # O(n), so each cell's run is found in the sorted keys instead.
+            firsts = np.searchsorted(self.sorted_keys, target, "left")
+            counts = np.searchsorted(self.sorted_keys, target, "right") - firsts
+        starts = np.cumsum(counts) - counts
+        step = np.arange(int(counts.sum())) - np.repeat(starts, counts)
+        i = np.repeat(np.tile(items, len(offsets)), counts)
+        j = self.order[np.repeat(firsts, counts) + step]
+        if half:
+            # Only the (0, 0) offset can pair an item with itself or list a pair twice.
+            same_cell = np.arange(len(i)) < counts[:len(items)].sum()
+            keep = ~same_cell | (i < j)
+            return i[keep], j[keep]
+        return i, j
@@ -0,0 +1,316 @@
+"""Opponent targeting strategies, registered by name and run under a time budget."""
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
+import density
+from character import Character
+from food import FoodList
+from spatial_grid import SpatialGrid
+
+Position = Tuple[float, float]
+
+# A strategy picks the row of the food a character should chase, or None if there is none.
+Strategy = Callable[[Character, FoodList, Optional[Position]], Optional[int]]
+
+# Radius of the nearest-food strategy's first look; doubled until it finds food.
+NEAREST_RADIUS = 160
+
+@dataclass
+class StrategySpec:
+    """A registered strategy and the cheaper one to use when it runs over budget."""
+    name: str
+    pick: Strategy
+    fallback: Optional[str] = None
+
+STRATEGIES: Dict[str, StrategySpec] = {}
+
+def register(name: str, fallback: Optional[str] = None) -> Callable[[Strategy], Strategy]:
+    """
+    Purpose: Registers the decorated strategy under name, falling back to the
+    strategy registered as fallback when over budget. Strategies without a
+    fallback always run.
+
+    Examples:
+        @register("random", fallback="nearest")
+        def pick_random(chr, food_list, player_pos): ... -> STRATEGIES["random"].fallback == "nearest"
+    """
+    def decorate(pick: Strategy) -> Strategy:
+        STRATEGIES[name] = StrategySpec(name, pick, fallback)
+        return pick
+    return decorate
+
+
+def distances(food_list: FoodList, x: float, y: float) -> np.ndarray:
+    store = food_list.food
+    return np.sqrt((store.x - x)**2 + (store.y - y)**2)
+
+
+@register("nearest")
+def pick_nearest(chr: Character, food_list: FoodList, player_pos: Optional[Position] = None) -> Optional[int]:
+    """
+    Purpose: Picks the food closest to chr. With a grid only nearby cells are
+    searched, so this is the cheapest strategy and the last fallback.
+
+    Examples:
+        pick_nearest(Opponent(x=0, y=0, ...), FoodList([Food(100, 0, 10), Food(10, 0, 10)])) -> 1
+        pick_nearest(Opponent(x=0, y=0, ...), FoodList([])) -> None
+    """
+    store = food_list.food
+    if not store:
+        return None
+    grid = food_list.grid
+    if grid is None:
+        return int(distances(food_list, chr.x, chr.y).argmin())
+    radius = NEAREST_RADIUS
+    rows = grid.query(chr.x, chr.y, radius)
+    while len(rows) == 0:
+        radius *= 2
+        rows = grid.query(chr.x, chr.y, radius)
+    d = np.sqrt((store.x[rows] - chr.x)**2 + (store.y[rows] - chr.y)**2)
+    if d.min() > radius:
+        # Food in a corner cell can be further than food just outside the square searched.
+        rows = grid.query(chr.x, chr.y, d.min())
+        d = np.sqrt((store.x[rows] - chr.x)**2 + (store.y[rows] - chr.y)**2)
+    return int(rows[d.argmin()])
+
+
+def nearby(chr: Character, food_list: FoodList, bound: float,
+           player_pos: Optional[Position] = None) -> np.ndarray:
+    """
+    Purpose: Returns, in row order, the rows of every food on food_list's grid that
+    pick_cluster could pick when no cluster bonus exceeds bound. The search widens
+    until it finds food, then once more to the distance at which even a bound bonus
+    cannot catch up with the best score found, so the rest of the world is skipped.
+
+    Examples:
+        nearby(Opponent(x=0, y=0, ...), indexed FoodList([Food(20, 0, 10), Food(3000, 0, 10)]), 0) -> array([0])
+    """
+    store, grid = food_list.food, food_list.grid
+    radius = NEAREST_RADIUS
+    rows = grid.query(chr.x, chr.y, radius)
+    while len(rows) == 0:
+        radius *= 2
+        rows = grid.query(chr.x, chr.y, radius)
+    dist_to_self = np.sqrt((store.x[rows] - chr.x)**2 + (store.y[rows] - chr.y)**2)
+    base = -dist_to_self
+    if player_pos:
+        dist_to_player = np.sqrt((store.x[rows] - player_pos[0])**2 + (store.y[rows] - player_pos[1])**2)
+        base = base - np.where(dist_to_player < dist_to_self, (dist_to_self - dist_to_player) * 2, 0)
+    # The penalty only lowers scores, so food further than this is out of reach.
+    limit = bound - base.max()
+    if limit > radius:
+        rows = grid.query(chr.x, chr.y, limit)
+    return np.sort(rows)
+
+
+@register("cluster", fallback="nearest")
+def pick_cluster(chr: Character, food_list: FoodList, player_pos: Optional[Position] = None) -> Optional[int]:
+    """
+    Purpose: Picks food by distance, cluster bonus and a penalty for food nearer
+    the player: the heuristic Opponent.find_best_food has always used.
+
+    Examples:
+        pick_cluster(Opponent(x=0, y=0, ...), FoodList([Food(100, 0, 10), Food(10, 0, 10)])) -> 1
+    """
+    store = food_list.food
+    if not store:
+        return None
+    clusters = food_list.clusters
+    grid = food_list.grid
+    if clusters:
+        # Read the persisted scores, patched only where food changed since last time.
+        clusters.sync(store.x, store.y, store.size)
+        bound = clusters.bound()
+    else:
+        if grid is None:
+            grid = SpatialGrid(density.CLUSTER_RADIUS)
+            grid.build(store.x, store.y, store.size)
+        bound = density.cluster_bonus_bound(grid)
+
+    # With the food's own grid, only food near enough to win is looked at; in a large
+    # world that is a small patch around chr.
+    rows = nearby(chr, food_list, bound, player_pos) if food_list.grid is not None else np.arange(len(store))
+    dist_to_self = np.sqrt((store.x[rows] - chr.x)**2 + (store.y[rows] - chr.y)**2)
+
+    player_penalty = np.zeros(len(rows))
+    if player_pos:
+        dist_to_player = np.sqrt((store.x[rows] - player_pos[0])**2 + (store.y[rows] - player_pos[1])**2)
+        player_penalty = np.where(dist_to_player < dist_to_self, (dist_to_self - dist_to_player) * 2, 0)
+
+    base = -dist_to_self - player_penalty
+    # The cluster bonus is between 0 and a bound, so only food whose score without
+    # the bonus is within that bound of the best such score can win.
+    candidates = np.flatnonzero(base + bound >= base.max())
+    if clusters:
+        cluster_bonus = clusters.bonus[rows[candidates]]
+    else:
+        cluster_bonus = density.cluster_bonus(store.x, store.y, store.size, grid, rows[candidates])
+
+    score = -dist_to_self[candidates] + cluster_bonus - player_penalty[candidates]
+    return int(rows[candidates[np.argmax(score)]])
+
+
+@register("intercept", fallback="nearest")
+def pick_intercept(chr: Character, food_list: FoodList, player_pos: Optional[Position] = None) -> Optional[int]:
+    """
+    Purpose: Heads for the food the player is closest to, taking it first if chr
+    is nearer to it; otherwise picks the nearest food chr can still reach before
+    the player. Without a player position this is pick_nearest.
+
+    Examples:
+        pick_intercept(Opponent(x=0, y=0, ...), FoodList([Food(50, 0, 10), Food(10, 0, 10)]), (110, 0)) -> 0
+        pick_intercept(Opponent(x=0, y=0, ...), FoodList([Food(90, 0, 10), Food(-30, 0, 10)]), (100, 0)) -> 1
+    """
+    store = food_list.food
+    if not store or not player_pos:
+        return pick_nearest(chr, food_list, player_pos)
+    to_self = distances(food_list, chr.x, chr.y)
+    to_player = distances(food_list, player_pos[0], player_pos[1])
+    wanted = int(to_player.argmin())
+    if to_self[wanted] < to_player[wanted]:
+        return wanted
+    ahead = np.flatnonzero(to_self < to_player)
+    if len(ahead) == 0:
+        return int(to_self.argmin())
+    return int(ahead[to_self[ahead].argmin()])
+
+
+@dataclass
+class Planner:
+    """
+    Runs a registered strategy for one character within budget_us microseconds a
+    tick. Each strategy's last run time is remembered; while the chosen strategy's
+    is over budget its fallback runs instead, down the chain to one without a
+    fallback. Every retry_every ticks the chosen strategy runs regardless, so it is
+    picked again once it gets cheap, e.g. as food is eaten. Since fallbacks depend
+    on how fast the machine is, matches with a Planner do not replay exactly.
+    """
+    strategy: str = "cluster"
+    budget_us: float = 1000
+    retry_every: int = 60
+    costs: Dict[str, float] = field(default_factory=dict)
+    used: Optional[str] = None
+    ticks: int = 0
+
+    def choose(self) -> StrategySpec:
+        """
+        Purpose: Returns the strategy to run this tick: the chosen one, or the first
+        fallback in its chain whose last run was within budget.
+
+        Examples:
+            Planner("cluster", costs={"cluster": 5000}).choose().name -> "nearest" (on a tick that is not a retry)
+        """
+        spec = STRATEGIES[self.strategy]
+        if self.ticks % self.retry_every == 0:
+            return spec
+        while spec.fallback and self.costs.get(spec.name, 0) > self.budget_us:
+            spec = STRATEGIES[spec.fallback]
+        return spec
+
+
+    def pick(self, chr: Character, food_list: FoodList, player_pos: Optional[Position] = None) -> Optional[int]:
+        """
+        Purpose: Picks chr's target row with this tick's strategy, timing it.
+
+        Examples:
+            Planner("nearest").pick(Opponent(x=0, y=0, ...), FoodList([Food(10, 0, 10)])) -> 0; planner.used == "nearest"
+        """
+        spec = self.choose()
+        start = time.perf_counter_ns()
+        row = spec.pick(chr, food_list, player_pos)
+        self.costs[spec.name] = (time.perf_counter_ns() - start) / 1000
+        self.used = spec.name
+        self.ticks += 1
+        return row
+
+
+@dataclass
+class AnytimeSearch:
+    """
+    The cluster strategy spread over several frames: each frame scores the next
+    chunk of food, in id order so eating does not shift the place it has reached,
+    and keeps the best food found so far, re-scored where everything is now. The
+    best so far is returned every frame, so a retarget scores one slice's worth of
+    food however much exists. On the grid that is all a frame costs; a FoodList
+    with a ClusterField (kept only in swarm games) is still synced every frame,
+    which checks every food for drift outside the slice. Without slice_us one chunk
+    is scored a frame, which replays exactly; with it, whole chunks are scored until
+    slice_us microseconds have passed. Can stand in for a Planner on an Opponent.
+    """
+    chunk: int = 16384
+    slice_us: Optional[float] = None
+    cursor: int = 0
+    best_id: int = -1
+    passes: int = 0
+
+    def score(self, chr: Character, food_list: FoodList, rows: np.ndarray,
+              player_pos: Optional[Position] = None, floor: float = -np.inf) -> np.ndarray:
+        """
+        Purpose: Scores the given rows as pick_cluster does. Rows that cannot beat
+        floor even with the largest cluster bonus score -inf without being looked up.
+
+        Examples:
+            AnytimeSearch().score(Opponent(x=0, y=0, ...), FoodList([Food(10, 0, 10)]), np.array([0])) -> array([-10.])
+        """
+        store = food_list.food
+        dist_to_self = np.sqrt((store.x[rows] - chr.x)**2 + (store.y[rows] - chr.y)**2)
+        base = -dist_to_self
+        if player_pos:
+            dist_to_player = np.sqrt((store.x[rows] - player_pos[0])**2 + (store.y[rows] - player_pos[1])**2)
+            base = base - np.where(dist_to_player < dist_to_self, (dist_to_self - dist_to_player) * 2, 0)
+        clusters = food_list.clusters
+        if clusters:
+            return base + clusters.bonus[rows]
+        grid = food_list.grid
+        if grid is None:
+            grid = SpatialGrid(density.CLUSTER_RADIUS)
+            grid.build(store.x, store.y, store.size)
+        score = np.full(len(rows), -np.inf)
+        hopeful = np.flatnonzero(base + density.cluster_bonus_bound(grid) >= floor)
+        score[hopeful] = base[hopeful] + density.cluster_bonus(store.x, store.y, store.size, grid, rows[hopeful])
+        return score
+
+
+    def pick(self, chr: Character, food_list: FoodList, player_pos: Optional[Position] = None) -> Optional[int]:
+        """
+        Purpose: Scores this frame's slice of food and returns the row of the best
+        food found so far. After a pass over every food the search starts over,
+        keeping its best.
+
+        Examples:
+            search = AnytimeSearch(chunk=1)
+            search.pick(Opponent(x=0, y=0, ...), FoodList([Food(100, 0, 10), Food(10, 0, 10)])) -> 0
+            search.pick(...) -> 1
+        """
+        store = food_list.food
+        if not store:
+            self.best_id = -1
+            return None
+        if food_list.clusters:
+            # Kept in step every frame, as pick_cluster does; syncing less often lets
+            # drift pile up until the whole field has to be rebuilt.
+            food_list.clusters.sync(store.x, store.y, store.size)
+        ids = store.ids
+        best = store.row_of(self.best_id)
+        best_score = self.score(chr, food_list, np.array([best]), player_pos)[0] if best >= 0 else -np.inf
+
+        start = time.perf_counter_ns()
+        while True:
+            first = int(np.searchsorted(ids, self.cursor))
+            if first == len(store):
+                first = 0  # The food the pass had left to score was eaten.
+            rows = np.arange(first, min(first + self.chunk, len(store)))
+            score = self.score(chr, food_list, rows, player_pos, best_score)
+            top = int(score.argmax())
+            if score[top] > best_score:
+                best, best_score = int(rows[top]), score[top]
+            if first + self.chunk >= len(store):
+                self.cursor = 0
+                self.passes += 1
+            else:
+                self.cursor = int(ids[first + self.chunk])
+            if self.slice_us is None or time.perf_counter_ns() - start >= self.slice_us * 1000 or self.cursor == 0:
+                break
+        self.best_id = int(ids[best])
+        return best
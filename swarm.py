@@ -0,0 +1,338 @@
+"""Targeting for many opponents at once: one index per tick, one scoring pass, no shared targets."""
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+import numpy as np
+import density
+from opponent import Opponent
+from food import Food, FoodList, FoodStore
+from spatial_grid import SpatialGrid
+
+# Radius of each opponent's first look around itself; doubled until it finds food.
+SEARCH_RADIUS = 160
+
+# An opponent keeps its target while this close to it, as Opponent.find_best_food does.
+STICKY_DISTANCE = 50
+
+# Up to this many (opponent, food) pairs, every pair is scored instead of searching
+# the grid; with scarce food that settles all claims in one pass.
+DENSE_PAIRS = 1 << 16
+
+# Fewer opponents than this move one at a time: below it, gathering them into a
+# BatchMover costs more than it saves (python benchmark.py --movers breaks even at 16-24).
+BATCH_MOVERS = 20
+
+def empty_floats() -> np.ndarray:
+    return np.empty(0)
+
+def move_each(agents: List[Opponent], targets: List[Optional[Food]], deltaT: float = 1/60,
+              bounds: Optional[Tuple[int, int]] = None) -> None:
+    """
+    Purpose: Moves each agent towards its target (None stays put) on its own, then
+    clamps it inside bounds, if given, as Opponent.move and Simulation.step do.
+
+    Examples:
+        move_each([Opponent(x=0, y=0, speed=60, ...)], [Food(100, 0, 10)]) -> the opponent is at (1, 0)
+    """
+    for agent, target in zip(agents, targets):
+        if target:
+            direction = agent.direction(target)
+            agent.x = agent.x + (agent.speed * direction[0] * deltaT)
+            agent.y = agent.y + (agent.speed * direction[1] * deltaT)
+        if bounds:
+            agent.x = max(agent.size, min(bounds[0] - agent.size, agent.x))
+            agent.y = max(agent.size, min(bounds[1] - agent.size, agent.y))
+
+@dataclass
+class BatchMover:
+    """
+    The positions, sizes, speeds and targets of many characters in arrays, so each
+    tick's directions, steps and bounds clamps are one vectorized operation apiece.
+    The arithmetic follows Sprite.direction, Opponent.move and the clamp in
+    Simulation.step operation for operation, so positions come out bit-for-bit the
+    same as moving the characters one at a time. Squares go through float_power
+    because ** on a Python float rounds as libm pow does, which x * x does not always.
+    """
+    x: np.ndarray = field(default_factory=empty_floats)
+    y: np.ndarray = field(default_factory=empty_floats)
+    size: np.ndarray = field(default_factory=empty_floats)
+    speed: np.ndarray = field(default_factory=empty_floats)
+    target_x: np.ndarray = field(default_factory=empty_floats)
+    target_y: np.ndarray = field(default_factory=empty_floats)
+    moving: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=bool))
+
+    def gather(self, agents: List[Opponent]) -> None:
+        """
+        Purpose: Copies the agents' positions, sizes and speeds into the arrays, and
+        clears their targets.
+
+        Examples:
+            mover.gather([Opponent(x=1, y=2, size=20, speed=60, ...)]) -> mover.x, mover.speed == array([1.]), array([60.])
+        """
+        self.x = np.array([agent.x for agent in agents], dtype=np.float64)
+        self.y = np.array([agent.y for agent in agents], dtype=np.float64)
+        self.size = np.array([agent.size for agent in agents], dtype=np.float64)
+        self.speed = np.array([agent.speed for agent in agents], dtype=np.float64)
+        self.target_x = np.zeros(len(agents))
+        self.target_y = np.zeros(len(agents))
+        self.moving = np.zeros(len(agents), dtype=bool)
+
+
+    def aim(self, store: FoodStore, rows: np.ndarray) -> None:
+        """
+        Purpose: Points each character at a row of store; a row of -1 means it stays put.
+
+        Examples:
+            mover.aim(store with food at (100, 0), np.array([0, -1])) -> the first heads to (100, 0), the second stays
+        """
+        self.moving = rows >= 0
+        self.target_x = np.zeros(len(rows))
+        self.target_y = np.zeros(len(rows))
+        self.target_x[self.moving] = store.x[rows[self.moving]]
+        self.target_y[self.moving] = store.y[rows[self.moving]]
+
+
+    def step(self, deltaT: float = 1/60, bounds: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Purpose: Moves every aimed character towards its target at its speed for
+        deltaT seconds, then clamps every character inside bounds, if given.
+
+        Examples:
+            mover.x, mover.speed, mover.target_x == array([0.]), array([60.]), array([100.])
+            mover.step() -> mover.x == array([1.])
+        """
+        vector_x = self.target_x - self.x
+        vector_y = self.target_y - self.y
+        magnitude = np.sqrt(np.float_power(vector_x, 2.0) + np.float_power(vector_y, 2.0))
+        moving = self.moving & (magnitude != 0)
+        safe = np.where(moving, magnitude, 1.0)
+        direction_x = np.where(moving, vector_x / safe, 0.0)
+        direction_y = np.where(moving, vector_y / safe, 0.0)
+        self.x = np.where(self.moving, self.x + (self.speed * direction_x * deltaT), self.x)
+        self.y = np.where(self.moving, self.y + (self.speed * direction_y * deltaT), self.y)
+        if bounds:
+            self.x = np.maximum(self.size, np.minimum(bounds[0] - self.size, self.x))
+            self.y = np.maximum(self.size, np.minimum(bounds[1] - self.size, self.y))
+
+
+    def scatter(self, agents: List[Opponent]) -> None:
+        """
+        Purpose: Writes the positions back to the agents they were gathered from.
+
+        Examples:
+            mover.scatter(agents) -> agents[0].x == mover.x[0]
+        """
+        for agent, x, y in zip(agents, self.x.tolist(), self.y.tolist()):
+            agent.x, agent.y = x, y
+
+
+@dataclass
+class TargetingService:
+    """
+    Picks the targets of a whole swarm of opponents each tick. The cluster scores are
+    synced (or a grid built) once for everyone; each opponent then only gathers the
+    food the grid says could beat the best it has seen, and all opponents' candidates
+    are scored in one vectorized pass with the same score as Opponent.find_best_food.
+    Targets are claimed by food id, so no two opponents chase the same food while
+    there is enough to go round; targets holds each opponent's claim, or -1. The
+    opponents are then moved together by mover.
+    """
+    targets: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    mover: BatchMover = field(default_factory=BatchMover)
+
+    def cost(self, store: FoodStore, rows: np.ndarray, x, y,
+             player_pos: Optional[Tuple[float, float]] = None) -> np.ndarray:
+        """
+        Purpose: Returns the distance from (x, y) to each given food plus the penalty
+        Opponent.find_best_food gives food nearer the player, i.e. its score without
+        the cluster bonus, negated. x and y may be one position or one per row.
+
+        Examples:
+            service.cost(store with food at (30, 40), np.array([0]), 0, 0) -> array([50.])
+            service.cost(store with food at (30, 40), np.array([0]), 0, 0, (30, 30)) -> array([130.])
+        """
+        to_self = np.sqrt((store.x[rows] - x) ** 2 + (store.y[rows] - y) ** 2)
+        if not player_pos:
+            return to_self
+        to_player = np.sqrt((store.x[rows] - player_pos[0]) ** 2 + (store.y[rows] - player_pos[1]) ** 2)
+        return to_self + np.where(to_player < to_self, (to_self - to_player) * 2, 0)
+
+
+    def candidates(self, grid: SpatialGrid, store: FoodStore, x: np.ndarray, y: np.ndarray, reach: np.ndarray,
+                   bound: float, player_pos: Optional[Tuple[float, float]] = None,
+                   taken: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Purpose: Returns (owners, rows) pairs listing, for each agent at (x[i], y[i]), the
+        rows of every food, other than those marked taken, that could be its best target:
+        each search widens until it finds food, then once more to the distance at which
+        even the largest cluster bonus (bound) cannot beat the best food found. reach[i]
+        is the farthest any food can be from agent i. All agents search the grid together
+        (see SpatialGrid.query_many); owners come in increasing order.
+
+        Examples:
+            service.candidates(grid over food at x=20 and x=3000, store, np.array([0.]), np.array([0.]), np.array([3000.]), 0) -> (array([0]), array([0]))
+            service.candidates(..., taken=np.array([True, False])) -> (array([0]), array([1]))
+        """
+        def search(agents: np.ndarray, radius: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            owners, rows = grid.query_many(x[agents], y[agents], radius[agents])
+            owners = agents[owners]
+            if taken is None:
+                return owners, rows
+            free = ~taken[rows]
+            return owners[free], rows[free]
+
+        everyone = np.arange(len(x))
+        radius = np.full(len(x), float(SEARCH_RADIUS))
+        owners, rows = search(everyone, radius)
+        found = np.zeros(len(x), dtype=bool)
+        found[owners] = True
+        widen = ~found & (radius < reach)
+        while widen.any():
+            radius[widen] *= 2
+            more_owners, more_rows = search(np.flatnonzero(widen), radius)
+            owners, rows = np.concatenate((owners, more_owners)), np.concatenate((rows, more_rows))
+            found[more_owners] = True
+            widen = ~found & (radius < reach)
+
+        base = -self.cost(store, rows, x[owners], y[owners], player_pos)
+        best = np.full(len(x), -np.inf)
+        np.maximum.at(best, owners, base)
+        limit = bound - best
+        again = found & (limit > radius)
+        if again.any():
+            stay = ~again[owners]
+            radius[again] = limit[again]
+            more_owners, more_rows = search(np.flatnonzero(again), radius)
+            owners, rows = np.concatenate((owners[stay], more_owners)), np.concatenate((rows[stay], more_rows))
+            base = -self.cost(store, rows, x[owners], y[owners], player_pos)
+            best = np.full(len(x), -np.inf)
+            np.maximum.at(best, owners, base)
+        by_owner = np.argsort(owners, kind="stable")
+        owners, rows, base = owners[by_owner], rows[by_owner], base[by_owner]
+        good = base + bound >= best[owners]
+        return owners[good], rows[good]
+
+
+    def assign(self, agents: List[Opponent], food_list: FoodList,
+               player_pos: Optional[Tuple[float, float]] = None) -> np.ndarray:
+        """
+        Purpose: Returns each agent's target as a row of food_list.food, or -1 if there
+        is no food. Agents still near the target they claimed last tick keep it. The
+        rest bid for their best candidates, the best score winning each food; losers
+        search again without the claimed food. Once every food is claimed, agents left
+        over chase their best food anyway.
+
+        Examples:
+            service.assign([Opponent(x=0, ...), Opponent(x=10, ...)], food at x=20 and x=300) -> array([1, 0])
+            service.assign([Opponent(x=0, ...)], FoodList([])) -> array([-1])
+        """
+        store = food_list.food
+        n = len(agents)
+        assigned = np.full(n, -1, dtype=np.int64)
+        if len(self.targets) != n:
+            self.targets = np.full(n, -1, dtype=np.int64)
+        if not store or n == 0:
+            self.targets = assigned
+            return assigned
+
+        clusters = food_list.clusters
+        grid = food_list.grid
+        if grid is None:
+            grid = SpatialGrid(density.CLUSTER_RADIUS)
+            grid.build(store.x, store.y, store.size)
+        if clusters:
+            # The synced bonuses are the ones scored, so their maximum is an exact bound.
+            clusters.sync(store.x, store.y, store.size)
+            bonus, bound = clusters.bonus, clusters.bonus.max()
+        else:
+            bonus, bound = None, density.cluster_bonus_bound(grid)
+
+        # Claims from last tick stand while their food is alive and the agent is close.
+        taken = np.zeros(len(store), dtype=bool)
+        claimed = store.rows_of(self.targets)
+        for i in np.flatnonzero(claimed >= 0):
+            row = claimed[i]
+            if not taken[row] and store[row].distance(agents[i]) < STICKY_DISTANCE:
+                assigned[i] = row
+                taken[row] = True
+
+        left, right, top, bottom = store.x.min(), store.x.max(), store.y.min(), store.y.max()
+        agent_x = np.array([agent.x for agent in agents], dtype=np.float64)
+        agent_y = np.array([agent.y for agent in agents], dtype=np.float64)
+        reach = np.hypot(np.maximum(agent_x - left, right - agent_x), np.maximum(agent_y - top, bottom - agent_y))
+        pending = np.flatnonzero(assigned < 0)
+        while len(pending) and not taken.all():
+            # Gather the pending agents' candidates, then score every (agent, food) pair at once.
+            free = np.flatnonzero(~taken)
+            if len(pending) * len(free) <= DENSE_PAIRS:
+                owner = np.repeat(pending, len(free))
+                rows = np.tile(free, len(pending))
+            else:
+                owner, rows = self.candidates(grid, store, agent_x[pending], agent_y[pending], reach[pending],
+                                              bound, player_pos, taken)
+                owner = pending[owner]
+            if bonus is None:
+                unique, inverse = np.unique(rows, return_inverse=True)
+                pair_bonus = density.cluster_bonus(store.x, store.y, store.size, grid, unique)[inverse]
+            else:
+                pair_bonus = bonus[rows]
+            score = pair_bonus - self.cost(store, rows, agent_x[owner], agent_y[owner], player_pos)
+            best_first = np.argsort(-score, kind="stable")
+            owner, rows = owner[best_first], rows[best_first]
+
+            # Each round, every unassigned agent bids for its best unclaimed candidate and
+            # the best bid for each food wins; every round assigns at least one agent.
+            open_pairs = np.ones(len(rows), dtype=bool)
+            while True:
+                open_pairs &= ~taken[rows] & (assigned[owner] < 0)
+                bids = np.flatnonzero(open_pairs)
+                if len(bids) == 0:
+                    break
+                bids = bids[np.unique(owner[bids], return_index=True)[1]]
+                bids.sort()
+                winners = bids[np.unique(rows[bids], return_index=True)[1]]
+                assigned[owner[winners]] = rows[winners]
+                taken[rows[winners]] = True
+            pending = np.flatnonzero(assigned < 0)
+
+        # With more agents than food, the rest share: each takes its best food.
+        if len(pending):
+            owner, rows = self.candidates(grid, store, agent_x[pending], agent_y[pending], reach[pending],
+                                          bound, player_pos)
+            if bonus is None:
+                unique, inverse = np.unique(rows, return_inverse=True)
+                pair_bonus = density.cluster_bonus(store.x, store.y, store.size, grid, unique)[inverse]
+            else:
+                pair_bonus = bonus[rows]
+            score = pair_bonus - self.cost(store, rows, agent_x[pending[owner]], agent_y[pending[owner]], player_pos)
+            # Highest score first within each agent; ties keep the earliest row, as argmax would.
+            best_first = np.lexsort((-score, owner))
+            firsts = best_first[np.unique(owner[best_first], return_index=True)[1]]
+            assigned[pending[owner[firsts]]] = rows[firsts]
+
+        self.targets = np.where(assigned >= 0, store.ids[assigned], -1)
+        return assigned
+
+
+    def move(self, agents: List[Opponent], food_list: FoodList, player_pos: Optional[Tuple[float, float]] = None,
+             deltaT: float = 1/60, bounds: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Purpose: Moves every agent towards its assigned target at its speed, as
+        Opponent.move does for one, then clamps them all inside bounds, if given.
+        Agents without a target stay put. Swarms of BATCH_MOVERS or more move
+        together in mover; smaller ones one at a time, which comes out the same.
+
+        Examples:
+            service.move([Opponent(x=0, y=0, speed=60, ...)], food at (100, 0)) -> the opponent is at (1, 0)
+        """
+        store = food_list.food
+        rows = self.assign(agents, food_list, player_pos)
+        for agent, row, food_id in zip(agents, rows.tolist(), self.targets.tolist()):
+            agent.current_target = store[row] if row >= 0 else None
+            agent.target_id = food_id
+        if len(agents) < BATCH_MOVERS:
+            move_each(agents, [agent.current_target for agent in agents], deltaT, bounds)
+            return
+        self.mover.gather(agents)
+        self.mover.aim(store, rows)
+        self.mover.step(deltaT, bounds)
+        self.mover.scatter(agents)
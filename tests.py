@@ -1,10 +1,35 @@
 """Test suite for game."""
+import copy
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
 import pygame
+import numpy as np
 from cs110 import expect, summarize
 import game
 import player
 import food
 import opponent
+import spatial_grid
+import density
+import benchmark
+import renderer
+import text_cache
+import timestep
+import simulation
+import rng
+import save_state
+import autosave
+import replay
+import profiler
+import camera
+import lod
+import swarm
+import strategy
+import batch
 
 #------------------------------------------------------------------------------#
 # Setup: Run these before all tests.
@@ -136,6 +161,26 @@ expect(len(test_food_list_eat.food), 0)
 expect(test_player_eat.count, 1)
 expect(test_player_eat.size, 11)  # Size should increase after eating
 
+# Neighbouring food in a row is all eaten and reported in one pass, none skipped
+test_food_list_eat_row = food.FoodList([food.Food(x=i, y=0, size=10) for i in range(4)] + [food.Food(x=300, y=0, size=10)])
+test_player_eat_row = player.Player(x=0, y=0, size=10, speed=10, color="red")
+expect(list(test_food_list_eat_row.eat(test_player_eat_row)), [food.Food(x=i, y=0, size=10) for i in range(4)])
+expect(list(test_food_list_eat_row.food), [food.Food(x=300, y=0, size=10)])
+expect(test_player_eat_row.count, 4)
+expect(len(test_food_list_eat_row.eat(test_player_eat_row)), 0)
+
+# eat_all gives food touching several characters to the first, and compacts once
+test_food_list_eat_all = food.FoodList([food.Food(x=0, y=0, size=10), food.Food(x=15, y=0, size=10),
+                                        food.Food(x=600, y=0, size=10)])
+test_food_list_eat_all.index()
+test_eat_all_first = player.Player(x=0, y=0, size=10, speed=10, color="red")
+test_eat_all_second = player.Player(x=20, y=0, size=10, speed=10, color="red")
+test_eat_all_eaten = test_food_list_eat_all.eat_all([test_eat_all_first, test_eat_all_second])
+expect([list(eaten) for eaten in test_eat_all_eaten], [[food.Food(x=0, y=0, size=10), food.Food(x=15, y=0, size=10)], []])
+expect((test_eat_all_first.count, test_eat_all_second.count), (2, 0))
+expect(list(test_food_list_eat_all.food), [food.Food(x=600, y=0, size=10)])
+expect(test_food_list_eat_all.grid.query(600, 0, 10).tolist(), [0])
+
 
 #------------------------------------------------------------------------------#
 # Test FoodList.move
@@ -151,6 +196,161 @@ for food_item in test_food_list_move.food:
     expect(99 <= food_item.y <= 101, True)
 
 
+#------------------------------------------------------------------------------#
+# Test SpatialGrid.cell, build, query, update and remove
+#------------------------------------------------------------------------------#
+test_grid = spatial_grid.SpatialGrid(cell_size=80)
+expect(test_grid.cell(10, 10), (0, 0))
+expect(test_grid.cell(170, -5), (2, -1))
+
+test_grid.build(np.array([10.0, 500.0]), np.array([10.0, 500.0]), np.array([10.0, 10.0]))
+expect(test_grid.query(0, 0, 40).tolist(), [0])
+expect(test_grid.query(500, 500, 40).tolist(), [1])
+expect(test_grid.query_rect(400, 400, 1280, 720).tolist(), [1])
+expect(sorted(test_grid.query_rect(0, 0, 1280, 720).tolist()), [0, 1])
+
+# Moving across a cell border rebuckets the item
+test_grid.update(np.array([90.0, 500.0]), np.array([10.0, 500.0]))
+expect(test_grid.query(170, 10, 10).tolist(), [0])
+
+# Removing item 0 renumbers item 1 to 0
+test_grid.remove(np.array([False, True]))
+expect(test_grid.query(90, 10, 40).tolist(), [])
+expect(test_grid.query(500, 500, 40).tolist(), [0])
+
+# update_rows rebuckets only the given items and matches a fresh build
+test_grid_rows = spatial_grid.SpatialGrid(cell_size=80)
+test_grid_rows_x = np.array([10.0, 79.0, 300.0, 85.0])
+test_grid_rows_y = np.array([10.0, 10.0, 10.0, 10.0])
+test_grid_rows.build(test_grid_rows_x, test_grid_rows_y, np.full(4, 10.0))
+test_grid_rows_x[[1, 2]] = [81.0, 5.0]
+test_grid_rows.update_rows(np.array([1, 2]), test_grid_rows_x[[1, 2]], test_grid_rows_y[[1, 2]])
+test_grid_check = spatial_grid.SpatialGrid(cell_size=80)
+test_grid_check.build(test_grid_rows_x, test_grid_rows_y, np.full(4, 10.0))
+expect(test_grid_rows.keys.tolist(), test_grid_check.keys.tolist())
+expect(test_grid_rows.sorted_keys.tolist(), test_grid_check.sorted_keys.tolist())
+expect(sorted(test_grid_rows.query(170, 10, 5).tolist()), [1, 3])
+
+# Moving items only marks the cell table stale; the occupancy bound is tracked as
+# items move and neighbour lookups search the sorted keys without re-indexing
+expect(test_grid_rows.indexed, False)
+expect(test_grid_rows.max_occupancy(), 2)
+expect(sorted(test_grid_rows.neighbour_pairs(np.array([1]), 80)[1].tolist()), [0, 1, 2, 3])
+expect(test_grid_rows.indexed, False)
+test_grid_rows.update_rows(np.array([0]), np.array([90.0]), np.array([10.0]))
+expect(test_grid_rows.max_occupancy(), 3)
+
+
+#------------------------------------------------------------------------------#
+# Test FoodStore
+#------------------------------------------------------------------------------#
+test_store = food.FoodStore([food.Food(x=0, y=0, size=1), food.Food(x=0, y=11, size=1)])
+expect(len(test_store), 2)
+expect(test_store[1], food.Food(x=0, y=11, size=1))
+expect(list(test_store), [food.Food(x=0, y=0, size=1), food.Food(x=0, y=11, size=1)])
+expect(food.Food(x=0, y=11, size=1) in test_store, True)
+expect(food.Food(x=0, y=12, size=1) in test_store, False)
+
+# Vectorized hit test agrees with Food.hit
+test_store_hit = food.FoodStore([food.Food(x=0, y=0, size=1), food.Food(x=0, y=100, size=1)])
+expect(test_store_hit.hits(test_player_hit_1).tolist(), [0])
+expect(test_store_hit.hits(test_player_hit_2).tolist(), [])
+
+expect(test_store.ids.tolist(), [0, 1])
+expect(list(test_store.take(np.array([1]))), [food.Food(x=0, y=11, size=1)])
+expect(test_store.take(np.array([1])).ids.tolist(), [1])
+expect(len(test_store.take(np.array([], dtype=np.int64))), 0)
+
+test_store.keep(np.array([False, True]))
+expect(list(test_store), [food.Food(x=0, y=11, size=1)])
+
+# Ids are never reused, so they stay sorted as rows come and go
+expect(test_store.ids.tolist(), [1])
+test_store.extend_arrays(np.array([5.0, 6.0]), np.array([5.0, 6.0]), np.array([1.0, 1.0]))
+expect(test_store.ids.tolist(), [1, 2, 3])
+test_store.extend_arrays(np.array([7.0]), np.array([7.0]), np.array([1.0]), ids=np.array([10]))
+expect((test_store.ids.tolist(), test_store.next_id), ([1, 2, 3, 10], 11))
+
+# Rows are looked up by id without a scan, and eaten or unknown ids have none
+expect([test_store.row_of(i) for i in (10, 1, 0, 4, 99, -1)], [3, 0, -1, -1, -1, -1])
+test_store.keep(np.array([True, False, True, True]))
+expect(test_store.rows_of(np.array([1, 2, 3, 10, 11])).tolist(), [0, -1, 1, 2, -1])
+test_store.extend_arrays(np.array([8.0]), np.array([8.0]), np.array([1.0]))
+expect((test_store.row_of(11), test_store.row_of(10)), (3, 2))
+expect(test_store.take(np.array([3, 1])).rows_of(np.array([11, 3, 1])).tolist(), [0, 1, -1])
+
+
+#------------------------------------------------------------------------------#
+# Test FoodList with a spatial index
+#------------------------------------------------------------------------------#
+test_food_list_grid = food.FoodList([food.Food(x=0, y=0, size=10), food.Food(x=5, y=5, size=10),
+                                     food.Food(x=600, y=600, size=10)])
+test_food_list_grid.index()
+test_player_grid = player.Player(x=0, y=0, size=10, speed=10, color="red")
+
+# Both nearby food are eaten and reported, the far one is left alone
+expect(list(test_food_list_grid.eat(test_player_grid)), [food.Food(x=0, y=0, size=10), food.Food(x=5, y=5, size=10)])
+expect(len(test_food_list_grid.food), 1)
+expect(test_player_grid.count, 2)
+expect(test_food_list_grid.grid.query(0, 0, 10).tolist(), [])
+expect(test_food_list_grid.grid.query(600, 600, 10).tolist(), [0])
+
+# populate and move keep the grid in sync with the store
+test_food_list_grid.populate(20, (500, 500))
+test_food_list_grid.move((500, 500))
+test_grid_check = spatial_grid.SpatialGrid(cell_size=80)
+test_grid_check.build(test_food_list_grid.food.x, test_food_list_grid.food.y, test_food_list_grid.food.size)
+expect(test_food_list_grid.grid.keys.tolist(), test_grid_check.keys.tolist())
+expect(sorted(test_food_list_grid.grid.order.tolist()), list(range(21)))
+
+
+#------------------------------------------------------------------------------#
+# Test FoodList.move with a smaller time step
+#------------------------------------------------------------------------------#
+test_food_list_move_dt = food.FoodList([food.Food(x=100, y=100, size=10)])
+test_food_list_move_dt.move(deltaT=1/120)
+for food_item in test_food_list_move_dt.food:
+    expect(food_item.x in (99.5, 100, 100.5), True)
+    expect(food_item.y in (99.5, 100, 100.5), True)
+
+
+#------------------------------------------------------------------------------#
+# Test rng.FoodRandom and seeded FoodLists
+#------------------------------------------------------------------------------#
+test_rng_x, test_rng_y = rng.FoodRandom(1).spawn(2, (500, 500))
+expect((test_rng_x.tolist(), test_rng_y.tolist()), ([237.0, 256.0], [378.0, 476.0]))
+expect(rng.FoodRandom(1).spawn(50, (10, 10))[0].max() <= 10, True)
+
+# Drift is handed out from a pre-drawn block and refilled when it runs out
+test_rng_drift = rng.FoodRandom(2, block=8)
+test_rng_dx, test_rng_dy = test_rng_drift.drift(3)
+expect((len(test_rng_dx), len(test_rng_dy), test_rng_drift.used), (3, 3, 6))
+expect(set(test_rng_dx.tolist() + test_rng_dy.tolist()) <= {-1, 0, 1}, True)
+test_rng_drift.drift(3)
+expect(test_rng_drift.used, 6)
+test_rng_drift.drift(10)
+expect((len(test_rng_drift.offsets), test_rng_drift.used), (20, 20))
+
+# Several steps of drift at once are drawn from a table of every step sequence's total
+expect(rng.FoodRandom().drift_table(1).tolist(), [-1, 0, 1])
+expect(rng.FoodRandom().drift_table(2).tolist(), [-2, -1, 0, -1, 0, 1, 0, 1, 2])
+test_rng_sum_dx, test_rng_sum_dy = rng.FoodRandom(5).drift_sum(20000, 12)
+expect((len(test_rng_sum_dx), int(np.abs(test_rng_sum_dx).max()) <= 12), (20000, True))
+expect(abs(test_rng_sum_dy.var() - 12 * 2 / 3) < 0.5, True)
+
+# The same seed populates and drifts identically, whatever the global random state
+def test_rng_run(seed):
+    food_list = food.FoodList([], rng=rng.FoodRandom(seed))
+    food_list.populate(20, (300, 300))
+    np.random.seed(seed + 1000)
+    np.random.rand(7)
+    for i in range(5):
+        food_list.move((300, 300))
+    return list(food_list.food)
+expect(test_rng_run(3), test_rng_run(3))
+expect(test_rng_run(3) == test_rng_run(4), False)
+
+
 #------------------------------------------------------------------------------#
 # Test Opponent.move
 #------------------------------------------------------------------------------#
@@ -172,6 +372,28 @@ test_food_list_ai = food.FoodList([
 
 best = test_opponent_2.find_best_food(test_food_list_ai)
 expect(best.x, 50)
+expect(test_opponent_2.target_id, 0)
+
+# The target is kept by id once it has drifted, even with better food closer
+test_food_list_ai.food.x[0] = 45
+test_food_list_ai.food.extend_arrays(np.array([10.0]), np.array([0.0]), np.array([10.0]))
+expect(test_opponent_2.find_best_food(test_food_list_ai).x, 45)
+test_food_list_ai.food.keep(np.array([False, True, True]))
+expect(test_opponent_2.find_best_food(test_food_list_ai).x, 10)
+expect(test_opponent_2.target_id, 2)
+
+# Two food equally far away: the one picked first is kept on every frame of drift
+test_opponent_sticky = opponent.Opponent(x=100, y=100, size=10, speed=10, color="green")
+test_food_list_sticky = food.FoodList([food.Food(x=120, y=100, size=10), food.Food(x=80, y=100, size=10)],
+                                      rng=rng.FoodRandom(3))
+test_opponent_sticky.find_best_food(test_food_list_sticky)
+test_sticky_id = test_opponent_sticky.target_id
+test_sticky_frames = 0
+for _ in range(50):
+    test_food_list_sticky.move((1280, 720))
+    test_opponent_sticky.find_best_food(test_food_list_sticky)
+    test_sticky_frames += test_opponent_sticky.target_id == test_sticky_id
+expect(test_sticky_frames, 50)
 
 #------------------------------------------------------------------------------#
 # Test Opponent.find_best_food with player position
@@ -185,6 +407,138 @@ test_food_contested = food.FoodList([
 best_with_player = test_opponent_3.find_best_food(test_food_contested, player_pos=(45, 0))
 expect(best_with_player.x, 90)
 
+#------------------------------------------------------------------------------#
+# Test SpatialGrid.neighbour_pairs, stencil and max_occupancy
+#------------------------------------------------------------------------------#
+expect(len(spatial_grid.stencil(1)), 9)
+expect(spatial_grid.stencil(1, half=True), [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)])
+expect(len(spatial_grid.stencil(2, half=True)), 13)
+
+test_grid_pairs = spatial_grid.SpatialGrid(cell_size=100)
+test_grid_pairs.build(np.array([0.0, 50.0, 900.0]), np.array([0.0, 0.0, 0.0]), np.full(3, 10.0))
+expect(test_grid_pairs.max_occupancy(), 2)
+test_pairs_i, test_pairs_j = test_grid_pairs.neighbour_pairs(np.array([0]), 100)
+expect((test_pairs_i.tolist(), test_pairs_j.tolist()), ([0, 0], [0, 1]))
+test_pairs_i, test_pairs_j = test_grid_pairs.neighbour_pairs(np.array([0, 1, 2]), 100, half=True)
+expect((test_pairs_i.tolist(), test_pairs_j.tolist()), ([0], [1]))
+
+
+#------------------------------------------------------------------------------#
+# Test density.cluster_bonus and density.cluster_bonus_bound
+#------------------------------------------------------------------------------#
+test_bonus_x = np.array([0.0, 50.0, 900.0])
+test_bonus_y = np.array([0.0, 0.0, 0.0])
+test_bonus_size = np.full(3, 10.0)
+expect(density.cluster_bonus(test_bonus_x, test_bonus_y, test_bonus_size).tolist(), [5.0, 5.0, 0.0])
+expect(density.cluster_bonus(test_bonus_x, test_bonus_y, test_bonus_size, items=np.array([2, 0])).tolist(), [0.0, 5.0])
+expect(density.cluster_bonus(test_bonus_x, test_bonus_y, test_bonus_size, items=np.array([0, 2, 0])).tolist(), [5.0, 0.0, 5.0])
+expect(density.cluster_bonus_bound(test_grid_pairs), 170.0)
+
+# Food with the same position and size does not count towards the bonus
+expect(density.cluster_bonus(np.zeros(2), np.zeros(2), np.full(2, 10.0)).tolist(), [0.0, 0.0])
+
+# Matches the old pairwise scan, also on a grid with cells smaller than the radius
+test_bonus_store = benchmark.generate_food(200, (400, 300))
+test_bonus_grid = spatial_grid.SpatialGrid(cell_size=40)
+test_bonus_grid.build(test_bonus_store.x, test_bonus_store.y, test_bonus_store.size)
+test_bonus_pairwise = np.array(benchmark.pairwise_bonus(test_bonus_store))
+expect(np.allclose(density.cluster_bonus(test_bonus_store.x, test_bonus_store.y, test_bonus_store.size),
+                   test_bonus_pairwise), True)
+expect(np.allclose(density.cluster_bonus(test_bonus_store.x, test_bonus_store.y, test_bonus_store.size,
+                                         test_bonus_grid, np.arange(200)), test_bonus_pairwise), True)
+
+
+#------------------------------------------------------------------------------#
+# Test density.ClusterField
+#------------------------------------------------------------------------------#
+# Eight lone food far away keep the share of changed rows small enough to patch
+test_field_far_x = np.arange(1, 9) * 1000.0
+test_field_far_y = np.full(8, 1000.0)
+
+def test_field_rows(xs, ys):
+    """Build x, y and size arrays for the test food followed by the far food."""
+    x = np.concatenate((test_field_far_x, xs))
+    y = np.concatenate((test_field_far_y, ys))
+    return x, y, np.full(len(x), 10.0)
+
+test_field = density.ClusterField()
+test_field.rebuild(*test_field_rows([0.0, 50.0], [0.0, 0.0]))
+expect(test_field.bonus[8:].tolist(), [5.0, 5.0])
+expect(test_field.bound(), 170.0)
+
+# Only the drifted row is re-scored, and both bonuses follow it
+expect(test_field.sync(*test_field_rows([0.0, 60.0], [0.0, 0.0])), 1)
+expect(test_field.bonus[8:].tolist(), [4.0, 4.0])
+expect(test_field.sync(*test_field_rows([0.0, 60.0], [0.0, 0.0])), 0)
+
+# Appended rows are scored on the next sync
+test_field_x, test_field_y, test_field_size = test_field_rows([0.0, 60.0], [0.0, 0.0])
+expect(test_field.sync(np.append(test_field_x, 0.0), np.append(test_field_y, 30.0), np.append(test_field_size, 10.0)), 1)
+expect(np.allclose(test_field.bonus[8:], [11.0, 14.0 - 0.1 * np.hypot(60, 30), 17.0 - 0.1 * np.hypot(60, 30)]), True)
+
+# Removed rows stop counting towards their neighbours
+test_field.remove(np.array([True] * 9 + [False, True]))
+expect(np.allclose(test_field.bonus[8:], [7.0, 7.0]), True)
+expect(test_field.bonus[:8].tolist(), [0.0] * 8)
+
+# Drift within the tolerance keeps the old anchor
+test_field_tolerant = density.ClusterField(tolerance=2)
+test_field_tolerant.rebuild(*test_field_rows([0.0, 50.0], [0.0, 0.0]))
+expect(test_field_tolerant.sync(*test_field_rows([1.0, 52.0], [0.0, 0.0])), 0)
+expect(test_field_tolerant.bonus[8:].tolist(), [5.0, 5.0])
+
+# Past the rebuild share, every row is re-scored from scratch
+test_field_x, test_field_y, test_field_size = test_field_rows([9.0, 52.0], [0.0, 0.0])
+expect(test_field_tolerant.sync(test_field_x + 5, test_field_y, test_field_size), 10)
+expect(np.allclose(test_field_tolerant.bonus[8:], [5.7, 5.7]), True)
+
+
+#------------------------------------------------------------------------------#
+# Test FoodList.track_clusters
+#------------------------------------------------------------------------------#
+test_food_list_clusters = food.FoodList([food.Food(x=0, y=0, size=10), food.Food(x=50, y=0, size=10),
+                                         food.Food(x=400, y=400, size=10)])
+expect(test_food_list_clusters.track_clusters().bonus.tolist(), [5.0, 5.0, 0.0])
+
+# Eating updates the persisted scores straight away
+test_food_list_clusters.eat(player.Player(x=0, y=0, size=5, speed=10, color="red"))
+expect(test_food_list_clusters.clusters.bonus.tolist(), [0.0, 0.0])
+
+# After drift and new food, a sync matches scoring from scratch
+test_food_list_clusters.populate(50, (300, 300))
+test_food_list_clusters.move((300, 300))
+test_store_clusters = test_food_list_clusters.food
+test_food_list_clusters.clusters.sync(test_store_clusters.x, test_store_clusters.y, test_store_clusters.size)
+expect(np.allclose(test_food_list_clusters.clusters.bonus,
+                   density.cluster_bonus(test_store_clusters.x, test_store_clusters.y, test_store_clusters.size)), True)
+
+
+#------------------------------------------------------------------------------#
+# Test benchmark.scaled_bounds
+#------------------------------------------------------------------------------#
+expect(benchmark.scaled_bounds(100), (1280, 720))
+expect(benchmark.scaled_bounds(400), (2560, 1440))
+
+
+#------------------------------------------------------------------------------#
+# Test Opponent.find_best_food reading persisted cluster scores
+#------------------------------------------------------------------------------#
+test_opponent_clusters = opponent.Opponent(x=0, y=0, size=10, speed=10, color="green")
+test_food_list_ai_clusters = food.FoodList([
+    food.Food(x=50, y=0, size=10),
+    food.Food(x=200, y=0, size=10)
+])
+test_food_list_ai_clusters.track_clusters()
+expect(test_opponent_clusters.find_best_food(test_food_list_ai_clusters).x, 50)
+
+test_opponent_clusters_2 = opponent.Opponent(x=100, y=0, size=10, speed=10, color="green")
+test_food_contested_clusters = food.FoodList([
+    food.Food(x=50, y=0, size=10),
+    food.Food(x=90, y=0, size=10)
+])
+test_food_contested_clusters.track_clusters()
+expect(test_opponent_clusters_2.find_best_food(test_food_contested_clusters, player_pos=(45, 0)).x, 90)
+
 #------------------------------------------------------------------------------#
 # Test Opponent.eat and resize
 #------------------------------------------------------------------------------#
@@ -203,6 +557,811 @@ test_opponent_empty.move(empty_food)
 expect(test_opponent_empty.x, 50)
 expect(test_opponent_empty.y, 50)
 
+#------------------------------------------------------------------------------#
+# Test DirtyRectRenderer.begin and DirtyRectRenderer.end
+#------------------------------------------------------------------------------#
+test_renderer = renderer.DirtyRectRenderer("purple")
+test_game.screen.fill("black")
+
+# The first frame fills and flips the whole screen
+test_renderer.begin(test_game.screen)
+expect(test_game.screen.get_at((600, 600)), pygame.Color("purple"))
+test_rect_1 = pygame.draw.circle(test_game.screen, "red", (20, 20), 10)
+expect(test_renderer.end(test_game.screen, [test_rect_1]), [test_game.screen.get_rect()])
+
+# Later frames only erase and update last frame's bounds plus this frame's
+test_game.screen.fill("black", pygame.Rect(600, 600, 1, 1))
+test_renderer.begin(test_game.screen)
+expect(test_game.screen.get_at((20, 20)), pygame.Color("purple"))
+expect(test_game.screen.get_at((600, 600)), pygame.Color("black"))
+test_rect_2 = pygame.draw.circle(test_game.screen, "red", (21, 20), 10)
+expect(test_renderer.end(test_game.screen, [test_rect_2]), [test_rect_1, test_rect_2])
+
+# Covering most of the screen falls back to a full fill
+test_renderer.end(test_game.screen, [test_game.screen.get_rect()])
+test_renderer.begin(test_game.screen)
+expect(test_renderer.full, True)
+expect(test_game.screen.get_at((600, 600)), pygame.Color("purple"))
+
+
+#------------------------------------------------------------------------------#
+# Test FoodSprites.sprite and FoodSprites.draw
+#------------------------------------------------------------------------------#
+test_sprites = renderer.FoodSprites("blue")
+expect(test_sprites.sprite(10).get_size(), (20, 20))
+expect(test_sprites.sprite(10) is test_sprites.sprite(10), True)
+
+# Batched sprites put down the same pixels as one draw.circle per food
+test_sprites_x = np.array([50.0, 80.4, 120.7, 200.0])
+test_sprites_y = np.array([50.0, 60.6, 30.2, 100.0])
+test_sprites_size = np.array([10.0, 10.0, 12.5, 10.0])
+test_sprites_direct = pygame.Surface((300, 200))
+test_sprites_direct_rects = [pygame.draw.circle(test_sprites_direct, "blue", pygame.Vector2(x, y), size)
+                             for x, y, size in zip(test_sprites_x, test_sprites_y, test_sprites_size)]
+test_sprites_batched = pygame.Surface((300, 200))
+test_sprites_rects = test_sprites.draw(test_sprites_batched, test_sprites_x, test_sprites_y, test_sprites_size, True)
+expect(pygame.image.tobytes(test_sprites_batched, "RGB"), pygame.image.tobytes(test_sprites_direct, "RGB"))
+expect(sorted(map(tuple, test_sprites_rects)), sorted(map(tuple, test_sprites_direct_rects)))
+expect(sorted(test_sprites.sprites), [10, 12])
+expect(test_sprites.draw(test_sprites_batched, test_sprites_x, test_sprites_y, test_sprites_size), [])
+
+
+#------------------------------------------------------------------------------#
+# Test camera.Camera and camera.steer
+#------------------------------------------------------------------------------#
+expect(camera.Camera((1280, 720), (1280, 720)).scrolls(), False)
+expect(camera.Camera((1280, 720), (5000, 720)).scrolls(), True)
+
+# The view centres on its target but stays inside the world
+test_camera = camera.Camera((100, 100), (1000, 1000))
+test_camera.follow(player.Player(x=500, y=30, size=10, speed=60, color="red"))
+expect((test_camera.x, test_camera.y), (450, 0))
+test_camera.follow(player.Player(x=990, y=990, size=10, speed=60, color="red"))
+expect((test_camera.x, test_camera.y), (900, 900))
+expect(test_camera.to_world((10, 20)), (910, 920))
+test_camera_small = camera.Camera((100, 100), (50, 50))
+test_camera_small.follow(player.Player(x=40, y=40, size=10, speed=60, color="red"))
+expect((test_camera_small.x, test_camera_small.y), (0, 0))
+
+# Only food the grid places near the view is visible
+test_camera_food = food.FoodList([food.Food(x=50, y=50, size=10), food.Food(x=950, y=950, size=10)])
+test_camera_food.index()
+expect(test_camera.visible(test_camera_food.grid, 2).tolist(), [1])
+expect(test_camera.visible(None, 2).tolist(), [0, 1])
+
+test_steer_player = player.Player(x=0, y=0, size=10, speed=60, color="red")
+expect(camera.steer(test_steer_player, (100, 0), 60, 1/60), (1.0, 0.0))
+expect(camera.steer(test_steer_player, (0.5, 0), 60, 1/60), (0.5, 0))
+
+
+#------------------------------------------------------------------------------#
+# Test lod.DriftLOD, lod.needs_lod and FoodList.move with a lod
+#------------------------------------------------------------------------------#
+expect(lod.needs_lod((1280, 720)), False)
+expect(lod.needs_lod((20000, 20000)), True)
+
+# Food near a character is scheduled every tick, the rest one batch per tick
+test_lod_food = food.FoodList([food.Food(x=x, y=50, size=10) for x in (50.0, 500.0, 1000.0, 1500.0)])
+test_lod_food.index()
+test_lod_player = player.Player(x=50, y=50, size=10, speed=60, color="red")
+test_lod = lod.DriftLOD(radius=100, every=2)
+test_lod_near, test_lod_far = test_lod.schedule(test_lod_food.grid, 4, [test_lod_player])
+expect((test_lod_near.tolist(), test_lod_far.tolist()), ([0], [1]))
+test_lod_near, test_lod_far = test_lod.schedule(test_lod_food.grid, 4, [test_lod_player])
+expect((test_lod_near.tolist(), test_lod_far.tolist()), ([0], [2, 3]))
+
+# Moving with a lod leaves unscheduled food alone and keeps the grid in sync
+test_lod_food.lod = lod.DriftLOD(radius=100, every=2)
+test_lod_food.move((2000, 2000), focus=[test_lod_player])
+expect(test_lod_food.food.x[2:].tolist(), [1000.0, 1500.0])
+test_lod_food.move((2000, 2000), focus=[test_lod_player])
+test_grid_check = spatial_grid.SpatialGrid(cell_size=80)
+test_grid_check.build(test_lod_food.food.x, test_lod_food.food.y, test_lod_food.food.size)
+expect(test_lod_food.grid.sorted_keys.tolist(), test_grid_check.sorted_keys.tolist())
+expect(abs(test_lod_food.food.x[3] - 1500.0) <= 2, True)
+
+# By default the whole view drifts every tick, even with the camera stopped in a corner
+test_lod_view = food.FoodList([food.Food(x=1270, y=710, size=10), food.Food(x=5000, y=5000, size=10)])
+test_lod_view.index()
+test_lod_corner = player.Player(x=40, y=40, size=40, speed=300, color="red")
+test_lod_view_camera = camera.Camera((1280, 720), (20000, 20000))
+test_lod_view_camera.follow(test_lod_corner)
+expect(test_lod_view_camera.visible(test_lod_view.grid, 2).tolist(), [0])
+expect(lod.DriftLOD().schedule(test_lod_view.grid, 2, [test_lod_corner])[0].tolist(), [0])
+
+# Food near a rival drifts every step, not in batches
+test_lod_rivals = simulation.new_simulation(2000, (20000, 20000), seed=3, rivals=1)
+test_lod_rival = test_lod_rivals.rivals[0]
+test_lod_rival.x, test_lod_rival.y = 15000, 15000
+test_lod_rival_store = test_lod_rivals.food_list.food
+test_lod_rival_id = int(test_lod_rival_store.ids[np.argmin(np.hypot(test_lod_rival_store.x - 15500,
+                                                                     test_lod_rival_store.y - 15000))])
+test_lod_rival_jumps = []
+for _ in range(24):
+    test_lod_rival_before = test_lod_rival_store.x[test_lod_rival_store.row_of(test_lod_rival_id)]
+    test_lod_rivals.step((test_lod_rivals.player.x, test_lod_rivals.player.y))
+    test_lod_rival_store = test_lod_rivals.food_list.food
+    test_lod_rival_jumps.append(abs(test_lod_rival_store.x[test_lod_rival_store.row_of(test_lod_rival_id)]
+                                    - test_lod_rival_before))
+expect(max(test_lod_rival_jumps) <= 1, True)
+
+# Large worlds get a lod, and seeded matches on them still play out identically
+expect(simulation.new_simulation(0, (20000, 20000)).food_list.lod is not None, True)
+expect(simulation.new_simulation(0).food_list.lod, None)
+def test_lod_run(seed):
+    sim = simulation.new_simulation(200, (6000, 6000), seed=seed)
+    for i in range(20):
+        sim.step((300, 3000))
+    return list(sim.food_list.food)
+expect(test_lod_run(2), test_lod_run(2))
+
+
+#------------------------------------------------------------------------------#
+# Test swarm.TargetingService
+#------------------------------------------------------------------------------#
+test_swarm_service = swarm.TargetingService()
+test_swarm_store = food.FoodStore([food.Food(x=30, y=40, size=10)])
+expect(test_swarm_service.cost(test_swarm_store, np.array([0]), 0, 0).tolist(), [50.0])
+expect(test_swarm_service.cost(test_swarm_store, np.array([0]), 0, 0, (30, 30)).tolist(), [130.0])
+
+# The search widens until it finds food, and skips food that cannot win
+test_swarm_far = food.FoodList([food.Food(x=20, y=20, size=10), food.Food(x=3000, y=20, size=10)])
+test_swarm_far.index()
+test_swarm_agent = opponent.Opponent(x=0, y=0, size=20, speed=60, color="green")
+def test_swarm_candidates(x, y, taken=None):
+    owners, rows = test_swarm_service.candidates(test_swarm_far.grid, test_swarm_far.food, np.array(x, dtype=float),
+                                                 np.array(y, dtype=float), np.full(len(x), 3000.0), 0, taken=taken)
+    return owners.tolist(), rows.tolist()
+expect(test_swarm_candidates([0], [0]), ([0], [0]))
+expect(len(test_swarm_candidates([1500], [1500])[1]) > 0, True)
+expect(test_swarm_candidates([0], [0], taken=np.array([True, False])), ([0], [1]))
+
+# Searching for several agents at once finds what each would find alone
+expect(test_swarm_candidates([1500, 0, 3000], [1500, 0, 20]),
+       ([0] * len(test_swarm_candidates([1500], [1500])[1]) + [1, 2], test_swarm_candidates([1500], [1500])[1] + [0, 1]))
+
+# Alone, an opponent picks the same food as Opponent.find_best_food
+test_swarm_sim = simulation.new_simulation(400, (3000, 3000), seed=4, rivals=8)
+test_swarm_pos = (test_swarm_sim.player.x, test_swarm_sim.player.y)
+for test_swarm_opponent in [test_swarm_sim.opponent] + test_swarm_sim.rivals:
+    test_swarm_row = swarm.TargetingService().assign([test_swarm_opponent], test_swarm_sim.food_list, test_swarm_pos)[0]
+    test_swarm_expected = test_swarm_opponent.find_best_food(test_swarm_sim.food_list, test_swarm_pos)
+    expect(test_swarm_sim.food_list.food[int(test_swarm_row)], test_swarm_expected)
+
+# Together, no two opponents claim the same food while there is enough
+test_swarm_rows = test_swarm_service.assign([test_swarm_sim.opponent] + test_swarm_sim.rivals, test_swarm_sim.food_list, test_swarm_pos)
+expect(len(set(test_swarm_rows.tolist())), 9)
+expect(test_swarm_service.targets.tolist(), test_swarm_sim.food_list.food.ids[test_swarm_rows].tolist())
+
+# Two opponents next to one food: the closer wins it, the other searches again for the next best
+test_swarm_pair = food.FoodList([food.Food(x=20, y=0, size=10), food.Food(x=300, y=0, size=10)])
+test_swarm_pair_agents = [opponent.Opponent(x=0, y=0, size=20, speed=60, color="green"),
+                          opponent.Opponent(x=10, y=0, size=20, speed=60, color="green")]
+expect(swarm.TargetingService().assign(test_swarm_pair_agents, test_swarm_pair).tolist(), [1, 0])
+
+# With more opponents than food they share, and with no food nobody moves
+expect(swarm.TargetingService().assign(test_swarm_pair_agents, food.FoodList([food.Food(x=20, y=0, size=10)])).tolist(), [0, 0])
+expect(swarm.TargetingService().assign(test_swarm_pair_agents, food.FoodList([])).tolist(), [-1, -1])
+test_swarm_mover = [opponent.Opponent(x=0, y=0, size=20, speed=60, color="green")]
+swarm.TargetingService().move(test_swarm_mover, food.FoodList([food.Food(x=100, y=0, size=10)]))
+expect((test_swarm_mover[0].x, test_swarm_mover[0].y), (1.0, 0.0))
+
+# A simulation with rivals steps them all and replays identically from its seed
+test_swarm_replay = replay.Recording(seed=6, food=60, rivals=5)
+test_swarm_replay_sim = test_swarm_replay.start()
+for i in range(30):
+    test_swarm_replay.step(test_swarm_replay_sim, (300 + i, 300))
+test_swarm_replayed = replay.Replay(test_swarm_replay).run()
+expect([(r.x, r.y, r.count) for r in test_swarm_replayed.rivals],
+       [(r.x, r.y, r.count) for r in test_swarm_replay_sim.rivals])
+expect(test_swarm_replay_sim.rivals[0].x != simulation.new_simulation(60, rivals=5).rivals[0].x, True)
+
+
+#------------------------------------------------------------------------------#
+# Test swarm.BatchMover
+#------------------------------------------------------------------------------#
+test_mover_agents = [opponent.Opponent(x=0, y=0, size=20, speed=60, color="green"),
+                     opponent.Opponent(x=5, y=5, size=20, speed=60, color="green"),
+                     opponent.Opponent(x=100, y=0, size=20, speed=60, color="green")]
+test_mover_store = food.FoodStore([food.Food(x=100, y=0, size=10)])
+test_mover = swarm.BatchMover()
+test_mover.gather(test_mover_agents)
+expect((test_mover.x.tolist(), test_mover.speed.tolist()), ([0.0, 5.0, 100.0], [60.0, 60.0, 60.0]))
+
+# Aimed agents step towards their target, unaimed ones and ones already there stay put
+test_mover.aim(test_mover_store, np.array([0, -1, 0]))
+expect((test_mover.target_x.tolist(), test_mover.moving.tolist()), ([100.0, 0.0, 100.0], [True, False, True]))
+test_mover.step()
+expect((test_mover.x.tolist(), test_mover.y.tolist()), ([1.0, 5.0, 100.0], [0.0, 5.0, 0.0]))
+
+# Clamping keeps every agent inside the bounds
+test_mover.step(bounds=(1280, 720))
+test_mover.scatter(test_mover_agents)
+expect([(a.x, a.y) for a in test_mover_agents], [(20.0, 20.0), (20.0, 20.0), (100.0, 20.0)])
+
+# Positions match moving each opponent on its own, bit for bit
+test_mover_rng = np.random.default_rng(8)
+test_mover_food = food.FoodStore([food.Food(x=float(x), y=float(y), size=10)
+                                  for x, y in test_mover_rng.uniform(0, 1280, (50, 2))])
+test_mover_rows = test_mover_rng.integers(-1, 50, 50)
+test_mover_scalar = [opponent.Opponent(x=float(x), y=float(y), size=30, speed=150, color="green")
+                     for x, y in test_mover_rng.uniform(0, 720, (50, 2))]
+test_mover_batched = [opponent.Opponent(a.x, a.y, a.size, a.speed, a.color) for a in test_mover_scalar]
+swarm.move_each(test_mover_scalar, [test_mover_food[r] if r >= 0 else None for r in test_mover_rows.tolist()],
+                1/60, (1280, 720))
+test_mover.gather(test_mover_batched)
+test_mover.aim(test_mover_food, test_mover_rows)
+test_mover.step(1/60, (1280, 720))
+test_mover.scatter(test_mover_batched)
+expect([(a.x, a.y) for a in test_mover_batched], [(a.x, a.y) for a in test_mover_scalar])
+
+# Swarms smaller than BATCH_MOVERS skip the BatchMover and move one at a time
+test_mover_small = swarm.TargetingService()
+test_mover_small.move(test_mover_batched[:swarm.BATCH_MOVERS - 1], food.FoodList(list(test_mover_food)))
+expect(len(test_mover_small.mover.x), 0)
+test_mover_small.move(test_mover_batched[:swarm.BATCH_MOVERS], food.FoodList(list(test_mover_food)))
+expect(len(test_mover_small.mover.x), swarm.BATCH_MOVERS)
+
+
+#------------------------------------------------------------------------------#
+# Test strategy.register, the shipped strategies and strategy.Planner
+#------------------------------------------------------------------------------#
+expect({name: spec.fallback for name, spec in strategy.STRATEGIES.items()},
+       {"nearest": None, "cluster": "nearest", "intercept": "nearest"})
+test_strategy_chr = opponent.Opponent(x=0, y=0, size=20, speed=60, color="green")
+test_strategy_food = food.FoodList([food.Food(x=100, y=0, size=10), food.Food(x=10, y=0, size=10)])
+expect(strategy.pick_nearest(test_strategy_chr, test_strategy_food), 1)
+expect(strategy.pick_nearest(test_strategy_chr, food.FoodList([])), None)
+expect(strategy.pick_cluster(test_strategy_chr, test_strategy_food), 1)
+
+# With a grid, nearest only searches nearby cells but finds the same food
+test_strategy_far = food.FoodList([food.Food(x=float(x), y=float(y), size=10)
+                                   for x, y in np.random.default_rng(2).uniform(0, 3000, (300, 2))])
+test_strategy_far_rows = [strategy.pick_nearest(test_strategy_chr, test_strategy_far)]
+test_strategy_far.index()
+test_strategy_far_rows.append(strategy.pick_nearest(test_strategy_chr, test_strategy_far))
+expect(test_strategy_far_rows[0], test_strategy_far_rows[1])
+
+# Intercept takes the player's nearest food if it gets there first, else food it is nearer to
+test_strategy_race = food.FoodList([food.Food(x=50, y=0, size=10), food.Food(x=10, y=0, size=10)])
+expect(strategy.pick_intercept(test_strategy_chr, test_strategy_race, (110, 0)), 0)
+test_strategy_lost = food.FoodList([food.Food(x=90, y=0, size=10), food.Food(x=-30, y=0, size=10)])
+expect(strategy.pick_intercept(test_strategy_chr, test_strategy_lost, (100, 0)), 1)
+expect(strategy.pick_intercept(test_strategy_chr, test_strategy_lost), 1)
+
+# With a grid, cluster only looks near chr but picks what a scan of the whole world picks
+test_strategy_world = simulation.new_simulation(3000, (20000, 20000), seed=8)
+test_strategy_scan = food.FoodList(test_strategy_world.food_list.food)
+for test_strategy_pos in [(10000, 10000), (50, 19950), (7000, 300)]:
+    test_strategy_chr_world = opponent.Opponent(x=test_strategy_pos[0], y=test_strategy_pos[1], size=40, speed=150, color="green")
+    expect(strategy.pick_cluster(test_strategy_chr_world, test_strategy_world.food_list, (9000, 10000)),
+           strategy.pick_cluster(test_strategy_chr_world, test_strategy_scan, (9000, 10000)))
+expect(len(strategy.nearby(test_strategy_chr_world, test_strategy_world.food_list, 0)) < 100, True)
+
+# Registered strategies can be planned by name
+@strategy.register("test_last", fallback="nearest")
+def test_strategy_last(chr, food_list, player_pos=None):
+    return len(food_list.food) - 1 if food_list.food else None
+expect(strategy.STRATEGIES["test_last"].fallback, "nearest")
+expect(strategy.Planner("test_last").pick(test_strategy_chr, test_strategy_food), 1)
+del strategy.STRATEGIES["test_last"]
+
+# Over budget the planner falls back, and retries the chosen strategy every retry_every ticks
+test_planner = strategy.Planner("cluster", budget_us=100, retry_every=3)
+expect(test_planner.choose().name, "cluster")
+test_planner.costs["cluster"] = 5000
+test_planner.ticks = 1
+expect(test_planner.choose().name, "nearest")
+test_planner.ticks = 3
+expect(test_planner.choose().name, "cluster")
+test_planner.ticks = 1
+expect(test_planner.pick(test_strategy_chr, test_strategy_food), 1)
+expect((test_planner.used, test_planner.ticks, "nearest" in test_planner.costs), ("nearest", 2, True))
+
+# An opponent with a planner chases what its strategy picks
+test_planner_opponent = opponent.Opponent(x=0, y=0, size=20, speed=60, color="green",
+                                          planner=strategy.Planner("intercept"))
+expect(test_planner_opponent.find_best_food(test_strategy_lost, (100, 0)), food.Food(x=-30, y=0, size=10))
+
+
+#------------------------------------------------------------------------------#
+# Test strategy.AnytimeSearch
+#------------------------------------------------------------------------------#
+test_anytime_chr = opponent.Opponent(x=0, y=0, size=20, speed=60, color="green")
+expect(strategy.AnytimeSearch().score(test_anytime_chr, food.FoodList([food.Food(x=10, y=0, size=10)]),
+                                      np.array([0])).tolist(), [-10.0])
+test_anytime_far = food.FoodList([food.Food(x=1000, y=0, size=10), food.Food(x=10, y=0, size=10)])
+expect(strategy.AnytimeSearch().score(test_anytime_chr, test_anytime_far, np.array([0, 1]), floor=-20).tolist(),
+       [-np.inf, -10.0])
+
+# One chunk a frame: the best so far is returned until a better one is scored
+test_anytime = strategy.AnytimeSearch(chunk=1)
+test_anytime_food = food.FoodList([food.Food(x=100, y=0, size=10), food.Food(x=10, y=0, size=10),
+                                   food.Food(x=50, y=0, size=10)])
+expect([test_anytime.pick(test_anytime_chr, test_anytime_food) for i in range(3)], [0, 1, 1])
+expect((test_anytime.passes, test_anytime.cursor), (1, 0))
+
+# Eating shifts rows but not the search's place in id order or its best
+test_anytime.pick(test_anytime_chr, test_anytime_food)
+test_anytime_food.food.keep(np.array([False, True, True]))
+expect(test_anytime.pick(test_anytime_chr, test_anytime_food), 0)
+expect(test_anytime.best_id, 1)
+expect(test_anytime.pick(test_anytime_chr, food.FoodList([])), None)
+
+# Over a whole pass it finds what pick_cluster picks in one go
+test_anytime_sim = simulation.new_simulation(3000, (4000, 4000), seed=3)
+test_anytime_pos = (test_anytime_sim.player.x, test_anytime_sim.player.y)
+test_anytime = strategy.AnytimeSearch(chunk=256)
+while test_anytime.passes == 0:
+    test_anytime_row = test_anytime.pick(test_anytime_sim.opponent, test_anytime_sim.food_list, test_anytime_pos)
+expect(test_anytime_row, strategy.pick_cluster(test_anytime_sim.opponent, test_anytime_sim.food_list, test_anytime_pos))
+
+# A time slice scores chunks until it runs out, but never more than one pass
+test_anytime_timed = strategy.AnytimeSearch(chunk=256, slice_us=1e9)
+test_anytime_timed.pick(test_anytime_sim.opponent, test_anytime_sim.food_list, test_anytime_pos)
+expect((test_anytime_timed.passes, test_anytime_timed.cursor), (1, 0))
+
+
+#------------------------------------------------------------------------------#
+# Test TextCache.font and TextCache.render
+#------------------------------------------------------------------------------#
+pygame.font.init()
+test_text = text_cache.TextCache(capacity=2)
+expect(test_text.font(36) is test_text.font(36), True)
+expect(len(test_text.fonts), 1)
+
+# The same text, size and colour reuses the rendered surface
+test_text_score = test_text.render("Player: 0", 36, "white")
+expect(test_text.render("Player: 0", 36, "white") is test_text_score, True)
+expect(test_text.render("Player: 0", 36, "gray") is test_text_score, False)
+
+# Past capacity, the least recently used surface is dropped
+test_text.render("Player: 0", 36, "white")
+test_text.render("Player: 1", 36, "white")
+expect(list(test_text.surfaces.keys()), [(36, "Player: 0", "white"), (36, "Player: 1", "white")])
+
+
+#------------------------------------------------------------------------------#
+# Test FixedTimestep.advance, should_render and reset
+#------------------------------------------------------------------------------#
+test_clock = timestep.FixedTimestep(step=0.01)
+expect(test_clock.advance(0.025), 2)
+expect(test_clock.advance(0.005), 1)
+expect(test_clock.advance(0.004), 0)
+expect(test_clock.should_render(), True)
+
+# A long stall is capped at max_steps and the frame goes undrawn
+test_clock_slow = timestep.FixedTimestep(step=0.01, max_steps=3, max_skipped=1)
+expect(test_clock_slow.advance(1.0), 3)
+expect(test_clock_slow.should_render(), False)
+expect(test_clock_slow.advance(1.0), 3)
+expect(test_clock_slow.should_render(), True)
+
+test_clock_slow.advance(0.005)
+test_clock_slow.reset()
+expect(test_clock_slow.accumulator, 0)
+
+
+#------------------------------------------------------------------------------#
+# Test Simulation.step, Simulation.run and Simulation.restore
+#------------------------------------------------------------------------------#
+test_sim = simulation.Simulation(
+    player.Player(x=0, y=0, size=10, speed=10, color="red"),
+    opponent.Opponent(x=500, y=300, size=10, speed=60, color="green"),
+    food.FoodList([food.Food(x=100, y=100, size=10), food.Food(x=700, y=300, size=10)])
+)
+
+# The player follows the mouse and eats, the opponent moves towards its food
+expect(test_sim.step((100, 100)), None)
+expect(test_sim.player.count, 1)
+expect(test_sim.opponent.x, 501)
+expect(len(test_sim.food_list.food), 1)
+expect(test_sim.steps, 1)
+
+# Positions are clamped to the bounds
+test_sim.step((5000, -5))
+expect((test_sim.player.x, test_sim.player.y), (1280 - test_sim.player.size, test_sim.player.size))
+
+# A winner is reported once the food is gone
+test_sim.food_list = food.FoodList([])
+expect(test_sim.step((0, 0)), "Player")
+
+# Headless matches run to a winner without any input device
+test_sim_match = simulation.new_simulation(20)
+expect(len(test_sim_match.food_list.food), 20)
+expect(test_sim_match.opponent.x, 1080)
+expect(test_sim_match.run(simulation.chase_nearest_food) in ("Player", "Opponent", "Tie"), True)
+expect(test_sim_match.player.count + test_sim_match.opponent.count, 20)
+
+# A match that cannot finish stops after max_steps
+test_sim_timeout = simulation.new_simulation(1)
+test_sim_timeout.food_list.food = food.FoodStore([food.Food(x=640, y=360, size=0)])
+expect(test_sim_timeout.run(lambda sim: (200, 360), max_steps=10), None)
+expect(test_sim_timeout.steps, 10)
+
+test_sim_match.restore({
+    "player": {"x": 1, "y": 2, "size": 12, "count": 2},
+    "opponent": {"x": 3, "y": 4, "size": 11, "count": 1},
+    "food": [{"x": 5, "y": 6, "size": 10}]
+})
+expect((test_sim_match.player.x, test_sim_match.player.count, test_sim_match.opponent.size), (1, 2, 11))
+expect(list(test_sim_match.food_list.food), [food.Food(x=5, y=6, size=10)])
+expect(test_sim_match.winner, None)
+
+# chase_nearest_food moves the mouse at the player's speed
+test_sim_chase = simulation.Simulation(player.Player(x=0, y=0, size=10, speed=60, color="red"), test_opponent_1,
+                                       food.FoodList([food.Food(x=100, y=0, size=10)]))
+expect(simulation.chase_nearest_food(test_sim_chase), (1.0, 0.0))
+
+# Only a swarm keeps a ClusterField; a lone opponent scores its candidates on the grid
+expect(simulation.new_simulation(5).food_list.clusters, None)
+expect(simulation.new_simulation(5, rivals=2).food_list.clusters is not None, True)
+
+# The simulation does not need pygame
+test_sim_imports = subprocess.run([sys.executable, "-c", "import sys, simulation; print('pygame' in sys.modules)"],
+                                  capture_output=True, text=True)
+expect(test_sim_imports.stdout.strip(), "False")
+
+
+#------------------------------------------------------------------------------#
+# Test save_state.save_game and save_state.load_game
+#------------------------------------------------------------------------------#
+test_save_dir = tempfile.mkdtemp()
+test_save_sim = simulation.new_simulation(0)
+test_save_sim.food_list.food = food.FoodStore([food.Food(x=0, y=0, size=10), food.Food(x=1, y=2, size=10),
+                                              food.Food(x=3.5, y=4.25, size=12)])
+test_save_sim.food_list.food.keep(np.array([False, True, True]))
+test_save_sim.player.count = 3
+test_save_sim.opponent.target_id = 2
+
+# Binary saves load their food straight into a FoodStore
+test_save_bin = os.path.join(test_save_dir, "save.bin")
+save_state.save_game(test_save_bin, test_save_sim.player, test_save_sim.opponent, test_save_sim.food_list)
+test_save_state = save_state.load_game(test_save_bin)
+expect(isinstance(test_save_state["food"], food.FoodStore), True)
+expect(list(test_save_state["food"]), list(test_save_sim.food_list.food))
+expect(test_save_state["player"]["count"], 3)
+expect(test_save_state["opponent"]["color"], "green")
+expect(os.path.getsize(test_save_bin) % 4, 0)
+
+# Older JSON saves still load, and both restore the same game
+test_save_json = os.path.join(test_save_dir, "save.json")
+save_state.save_game_json(test_save_json, test_save_sim.player, test_save_sim.opponent, test_save_sim.food_list)
+test_save_restored = simulation.new_simulation(5)
+test_save_restored.restore(save_state.load_game(test_save_json))
+expect(list(test_save_restored.food_list.food), list(test_save_sim.food_list.food))
+test_save_restored.restore(save_state.load_game(test_save_bin))
+expect(list(test_save_restored.food_list.food), list(test_save_sim.food_list.food))
+expect(test_save_restored.player.count, 3)
+
+# Food ids and the opponent's target survive both formats
+expect(test_save_state["food"].ids.tolist(), [1, 2])
+expect(test_save_restored.food_list.food.next_id, test_save_sim.food_list.food.next_id)
+expect(test_save_restored.opponent.target_id, 2)
+test_save_restored = simulation.new_simulation(5)
+test_save_restored.restore(save_state.load_game(test_save_json))
+expect((test_save_restored.food_list.food.ids.tolist(), test_save_restored.food_list.food.next_id), ([1, 2], 3))
+expect(test_save_restored.opponent.target_id, 2)
+
+# A save records the world's bounds, and restoring one brings them back
+test_save_world = simulation.new_simulation(20, (20000, 20000), seed=2)
+save_state.save_game(test_save_bin, test_save_world.player, test_save_world.opponent, test_save_world.food_list,
+                     test_save_world.bounds)
+save_state.save_game_json(test_save_json, test_save_world.player, test_save_world.opponent, test_save_world.food_list,
+                          test_save_world.bounds)
+for test_save_path in (test_save_bin, test_save_json):
+    test_save_restored = simulation.new_simulation(5)
+    test_save_restored.restore(save_state.load_game(test_save_path))
+    test_save_restored.step((test_save_restored.player.x, test_save_restored.player.y))
+    expect((test_save_restored.bounds, test_save_restored.food_list.lod is not None), ((20000, 20000), True))
+    expect(test_save_restored.food_list.food.x.max() > 1280, True)
+save_state.save_game_json(test_save_json, test_save_sim.player, test_save_sim.opponent, test_save_sim.food_list)
+
+# Saves from before ids were kept load with the food numbered from 0
+with open(test_save_json) as f:
+    test_save_old = json.load(f)
+for test_save_food in test_save_old["food"]:
+    del test_save_food["id"]
+del test_save_old["next_id"], test_save_old["opponent"]["target_id"]
+test_save_restored.restore(test_save_old)
+expect((test_save_restored.food_list.food.ids.tolist(), test_save_restored.opponent.target_id), ([0, 1], -1))
+
+# A restored game plays on exactly as the saved one does
+test_save_live = simulation.new_simulation(40, seed=5)
+for _ in range(30):
+    test_save_live.step((640, 360))
+save_state.save_game(test_save_bin, test_save_live.player, test_save_live.opponent, test_save_live.food_list)
+test_save_restored = simulation.new_simulation(0, seed=5)
+test_save_restored.restore(save_state.load_game(test_save_bin))
+test_save_restored.food_list.rng = copy.deepcopy(test_save_live.food_list.rng)  # Saves do not carry the seed.
+for _ in range(30):
+    test_save_live.step((640, 360))
+    test_save_restored.step((640, 360))
+expect((test_save_restored.opponent.x, test_save_restored.opponent.target_id),
+       (test_save_live.opponent.x, test_save_live.opponent.target_id))
+
+# Rivals and their targets round trip too, and a restored swarm plays on as the saved one does
+test_save_swarm = simulation.new_simulation(60, seed=7, rivals=4)
+for _ in range(20):
+    test_save_swarm.step((640, 360))
+test_save_swarm_ids = [r.target_id for r in test_save_swarm.rivals]
+for test_save_path, test_save_write in ((test_save_bin, save_state.save_game), (test_save_json, save_state.save_game_json)):
+    test_save_write(test_save_path, test_save_swarm.player, test_save_swarm.opponent, test_save_swarm.food_list,
+                    rivals=test_save_swarm.rivals)
+    test_save_restored = simulation.new_simulation(0, seed=7, rivals=2)
+    test_save_restored.targeting.targets = np.array([5, 6, 7])
+    test_save_restored.restore(save_state.load_game(test_save_path))
+    expect([(r.x, r.y, r.size, r.count, r.target_id) for r in test_save_restored.rivals],
+           [(r.x, r.y, r.size, r.count, r.target_id) for r in test_save_swarm.rivals])
+    expect(test_save_restored.targeting.targets.tolist(), [test_save_swarm.opponent.target_id] + test_save_swarm_ids)
+test_save_restored.food_list.rng = copy.deepcopy(test_save_swarm.food_list.rng)
+for _ in range(30):
+    test_save_swarm.step((640, 360))
+    test_save_restored.step((640, 360))
+expect([(r.x, r.y, r.count) for r in test_save_restored.rivals], [(r.x, r.y, r.count) for r in test_save_swarm.rivals])
+
+# An empty arena round trips
+test_save_sim.food_list.food = food.FoodStore()
+save_state.save_game(test_save_bin, test_save_sim.player, test_save_sim.opponent, test_save_sim.food_list)
+expect(len(save_state.load_game(test_save_bin)["food"]), 0)
+
+
+#------------------------------------------------------------------------------#
+# Test save_state.Journal
+#------------------------------------------------------------------------------#
+test_journal_path = os.path.join(test_save_dir, "journal.bin")
+test_journal = save_state.Journal(test_journal_path, compact_every=2)
+test_journal_sim = simulation.new_simulation(0)
+test_journal_sim.food_list.populate(5, (500, 500))
+test_journal_rival = opponent.Opponent(x=10, y=10, size=20, speed=60, color="darkgreen")
+test_journal_args = (test_journal_sim.player, test_journal_sim.opponent, test_journal_sim.food_list, [test_journal_rival])
+
+# The first checkpoint is a full snapshot, the next ones only append what changed
+expect(test_journal.checkpoint(*test_journal_args), True)
+test_journal_sim.food_list.food.keep(np.array([True, False, True, True, False]))
+test_journal_sim.player.count = 2
+expect(test_journal.checkpoint(*test_journal_args), False)
+test_journal_sim.food_list.food.keep(np.array([False, True, True]))
+test_journal_sim.opponent.count = 1
+test_journal_rival.count = 4
+expect(test_journal.checkpoint(*test_journal_args), False)
+expect(os.path.getsize(test_journal_path + save_state.JOURNAL_SUFFIX) > 0, True)
+
+# Loading replays the journal over the snapshot
+test_journal_state = save_state.load_game(test_journal_path)
+expect(test_journal_state["food"].ids.tolist(), [2, 3])
+expect((test_journal_state["player"]["count"], test_journal_state["opponent"]["count"]), (2, 1))
+expect(test_journal_state["rivals"][0]["count"], 4)
+
+# After compact_every entries the next checkpoint is a snapshot and the journal restarts
+expect(test_journal.checkpoint(*test_journal_args), True)
+expect(os.path.getsize(test_journal_path + save_state.JOURNAL_SUFFIX), 0)
+expect(save_state.load_game(test_journal_path)["food"].ids.tolist(), [2, 3])
+
+# Lines from another snapshot generation are ignored
+test_journal.generation = -1
+test_journal_sim.food_list.food.keep(np.array([False, True]))
+expect(test_journal.checkpoint(*test_journal_args), False)
+expect(save_state.load_game(test_journal_path)["food"].ids.tolist(), [2, 3])
+
+# Adding food or replacing the store forces a snapshot
+test_journal_sim.food_list.populate(1, (500, 500))
+expect(test_journal.checkpoint(*test_journal_args), True)
+test_journal_sim.food_list.food = save_state.load_game(test_journal_path)["food"]
+expect(test_journal.checkpoint(*test_journal_args), True)
+
+# With a writer, snapshots and lines are written on its worker, in the order checkpointed
+test_journal_writer = autosave.Autosave(test_journal_path, pending=3)
+test_journal_queued = save_state.Journal(test_journal_path, writer=test_journal_writer)
+test_journal_gate = threading.Event()
+test_journal_writer.queue(test_journal_gate.wait)
+expect(test_journal_queued.checkpoint(*test_journal_args), True)
+test_journal_sim.food_list.food.keep(np.array([True, False]))
+expect(test_journal_queued.checkpoint(*test_journal_args), False)
+expect(test_journal_queued.ready(), False)
+test_journal_gate.set()
+test_journal_writer.close()
+expect(test_journal_queued.ready(), True)
+expect(save_state.load_game(test_journal_path)["food"].ids.tolist(), test_journal_sim.food_list.food.ids.tolist())
+expect(test_journal_writer.take_error(), None)
+
+
+#------------------------------------------------------------------------------#
+# Test autosave.Autosave
+#------------------------------------------------------------------------------#
+test_autosave = autosave.Autosave(os.path.join(test_save_dir, "auto.bin"), interval=1, slots=2, pending=4)
+expect(test_autosave.slot_path(1), os.path.join(test_save_dir, "auto.auto1.bin"))
+test_autosave_sim = simulation.new_simulation(3, seed=1)
+test_autosave_args = (test_autosave_sim.player, test_autosave_sim.opponent, test_autosave_sim.food_list)
+
+# Saves rotate through the slots once interval seconds have passed
+expect(test_autosave.tick(0.5, *test_autosave_args), False)
+expect(test_autosave.tick(0.5, *test_autosave_args), True)
+expect(test_autosave.tick(1, *test_autosave_args), True)
+expect(test_autosave.tick(1, *test_autosave_args), True)
+expect(test_autosave.slot, 1)
+test_autosave.flush()
+expect(sorted(test_autosave.slot_paths()), [test_autosave.slot_path(0), test_autosave.slot_path(1)])
+expect(list(save_state.load_game(test_autosave.slot_path(0))["food"]), list(test_autosave_sim.food_list.food))
+
+# due only keeps time, for callers such as journal mode that write their own autosave
+test_autosave_timer = autosave.Autosave(os.path.join(test_save_dir, "timer.bin"), interval=1)
+expect((test_autosave_timer.due(0.5), test_autosave_timer.due(0.5), test_autosave_timer.due(0.5)), (False, True, False))
+expect(test_autosave_timer.slot_paths(), [])
+
+# The snapshot is taken at save time, not when the worker gets to it
+test_autosave_path = os.path.join(test_save_dir, "manual.bin")
+expect(test_autosave.save(test_autosave_path, *test_autosave_args), True)
+test_autosave_sim.player.count = 9
+test_autosave.close()
+expect(save_state.load_game(test_autosave_path)["player"]["count"], 0)
+expect(os.path.exists(test_autosave_path + ".tmp"), False)
+expect(test_autosave.error, None)
+
+# Saves carry the world's bounds once they are set
+test_autosave.bounds = (3000, 2000)
+expect(test_autosave.save(test_autosave_path, *test_autosave_args), True)
+test_autosave.flush()
+expect(save_state.load_game(test_autosave_path)["bounds"], [3000, 2000])
+
+# L loads whichever save or autosave was written last
+os.utime(test_autosave.slot_path(0), (1, 1))
+os.utime(test_autosave.slot_path(1), (2, 2))
+os.utime(test_autosave_path, (3, 3))
+expect(test_autosave.newest(test_autosave_path), test_autosave_path)
+os.utime(test_autosave_path, (0, 0))
+expect(test_autosave.newest(test_autosave_path), test_autosave.slot_path(1))
+expect(autosave.Autosave(os.path.join(test_save_dir, "none.bin")).newest(), None)
+
+# A failed write is kept until it is taken, once
+test_autosave_failing = autosave.Autosave(os.path.join(test_save_dir, "missing", "auto.bin"))
+expect(test_autosave_failing.save(test_autosave_failing.path, *test_autosave_args), True)
+test_autosave_failing.close()
+expect(isinstance(test_autosave_failing.take_error(), OSError), True)
+expect(test_autosave_failing.take_error(), None)
+
+# Any failing job is reported, and the worker carries on with the next one
+def test_autosave_broken_job():
+    raise ValueError("broken")
+test_autosave_after = []
+test_autosave_failing.queue(test_autosave_broken_job, wait=True)
+test_autosave_failing.queue(lambda: test_autosave_after.append(True), wait=True)
+test_autosave_failing.flush()
+expect(test_autosave_after, [True])
+expect(isinstance(test_autosave_failing.take_error(), ValueError), True)
+test_autosave_failing.close()
+
+
+#------------------------------------------------------------------------------#
+# Test replay.Recording and replay.Replay
+#------------------------------------------------------------------------------#
+test_recording = replay.Recording(seed=3, food=20)
+test_recording_sim = test_recording.start()
+test_recording.key(pygame.K_p)
+while test_recording_sim.winner is None:
+    test_recording.step(test_recording_sim, simulation.chase_nearest_food(test_recording_sim))
+expect(len(test_recording.mouse), test_recording_sim.steps)
+expect(test_recording.keys, [(0, pygame.K_p)])
+
+# A saved recording loads back unchanged
+test_recording_path = os.path.join(test_save_dir, "session.npz")
+test_recording.save(test_recording_path)
+expect(replay.load_recording(test_recording_path), test_recording)
+
+# Replaying re-simulates the same match exactly
+test_replay = replay.Replay(replay.load_recording(test_recording_path), keyframe_every=50)
+test_replay_end = test_replay.run()
+expect((test_replay_end.winner, test_replay_end.player.count, test_replay_end.steps),
+       (test_recording_sim.winner, test_recording_sim.player.count, test_recording_sim.steps))
+expect((test_replay_end.player.x, test_replay_end.opponent.x), (test_recording_sim.player.x, test_recording_sim.opponent.x))
+expect(sorted(test_replay.keyframes)[:3], [0, 50, 100])
+
+# Seeking backwards resumes from a keyframe and matches a straight run to that step
+test_replay_direct = replay.Replay(test_recording).run(120)
+test_replay_seek = test_replay.seek(120)
+expect(test_replay_seek.steps, 120)
+expect((test_replay_seek.player.x, test_replay_seek.opponent.y, list(test_replay_seek.food_list.food)),
+       (test_replay_direct.player.x, test_replay_direct.opponent.y, list(test_replay_direct.food_list.food)))
+expect(test_replay.keyframes[50].steps, 50)
+
+
+#------------------------------------------------------------------------------#
+# Test profiler.FrameProfiler
+#------------------------------------------------------------------------------#
+test_profiler = profiler.FrameProfiler(capacity=3)
+expect(test_profiler.recent().shape, (0, len(profiler.PHASES)))
+expect(test_profiler.percentiles()["draw"].tolist(), [0, 0, 0])
+
+# Laps add up within a frame and skipped time is not charged
+test_profiler.begin_frame(10)
+test_profiler.last -= 2_000_000
+test_profiler.lap("eat")
+test_profiler.last -= 1_000_000
+test_profiler.lap("eat")
+test_profiler.last -= 5_000_000
+test_profiler.skip()
+test_profiler.lap("draw")
+test_profiler_eat, test_profiler_draw = test_profiler.recent()[0, 2], test_profiler.recent()[0, 4]
+expect(3_000_000 <= test_profiler_eat < 4_000_000, True)
+expect(test_profiler_draw < 1_000_000, True)
+
+# Only the last capacity frames are held, oldest first
+for test_profiler_food in [20, 30, 40]:
+    test_profiler.begin_frame(test_profiler_food)
+expect(test_profiler.recent().shape, (3, len(profiler.PHASES)))
+expect(test_profiler.summary()[0], "Food: 40  Frames: 3")
+expect(len(test_profiler.summary()), 1 + len(profiler.PHASES))
+
+test_profiler_csv = os.path.join(test_save_dir, "profile.csv")
+test_profiler.write_csv(test_profiler_csv)
+with open(test_profiler_csv) as f:
+    test_profiler_rows = f.read().splitlines()
+expect(test_profiler_rows[0], "frame,food,events_ms,opponent_ms,eat_ms,move_ms,draw_ms")
+expect([row.split(",")[:2] for row in test_profiler_rows[1:]], [["1", "20"], ["2", "30"], ["3", "40"]])
+
+# A simulation charges its step phases to its profiler
+test_profiler_sim = simulation.new_simulation(10, seed=1)
+test_profiler_sim.profiler = profiler.FrameProfiler()
+test_profiler_sim.profiler.begin_frame(10)
+test_profiler_sim.step((0, 0))
+expect(all(test_profiler_sim.profiler.recent()[0, 1:4] > 0), True)
+
+
+#------------------------------------------------------------------------------#
+# Test benchmark.game_steps, benchmark_game_loop, compare_game_loop and benchmark_movers
+#------------------------------------------------------------------------------#
+expect(benchmark.game_steps(100), 300)
+expect(benchmark.game_steps(1000000), 5)
+
+test_bench_result = benchmark.benchmark_game_loop(100, 10)
+expect((test_bench_result["food"], test_bench_result["bounds"], test_bench_result["steps"]), (100, [1280, 720], 10))
+expect(test_bench_result["steps_per_second"] > 0, True)
+expect(test_bench_result["peak_memory_mb"] >= test_bench_result["memory_mb"] > 0, True)
+expect(sorted(test_bench_result["phases"]), ["eat", "move", "opponent"])
+expect(sorted(test_bench_result["phases"]["eat"]), ["mean", "p50", "p95", "p99"])
+
+# Only phases that got more than 10% slower are reported
+test_bench_old = os.path.join(test_save_dir, "bench_old.json")
+test_bench_new = os.path.join(test_save_dir, "bench_new.json")
+test_bench_phases = {phase: {"mean": 1.0} for phase in benchmark.STEP_PHASES}
+with open(test_bench_old, "w") as f:
+    json.dump({"results": [{"food": 100, "phases": test_bench_phases}]}, f)
+test_bench_phases = {phase: {"mean": 1.05} for phase in benchmark.STEP_PHASES}
+test_bench_phases["eat"] = {"mean": 2.0}
+with open(test_bench_new, "w") as f:
+    json.dump({"results": [{"food": 100, "phases": test_bench_phases}]}, f)
+expect(benchmark.compare_game_loop(test_bench_old, test_bench_new), ["100 eat: 1.00 -> 2.00 ms (+100%)"])
+expect(benchmark.compare_game_loop(test_bench_old, test_bench_old), [])
+
+# The batched mover reproduces the scalar path exactly
+test_bench_movers = benchmark.benchmark_movers(200, 5)
+expect((test_bench_movers["agents"], test_bench_movers["identical"]), (200, True))
+
+
+#------------------------------------------------------------------------------#
+# Test batch.match_grid, batch.play_match and batch.run_batch
+#------------------------------------------------------------------------------#
+test_batch_configs = batch.match_grid([1, 2], [10], [100, 150])
+expect(len(test_batch_configs), 4)
+expect(test_batch_configs[0], batch.MatchConfig(seed=1, food=10, opponent_speed=100))
+expect(test_batch_configs[3], batch.MatchConfig(seed=2, food=10, opponent_speed=150))
+
+# The same seed always plays out the same way
+test_batch_result = batch.play_match(test_batch_configs[0])
+expect(batch.play_match(test_batch_configs[0]), test_batch_result)
+expect(list(simulation.new_simulation(10, seed=1).food_list.food) == list(simulation.new_simulation(10, seed=2).food_list.food), False)
+expect(test_batch_result.player_count + test_batch_result.opponent_count, 10)
+expect(test_batch_result.winner in ("Player", "Opponent", "Tie"), True)
+
+expect(batch.run_batch([]), [])
+
+# The pool is started from a fresh interpreter so its workers do not re-run these tests
+test_batch_pool = subprocess.run([sys.executable, "-c",
+                                  "import batch; print([r.winner for r in batch.run_batch(batch.match_grid([1, 2], [10], [100, 150]), 2)])"],
+                                 capture_output=True, text=True, timeout=60)
+expect(test_batch_pool.stdout.strip(), str([batch.play_match(c).winner for c in test_batch_configs]))
+
+
 #------------------------------------------------------------------------------#
 # Summarize the tests
 #------------------------------------------------------------------------------#
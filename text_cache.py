@@ -0,0 +1,51 @@
+"""Caches fonts and rendered text so unchanged labels are not rendered every frame."""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+import pygame
+
+TextKey = Tuple[int, str, str]
+
+@dataclass
+class TextCache:
+    """
+    Pre-rendered text surfaces keyed by font size, string and colour. The least
+    recently used surface is dropped once more than capacity are held. Fonts are
+    built once per size and kept.
+    """
+    capacity: int = 64
+    fonts: Dict[int, pygame.font.Font] = field(default_factory=dict)
+    surfaces: "OrderedDict[TextKey, pygame.Surface]" = field(default_factory=OrderedDict)
+
+    def font(self, size: int) -> pygame.font.Font:
+        """
+        Purpose: Returns the default font at the given size, building it on first use.
+
+        Examples:
+            cache = TextCache()
+            cache.font(36) is cache.font(36) -> True
+        """
+        if size not in self.fonts:
+            self.fonts[size] = pygame.font.Font(None, size)
+        return self.fonts[size]
+
+
+    def render(self, text: str, size: int, color: str) -> pygame.Surface:
+        """
+        Purpose: Returns an antialiased surface of text, rendering it only if the same
+        text, size and colour is not already cached.
+
+        Examples:
+            cache = TextCache()
+            cache.render("Player: 0", 36, "white") is cache.render("Player: 0", 36, "white") -> True
+        """
+        key = (size, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+        surface = self.font(size).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
@@ -0,0 +1,66 @@
+"""Fixed-timestep clock that decouples simulation speed from the frame rate."""
+from dataclasses import dataclass
+
+@dataclass
+class FixedTimestep:
+    """
+    Accumulates real frame time and pays it out as whole simulation steps of a fixed
+    length, so the game runs at the same speed however fast frames are drawn.
+    """
+    step: float = 1 / 60
+    max_steps: int = 8       # Most steps per frame; older time is dropped past this.
+    max_skipped: int = 4     # Most frames in a row that may go undrawn while catching up.
+    accumulator: float = 0
+    skipped: int = 0
+    behind: bool = False
+
+    def advance(self, elapsed: float) -> int:
+        """
+        Purpose: Adds elapsed seconds to the accumulator and returns how many fixed
+        steps to simulate now. When more than max_steps are owed the excess is
+        dropped, so a very slow frame cannot snowball into ever slower frames.
+
+        Examples:
+            clock = FixedTimestep(step=0.01)
+            clock.advance(0.025) -> 2 (0.005 carried over)
+            clock.advance(0.005) -> 1
+            FixedTimestep(step=0.01, max_steps=3).advance(1.0) -> 3
+        """
+        self.accumulator += elapsed
+        # The small epsilon stops float error from leaving a step just short.
+        steps = int((self.accumulator + 1e-9) // self.step)
+        self.behind = steps > self.max_steps
+        if self.behind:
+            steps = self.max_steps
+            self.accumulator = 0
+        else:
+            self.accumulator = max(0, self.accumulator - steps * self.step)
+        return steps
+
+
+    def should_render(self) -> bool:
+        """
+        Purpose: Decides whether to draw this frame. While behind, up to max_skipped
+        frames in a row are left undrawn so their time goes to simulation instead.
+
+        Examples:
+            clock = FixedTimestep(step=0.01, max_steps=2)
+            clock.advance(0.01); clock.should_render() -> True
+            clock.advance(1.0); clock.should_render() -> False
+        """
+        if self.behind and self.skipped < self.max_skipped:
+            self.skipped += 1
+            return False
+        self.skipped = 0
+        return True
+
+
+    def reset(self) -> None:
+        """
+        Purpose: Forgets any owed time, e.g. while paused, so none is replayed later.
+
+        Examples:
+            clock.advance(0.005); clock.reset(); clock.accumulator -> 0
+        """
+        self.accumulator = 0
+        self.behind = False